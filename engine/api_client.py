@@ -1,58 +1,148 @@
 import requests
+import random
+import threading
 import time
 import logging
-from config import ALPHA_VANTAGE_API_KEY, API_CALL_DELAY, MAX_RETRIES
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from config import (
+    ALPHA_VANTAGE_API_KEY, API_CALL_DELAY, API_BURST, API_MAX_WORKERS,
+    API_BACKOFF_BASE, API_BACKOFF_MAX, API_RATE_LIMIT_COOLDOWN, MAX_RETRIES,
+    API_BULK_QUOTES, API_BULK_BATCH_SIZE, API_CACHE_TTL, API_CACHE_COMPACT_REFRESH_DAYS,
+)
+from response_cache import ResponseCache
+from metrics import registry
 
 logger = logging.getLogger(__name__)
 
+class APIError(ValueError):
+    """Provider rejected the request (not worth retrying)"""
+
+class RateLimitError(Exception):
+    """Provider answered with a rate-limit Note"""
+
+class TokenBucket:
+    """Thread-safe token bucket shared by every request of a client.
+    
+    Tokens refill at rate per second up to capacity; acquire() blocks
+    until one is available. pause() empties the bucket and holds every
+    caller for a cooldown, so one rate-limit response throttles all
+    in-flight workers rather than just the one that saw it.
+    """
+    
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now >= self.paused_until:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                else:
+                    wait = self.paused_until - now
+            time.sleep(wait)
+    
+    def pause(self, seconds):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+            self.updated = self.paused_until
+
+def _backoff(retries):
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(API_BACKOFF_MAX, API_BACKOFF_BASE * 2 ** retries))
+
 class AlphaVantageClient:
     BASE_URL = "https://www.alphavantage.co/query"
     
     def __init__(self, api_key=None):
         self.api_key = api_key or ALPHA_VANTAGE_API_KEY
-        self.session = requests.Session()
-        self.last_call = 0
+        self.limiter = TokenBucket(1 / API_CALL_DELAY, API_BURST)
+        self._local = threading.local()
+        self.cache = ResponseCache()
+        self.bulk_supported = API_BULK_QUOTES
+    
+    @property
+    def session(self):
+        """One requests.Session per thread"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            self._local.session = session
+        return session
     
     def _rate_limit(self):
-        """Respect Alpha Vantage rate limit (5 calls/min for free tier)"""
-        elapsed = time.time() - self.last_call
-        if elapsed < API_CALL_DELAY:
-            time.sleep(API_CALL_DELAY - elapsed)
-        self.last_call = time.time()
-    
-    def _retry_request(self, params, retries=0):
-        """Retry with exponential backoff"""
-        try:
-            self._rate_limit()
-            response = self.session.get(self.BASE_URL, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            # Check for API errors
-            if 'Error Message' in data:
-                raise ValueError(f"API Error: {data['Error Message']}")
-            if 'Note' in data:
-                logger.warning(f"API Rate limit: {data['Note']}")
-                if retries < MAX_RETRIES:
-                    time.sleep(60)  # Wait 60 seconds
-                    return self._retry_request(params, retries + 1)
-            
-            return data
-        except Exception as e:
-            logger.error(f"API request failed: {e}")
-            if retries < MAX_RETRIES:
-                time.sleep(5 * (retries + 1))
-                return self._retry_request(params, retries + 1)
-            raise
-    
-    def get_quote(self, symbol):
+        """Respect Alpha Vantage rate limit across all threads"""
+        self.limiter.acquire()
+    
+    def _retry_request(self, params):
+        """Retry with jittered exponential backoff"""
+        retries = 0
+        function = params.get('function')
+        while True:
+            status = 'error'
+            try:
+                self._rate_limit()
+                start = time.perf_counter()
+                try:
+                    response = self.session.get(self.BASE_URL, params=params, timeout=10)
+                finally:
+                    registry.observe('trading_api_request_duration_seconds', time.perf_counter() - start, function=function)
+                response.raise_for_status()
+                data = response.json()
+                
+                # Check for API errors
+                if 'Error Message' in data:
+                    raise APIError(f"API Error: {data['Error Message']}")
+                if 'Note' in data:
+                    status = 'rate_limited'
+                    logger.warning(f"API Rate limit: {data['Note']}")
+                    # Hold the whole client, not just this request
+                    self.limiter.pause(API_RATE_LIMIT_COOLDOWN)
+                    raise RateLimitError(data['Note'])
+                
+                status = 'ok'
+                return data
+            except APIError:
+                raise
+            except Exception as e:
+                if retries >= MAX_RETRIES:
+                    if isinstance(e, RateLimitError):
+                        # Out of retries: hand back the Note like before
+                        return {'Note': str(e)}
+                    logger.error(f"API request failed: {e}")
+                    raise
+                if not isinstance(e, RateLimitError):
+                    logger.warning(f"API request failed (retry {retries + 1}/{MAX_RETRIES}): {e}")
+                    time.sleep(_backoff(retries))
+                retries += 1
+            finally:
+                registry.inc('trading_api_requests_total', function=function, status=status)
+    
+    def get_quote(self, symbol, use_cache=True):
         """Get latest quote for a symbol"""
-        params = {
-            'function': 'GLOBAL_QUOTE',
-            'symbol': symbol,
-            'apikey': self.api_key
-        }
-        data = self._retry_request(params)
+        data = None
+        if use_cache:
+            data = self.cache.get_fresh('GLOBAL_QUOTE', symbol, ttl=API_CACHE_TTL['GLOBAL_QUOTE'])
+        if data is None:
+            params = {
+                'function': 'GLOBAL_QUOTE',
+                'symbol': symbol,
+                'apikey': self.api_key
+            }
+            data = self._retry_request(params)
+            if data.get('Global Quote'):
+                self.cache.put('GLOBAL_QUOTE', symbol, data)
         
         if 'Global Quote' not in data:
             logger.warning(f"No quote data for {symbol}")
@@ -68,25 +158,144 @@ class AlphaVantageClient:
             'volume': int(quote.get('06. volume', 0)),
         }
     
-    def get_daily(self, symbol, outputsize='full'):
-        """Get daily prices for a symbol (last 20 or 5000 days)"""
+    @staticmethod
+    def _parse_bulk_quote(item):
+        return {
+            'symbol': item['symbol'],
+            'close': float(item.get('close') or 0),
+            'open': float(item.get('open') or 0),
+            'high': float(item.get('high') or 0),
+            'low': float(item.get('low') or 0),
+            'volume': int(float(item.get('volume') or 0)),
+        }
+    
+    def _get_bulk_quotes(self, symbols):
+        """Fetch up to API_BULK_BATCH_SIZE quotes per call, yielding (symbol, quote).
+        
+        Stops quietly if a call returns no quotes; the caller fetches
+        whatever was not yielded one by one. Only the provider saying the
+        endpoint is not available to the key (an 'Information' or premium
+        message) turns bulk quotes off for good: a rate-limit Note that
+        outlasted the retries affects this call only.
+        """
+        for start in range(0, len(symbols), API_BULK_BATCH_SIZE):
+            chunk = symbols[start:start + API_BULK_BATCH_SIZE]
+            params = {
+                'function': 'REALTIME_BULK_QUOTES',
+                'symbol': ','.join(chunk),
+                'apikey': self.api_key
+            }
+            data = self._retry_request(params)
+            items = data.get('data')
+            if not isinstance(items, list) or not items:
+                message = data.get('Information') or data.get('message') or data.get('Note') or data
+                if 'Information' in data or 'premium' in str(data.get('message', '')).lower():
+                    logger.info(f"Bulk quotes unavailable, falling back to single quotes: {message}")
+                    self.bulk_supported = False
+                else:
+                    logger.warning(f"Bulk quotes failed, single quotes for this run: {message}")
+                return
+            
+            wanted = set(chunk)
+            for item in items:
+                if item.get('symbol') in wanted:
+                    self.cache.put('REALTIME_BULK_QUOTES', item['symbol'], item)
+                    yield item['symbol'], self._parse_bulk_quote(item)
+    
+    def get_batch_quotes(self, symbols, max_workers=None):
+        """Fetch quotes for many symbols with as few calls as possible.
+        
+        Fresh cached quotes are served first, the rest are requested
+        API_BULK_BATCH_SIZE at a time through the bulk endpoint where the
+        key allows it, and anything left over falls back to concurrent
+        single-symbol calls. Yields (symbol, quote, error) like get_quotes.
+        """
+        remaining = []
+        for symbol in symbols:
+            item = self.cache.get_fresh('REALTIME_BULK_QUOTES', symbol, ttl=API_CACHE_TTL['REALTIME_BULK_QUOTES'])
+            if item is not None:
+                yield symbol, self._parse_bulk_quote(item), None
+            else:
+                remaining.append(symbol)
+        
+        if remaining and self.bulk_supported:
+            fetched = set()
+            try:
+                for symbol, quote in self._get_bulk_quotes(remaining):
+                    fetched.add(symbol)
+                    yield symbol, quote, None
+            except Exception as e:
+                logger.warning(f"Bulk quote request failed, falling back to single quotes: {e}")
+            remaining = [s for s in remaining if s not in fetched]
+        
+        if remaining:
+            yield from self.get_quotes(remaining, max_workers)
+    
+    def get_quotes(self, symbols, max_workers=None):
+        """Fetch quotes concurrently, yielding (symbol, quote, error) as each completes.
+        
+        Requests share the client's token bucket, so total throughput is
+        bounded by the provider quota rather than by per-request latency.
+        error is None on success; quote is None on failure.
+        """
+        with ThreadPoolExecutor(max_workers=max_workers or API_MAX_WORKERS) as pool:
+            futures = {pool.submit(self.get_quote, symbol): symbol for symbol in symbols}
+            for future in as_completed(futures):
+                symbol = futures[future]
+                try:
+                    yield symbol, future.result(), None
+                except Exception as e:
+                    yield symbol, None, e
+    
+    def _fetch_daily_series(self, symbol, outputsize):
         params = {
             'function': 'TIME_SERIES_DAILY',
             'symbol': symbol,
             'outputsize': outputsize,
             'apikey': self.api_key
         }
-        data = self._retry_request(params)
+        return self._retry_request(params)
+    
+    def _get_daily_data(self, symbol, outputsize, use_cache):
+        """Raw TIME_SERIES_DAILY response, served from and kept in the cache.
+        
+        A stale full history that is recent enough is topped up with a
+        compact (last 100 days) request and merged, instead of downloading
+        up to 5,000 days again.
+        """
+        cached, age = (None, None)
+        if use_cache:
+            cached, age = self.cache.get('TIME_SERIES_DAILY', symbol, outputsize)
+            if cached is not None and age <= API_CACHE_TTL['TIME_SERIES_DAILY']:
+                return cached
+        
+        if (cached is not None and outputsize == 'full'
+                and age <= API_CACHE_COMPACT_REFRESH_DAYS * 86400
+                and 'Time Series (Daily)' in cached):
+            recent = self._fetch_daily_series(symbol, 'compact')
+            if 'Time Series (Daily)' in recent:
+                cached['Time Series (Daily)'].update(recent['Time Series (Daily)'])
+                self.cache.put('TIME_SERIES_DAILY', symbol, cached, outputsize)
+                logger.info(f"Refreshed cached daily history for {symbol} with a compact request")
+                return cached
+        
+        data = self._fetch_daily_series(symbol, outputsize)
+        if 'Time Series (Daily)' in data:
+            self.cache.put('TIME_SERIES_DAILY', symbol, data, outputsize)
+        return data
+    
+    def iter_daily(self, symbol, outputsize='full', use_cache=True):
+        """Yield daily bars for a symbol oldest first, one at a time"""
+        data = self._get_daily_data(symbol, outputsize, use_cache)
         
         if 'Time Series (Daily)' not in data:
             logger.warning(f"No daily data for {symbol}")
-            return []
+            return
         
         ts = data['Time Series (Daily)']
-        prices = []
         for date_str in sorted(ts.keys()):
             day = ts[date_str]
-            prices.append({
+            yield {
                 'symbol': symbol,
                 'date': date_str,
                 'close': float(day['4. close']),
@@ -94,8 +303,11 @@ class AlphaVantageClient:
                 'high': float(day['2. high']),
                 'low': float(day['3. low']),
                 'volume': int(day['5. volume']),
-            })
-        return prices
+            }
+    
+    def get_daily(self, symbol, outputsize='full', use_cache=True):
+        """Get daily prices for a symbol (last 100 or 5000 days)"""
+        return list(self.iter_daily(symbol, outputsize, use_cache))
 
 # Global client instance
 client = AlphaVantageClient()
@@ -0,0 +1,134 @@
+import logging
+from datetime import datetime, timezone
+from itertools import islice
+from uuid import uuid4
+from api_client import client
+from database import db
+from bar_store import bar_store
+from indicator_state import indicator_store
+from config import SYMBOLS, BACKFILL_CHUNK_SIZE, BAR_STORE_WRITE
+
+logger = logging.getLogger(__name__)
+
+UPSERT_QUERY = """
+INSERT INTO market_prices (symbol, timestamp, close, open, high, low, volume, ingestion_run_id)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(symbol, timestamp) DO UPDATE SET
+    close = excluded.close,
+    open = excluded.open,
+    high = excluded.high,
+    low = excluded.low,
+    volume = excluded.volume,
+    ingestion_run_id = excluded.ingestion_run_id
+"""
+
+CHECKPOINT_QUERY = """
+INSERT INTO backfill_checkpoints (symbol, status, last_date, rows_written, error_message, updated_at)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT(symbol) DO UPDATE SET
+    status = excluded.status,
+    last_date = COALESCE(excluded.last_date, backfill_checkpoints.last_date),
+    rows_written = backfill_checkpoints.rows_written + excluded.rows_written,
+    error_message = excluded.error_message,
+    updated_at = excluded.updated_at
+"""
+
+def date_to_timestamp(date_str):
+    """Unix ms at 00:00 UTC of a YYYY-MM-DD date"""
+    day = datetime.strptime(date_str, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+    return int(day.timestamp() * 1000)
+
+def load_checkpoints():
+    """Backfill progress as {symbol: checkpoint row}"""
+    rows = db.execute("SELECT * FROM backfill_checkpoints")
+    return {row['symbol']: row for row in rows}
+
+def backfill_symbol(symbol, run_id, last_date=None, outputsize='full'):
+    """Stream one symbol's daily history into market_prices.
+    
+    Bars are upserted BACKFILL_CHUNK_SIZE at a time; each chunk commits
+    together with its checkpoint, so an interrupted run resumes after the
+    last committed date. Returns the number of bars written.
+    """
+    bars = (
+        bar for bar in client.iter_daily(symbol, outputsize)
+        if last_date is None or bar['date'] > last_date
+    )
+    
+    written = 0
+    while True:
+        chunk = list(islice(bars, BACKFILL_CHUNK_SIZE))
+        if not chunk:
+            break
+        rows = [
+            (
+                symbol,
+                date_to_timestamp(bar['date']),
+                bar['close'],
+                bar['open'],
+                bar['high'],
+                bar['low'],
+                bar['volume'],
+                run_id,
+            )
+            for bar in chunk
+        ]
+        with db.transaction():
+            db.execute_many(UPSERT_QUERY, rows)
+            db.execute(CHECKPOINT_QUERY, (
+                symbol, 'in_progress', chunk[-1]['date'], len(rows), None, datetime.utcnow(),
+            ))
+            # Before the commit: a failed append must not advance the checkpoint
+            # (rewriting bars the store already has is harmless)
+            if BAR_STORE_WRITE:
+                bar_store.write_rows(rows)
+        written += len(rows)
+    
+    return written
+
+def backfill_history(symbols=None, outputsize='full', resume=True):
+    """Populate market_prices with daily history for many symbols.
+    
+    Symbols already marked done are skipped when resume is set; partly
+    backfilled symbols continue after their checkpointed date.
+    """
+    symbols = list(symbols or SYMBOLS)
+    run_id = f"BACKFILL-{datetime.utcnow().isoformat()}-{uuid4().hex[:8]}"
+    checkpoints = load_checkpoints() if resume else {}
+    
+    logger.info(f"Starting historical backfill: {run_id} ({len(symbols)} symbols)")
+    
+    completed = []
+    skipped = 0
+    errors = []
+    total = 0
+    
+    for i, symbol in enumerate(symbols, 1):
+        checkpoint = checkpoints.get(symbol)
+        if checkpoint and checkpoint['status'] == 'done':
+            skipped += 1
+            continue
+        
+        last_date = checkpoint['last_date'] if checkpoint else None
+        try:
+            written = backfill_symbol(symbol, run_id, last_date, outputsize)
+            db.execute(CHECKPOINT_QUERY, (symbol, 'done', None, 0, None, datetime.utcnow()))
+            completed.append(symbol)
+            total += written
+            logger.info(f"[{i}/{len(symbols)}] {symbol}: {written} bars")
+        except Exception as e:
+            error_msg = f"{symbol}: {str(e)}"
+            logger.error(error_msg)
+            errors.append(error_msg)
+            db.execute(CHECKPOINT_QUERY, (symbol, 'failed', None, 0, str(e), datetime.utcnow()))
+    
+    # Older bars were inserted behind the streaming state; reseed it
+    if completed:
+        indicator_store.reset(completed)
+    
+    logger.info(f"Backfill complete: {total} bars for {len(completed)} symbols, {skipped} skipped, {len(errors)} failed")
+    return {'run_id': run_id, 'records': total, 'symbols': len(completed), 'skipped': skipped, 'errors': errors}
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    backfill_history()
@@ -0,0 +1,227 @@
+import logging
+import math
+import numpy as np
+from datetime import datetime, timezone
+from indicators import rolling_indicators
+from price_loader import load_price_matrix
+from strategies import MeanReversionStrategy, MomentumStrategy, StatisticalArbitrageStrategy, merge_signals
+from executor import plan_trades, apply_fill
+from netting import SignalNetter
+from pairs import rolling_pair_stats, pair_name
+from ranking import momentum_scores
+from config import TRADING_CAPITAL, RISK_PER_TRADE, PAIRS, PAIR_WINDOW, MOMENTUM_LOOKBACKS
+
+logger = logging.getLogger(__name__)
+
+BARS_PER_YEAR = 252  # daily bars
+
+# Strategy parameters a backtest can override (see sweep.py)
+DEFAULT_PARAMS = {
+    'rsi_oversold': MeanReversionStrategy.RSI_OVERSOLD,
+    'rsi_overbought': MeanReversionStrategy.RSI_OVERBOUGHT,
+    'bb_period': MeanReversionStrategy.BB_PERIOD,
+    'bb_num_std': MeanReversionStrategy.BB_NUM_STD,
+    'momentum_top': MomentumStrategy.TOP_FRACTION,
+    'momentum_bottom': MomentumStrategy.BOTTOM_FRACTION,
+    'z_entry': StatisticalArbitrageStrategy.Z_ENTRY,
+}
+
+class Backtester:
+    """Event-driven replay of stored bars through the live trading logic.
+
+    Each bar runs the same strategy classes, merge_signals sizing, signal
+    netting and executor.plan_trades / apply_fill fill logic as the live
+    pipeline, but entirely in memory: prices are loaded once, indicators
+    for every bar are precomputed in one vectorized pass, and no SQL is
+    issued while replaying.
+
+    Unlike the live pipeline it does not run the portfolio optimizer or
+    the pre-trade risk limits (risk.py): signals keep their merge_signals
+    sizes and every planned order fills, so results show the strategies
+    unconstrained.
+    """
+
+    def __init__(self, symbols, timestamps, closes, capital=TRADING_CAPITAL, rebalance_every=1,
+                 params=None, indicators=None):
+        """params overrides DEFAULT_PARAMS; indicators may pass in a
+        precomputed rolling_indicators result for the same bb settings."""
+        unknown = set(params or {}) - set(DEFAULT_PARAMS)
+        if unknown:
+            raise ValueError(f"Unknown backtest parameters: {sorted(unknown)}")
+        self.params = {**DEFAULT_PARAMS, **(params or {})}
+        self.indicators = indicators
+        self.symbols = [str(s) for s in symbols]
+        self.timestamps = np.asarray(timestamps, dtype=np.int64)
+        self.closes = np.asarray(closes, dtype=np.float64)
+        self.capital = capital
+        self.rebalance_every = max(1, rebalance_every)
+        self.index = {symbol: i for i, symbol in enumerate(self.symbols)}
+
+    @classmethod
+    def from_database(cls, symbols=None, start=None, end=None, **kwargs):
+        """Load the price matrix with a single query and build a backtester"""
+        names, timestamps, closes = load_price_matrix(symbols, start, end)
+        logger.info(f"Loaded {closes.size} bar slots for {len(names)} symbols x {len(timestamps)} bars")
+        return cls(names, timestamps, closes, **kwargs)
+
+    def _pair_stats(self):
+        """Rolling spread statistics of config.PAIRS over the whole history"""
+        pairs = [(y, x) for y, x in PAIRS if y in self.index and x in self.index]
+        rows_y = [self.index[y] for y, _ in pairs]
+        rows_x = [self.index[x] for _, x in pairs]
+        stats = rolling_pair_stats(self.closes[rows_y], self.closes[rows_x], PAIR_WINDOW)
+        return [pair_name(y, x) for y, x in pairs], stats
+
+    def _bar_signals(self, t, ind, momentum, pairs):
+        """Run all three strategies on the indicators at bar t"""
+        current = ind['current_price'][:, t]
+        rsi = ind['rsi'][:, t]
+        upper = ind['bb_upper'][:, t]
+        lower = ind['bb_lower'][:, t]
+        volatility = ind['volatility'][:, t]
+
+        params = self.params
+
+        # Only symbols that can trigger are handed to the strategy itself
+        with np.errstate(invalid='ignore'):
+            candidates = np.flatnonzero(
+                ((current < lower) & (rsi < params['rsi_oversold']))
+                | ((current > upper) & (rsi > params['rsi_overbought']))
+            )
+        mean_rev_signals = {}
+        for i in candidates:
+            indicators = {}
+            for name, values in ind.items():
+                value = float(values[i, t])
+                if math.isfinite(value):
+                    indicators[name] = value
+            signal = MeanReversionStrategy.generate_signal(
+                indicators, params['rsi_oversold'], params['rsi_overbought']
+            )
+            if signal and signal['signal'] != 0:
+                mean_rev_signals[self.symbols[i]] = signal
+
+        momentum_signals = MomentumStrategy.rank(
+            self.symbols, momentum[:, t], rsi, volatility, params['momentum_top'], params['momentum_bottom']
+        )
+
+        names, stats = pairs
+        pair_stats = {}
+        for k, name in enumerate(names):
+            z_score = stats['z_score'][k, t]
+            if math.isfinite(z_score):
+                pair_stats[name] = {
+                    'z_score': float(z_score),
+                    'hedge_ratio': float(stats['hedge_ratio'][k, t]),
+                    'spread_std': float(stats['spread_std'][k, t]),
+                }
+        stat_arb_signals = StatisticalArbitrageStrategy.generate_signals(pair_stats, params['z_entry'])
+
+        return merge_signals(mean_rev_signals, momentum_signals, stat_arb_signals)
+
+    def run(self):
+        """Replay every bar and return equity curve, trades and statistics"""
+        n_symbols, n_bars = self.closes.shape
+        ind = self.indicators
+        if ind is None:
+            ind = rolling_indicators(self.closes, self.params['bb_period'], self.params['bb_num_std'])
+        # Momentum over MOMENTUM_LOOKBACKS for every bar in one pass, gated
+        # by the same warm-up as the other indicators
+        momentum = np.where(
+            np.isfinite(ind['current_price']), momentum_scores(self.closes, MOMENTUM_LOOKBACKS), np.nan
+        )
+        pairs = self._pair_stats()
+
+        equity = np.full(n_bars, float(self.capital))
+        positions = {}
+        netter = SignalNetter()
+        trades = []
+        realized = 0.0
+        closed_pnls = []
+
+        for t in range(n_bars):
+            column = self.closes[:, t]
+            timestamp = datetime.fromtimestamp(self.timestamps[t] / 1000, tz=timezone.utc)
+
+            if t % self.rebalance_every == 0:
+                values = column.tolist()
+                prices = {
+                    self.symbols[i]: values[i] for i in np.flatnonzero(np.isfinite(column)).tolist()
+                }
+
+                # Latest signal per (symbol, strategy), exactly as
+                # executor.load_signals sees latest_signals, netted again
+                # only where this bar's signals changed something
+                netted, _ = netter.update({
+                    (sig['symbol'], sig['strategy_type']): sig for sig in self._bar_signals(t, ind, momentum, pairs)
+                })
+                capital_per_trade = equity[t - 1 if t else 0] * RISK_PER_TRADE
+                for trade in plan_trades(netted, positions, prices, capital_per_trade, timestamp):
+                    closed = apply_fill(positions, trade)
+                    pnl = 0.0
+                    if closed is not None:
+                        pnl = (trade['price'] - closed['entry_price']) * closed['quantity']
+                        realized += pnl
+                        closed_pnls.append(pnl)
+                    trade['pnl'] = pnl
+                    trades.append(trade)
+
+            # Mark to market in one step
+            if positions:
+                idx = np.fromiter((self.index[p['symbol']] for p in positions.values()), dtype=np.int64, count=len(positions))
+                qty = np.fromiter((p['quantity'] for p in positions.values()), dtype=np.float64, count=len(positions))
+                entry = np.fromiter((p['entry_price'] for p in positions.values()), dtype=np.float64, count=len(positions))
+                marks = column[idx]
+                unrealized = float(np.nansum((marks - entry) * qty))
+            else:
+                unrealized = 0.0
+            equity[t] = self.capital + realized + unrealized
+
+        stats = compute_stats(equity, self.timestamps, closed_pnls)
+        stats['num_trades'] = len(trades)
+        stats['open_positions'] = len(positions)
+        logger.info(
+            f"Backtest: {n_symbols} symbols x {n_bars} bars | return {stats['total_return']:.2f}% | "
+            f"Sharpe {stats['sharpe_ratio']:.2f} | max DD {stats['max_drawdown']:.2f}% | {len(trades)} trades"
+        )
+        return {'equity': equity, 'timestamps': self.timestamps, 'trades': trades, 'stats': stats}
+
+def compute_stats(equity, timestamps, closed_pnls=(), bars_per_year=BARS_PER_YEAR):
+    """Summary statistics of an equity curve"""
+    stats = {
+        'final_value': float(equity[-1]) if len(equity) else 0.0,
+        'total_return': 0.0,
+        'cagr': 0.0,
+        'sharpe_ratio': 0.0,
+        'max_drawdown': 0.0,
+        'win_rate': 0.0,
+    }
+    if len(equity) < 2:
+        return stats
+
+    stats['total_return'] = (equity[-1] / equity[0] - 1) * 100
+
+    years = (timestamps[-1] - timestamps[0]) / (1000 * 86400 * 365.25)
+    if years > 0 and equity[-1] > 0:
+        stats['cagr'] = ((equity[-1] / equity[0]) ** (1 / years) - 1) * 100
+
+    returns = np.diff(equity) / equity[:-1]
+    std = returns.std()
+    if std > 0:
+        stats['sharpe_ratio'] = float(returns.mean() / std * math.sqrt(bars_per_year))
+
+    peak = np.maximum.accumulate(equity)
+    stats['max_drawdown'] = float(((equity - peak) / peak).min() * 100)
+
+    if len(closed_pnls):
+        stats['win_rate'] = sum(1 for p in closed_pnls if p > 0) / len(closed_pnls) * 100
+
+    return {k: float(v) for k, v in stats.items()}
+
+def run_backtest(symbols=None, start=None, end=None, **kwargs):
+    """Backtest stored history and return the statistics"""
+    return Backtester.from_database(symbols, start, end, **kwargs).run()['stats']
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(run_backtest())
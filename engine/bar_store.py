@@ -0,0 +1,238 @@
+import os
+import shutil
+import logging
+import tempfile
+import numpy as np
+from pathlib import Path
+from database import db
+from config import BAR_STORE_DIR
+
+logger = logging.getLogger(__name__)
+
+# Column files of a symbol partition, in market_prices row order
+COLUMNS = {
+    'timestamp': np.int64,
+    'close': np.float64,
+    'open': np.float64,
+    'high': np.float64,
+    'low': np.float64,
+    'volume': np.int64,
+}
+DATA_COLUMNS = [name for name in COLUMNS if name != 'timestamp']
+
+class BarStore:
+    """Append-only columnar store of bars, one directory per symbol.
+
+    Each column is a flat native-endian array file (timestamp.i8,
+    close.f8, ...) sorted by timestamp, so reads are np.memmap views with
+    no parsing or per-row objects, and time ranges are two binary searches.
+
+    Appends of newer bars only extend the files: data columns first and
+    timestamps last, so a concurrent reader never sees a timestamp without
+    its values. Bars at or before a symbol's last timestamp (backfills,
+    corrections) rewrite that symbol's partition, newest value winning.
+    """
+
+    def __init__(self, root=None):
+        self.root = Path(root or BAR_STORE_DIR)
+
+    def _dir(self, symbol):
+        if not symbol or os.sep in symbol or symbol.startswith('.'):
+            raise ValueError(f"Invalid symbol for bar store: {symbol!r}")
+        return self.root / symbol
+
+    def _path(self, symbol, column):
+        return self._dir(symbol) / f"{column}.{np.dtype(COLUMNS[column]).str[1:]}"
+
+    def symbols(self):
+        if not self.root.exists():
+            return []
+        return sorted(p.name for p in self.root.iterdir() if p.is_dir())
+
+    def _map(self, symbol, column):
+        """Read-only memmap of a whole column (empty array if missing)"""
+        path = self._path(symbol, column)
+        dtype = np.dtype(COLUMNS[column])
+        try:
+            count = path.stat().st_size // dtype.itemsize
+        except FileNotFoundError:
+            count = 0
+        if count == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r', shape=(count,))
+
+    def read(self, symbol, start=None, end=None, columns=('timestamp', 'close')):
+        """Bars of one symbol with start <= timestamp <= end (Unix ms).
+
+        Returns {column: array}; the arrays are zero-copy views of the
+        column files.
+        """
+        timestamps = self._map(symbol, 'timestamp')
+        arrays = {column: self._map(symbol, column) for column in columns}
+        # A writer may be mid-append: only trust rows every column has
+        n = min([len(timestamps)] + [len(a) for a in arrays.values()])
+        lo = 0 if start is None else int(np.searchsorted(timestamps[:n], start, side='left'))
+        hi = n if end is None else int(np.searchsorted(timestamps[:n], end, side='right'))
+        return {column: array[lo:hi] for column, array in arrays.items()}
+
+    def last_timestamp(self, symbol):
+        timestamps = self._map(symbol, 'timestamp')
+        return int(timestamps[-1]) if len(timestamps) else None
+
+    def append(self, symbol, data):
+        """Add bars for one symbol.
+
+        data: {column: sequence} with a 'timestamp' entry; missing data
+        columns are stored as NaN (prices) or 0 (volume). Returns the
+        number of bars written.
+        """
+        timestamps = np.asarray(data['timestamp'], dtype=np.int64)
+        if len(timestamps) == 0:
+            return 0
+        arrays = {'timestamp': timestamps}
+        for column in DATA_COLUMNS:
+            values = data.get(column)
+            if values is None:
+                fill = 0 if column == 'volume' else np.nan
+                arrays[column] = np.full(len(timestamps), fill, dtype=COLUMNS[column])
+            else:
+                arrays[column] = np.asarray(values, dtype=np.float64).astype(COLUMNS[column])
+
+        # Sort and keep the last value of duplicate timestamps
+        order = np.argsort(timestamps, kind='stable')
+        keep = np.append(timestamps[order][1:] != timestamps[order][:-1], True)
+        arrays = {column: array[order][keep] for column, array in arrays.items()}
+
+        self._dir(symbol).mkdir(parents=True, exist_ok=True)
+        last = self.last_timestamp(symbol)
+        if last is None or arrays['timestamp'][0] > last:
+            for column in DATA_COLUMNS + ['timestamp']:
+                with open(self._path(symbol, column), 'ab') as f:
+                    f.write(arrays[column].tobytes())
+        else:
+            self._merge(symbol, arrays)
+        return len(arrays['timestamp'])
+
+    def _merge(self, symbol, arrays):
+        """Rewrite a partition with new bars merged in (new values win)"""
+        old = self.read(symbol, columns=list(COLUMNS))
+        combined = {column: np.concatenate([old[column], arrays[column]]) for column in COLUMNS}
+        timestamps = combined['timestamp']
+        order = np.argsort(timestamps, kind='stable')
+        keep = np.append(timestamps[order][1:] != timestamps[order][:-1], True)
+        self._replace(symbol, {column: array[order][keep] for column, array in combined.items()})
+
+    def _replace(self, symbol, arrays):
+        directory = self._dir(symbol)
+        directory.mkdir(parents=True, exist_ok=True)
+        for column in DATA_COLUMNS + ['timestamp']:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(np.ascontiguousarray(arrays[column], dtype=COLUMNS[column]).tobytes())
+                os.replace(tmp_path, self._path(symbol, column))
+            except Exception:
+                os.unlink(tmp_path)
+                raise
+
+    def write_rows(self, rows):
+        """Append market_prices-shaped rows.
+
+        rows: (symbol, timestamp, close, open, high, low, volume, ...)
+        tuples, as ingestion and backfill insert them. Returns bars written.
+        """
+        by_symbol = {}
+        for row in rows:
+            by_symbol.setdefault(row[0], []).append(row[1:7])
+        written = 0
+        for symbol, bars in by_symbol.items():
+            columns = list(zip(*bars))
+            written += self.append(symbol, {
+                'timestamp': columns[0],
+                'close': [np.nan if v is None else v for v in columns[1]],
+                'open': [np.nan if v is None else v for v in columns[2]],
+                'high': [np.nan if v is None else v for v in columns[3]],
+                'low': [np.nan if v is None else v for v in columns[4]],
+                'volume': [0 if v is None else v for v in columns[5]],
+            })
+        return written
+
+    def drop(self, symbol):
+        shutil.rmtree(self._dir(symbol), ignore_errors=True)
+
+    def export_from_database(self, symbols=None):
+        """Rebuild partitions from market_prices, one symbol at a time"""
+        if symbols is None:
+            symbols = [row[0] for row in db.fetch_rows("SELECT DISTINCT symbol FROM market_prices")]
+        total = 0
+        for symbol in symbols:
+            rows = db.fetch_rows(
+                "SELECT timestamp, close, open, high, low, volume FROM market_prices "
+                "WHERE symbol = ? ORDER BY timestamp",
+                (symbol,)
+            )
+            if not rows:
+                self.drop(symbol)
+                continue
+            columns = list(zip(*rows))
+            self._replace(symbol, {
+                'timestamp': np.asarray(columns[0], dtype=np.int64),
+                'close': np.asarray(columns[1], dtype=np.float64),
+                'open': np.asarray(columns[2], dtype=np.float64),
+                'high': np.asarray(columns[3], dtype=np.float64),
+                'low': np.asarray(columns[4], dtype=np.float64),
+                'volume': np.asarray([v or 0 for v in columns[5]], dtype=np.int64),
+            })
+            total += len(rows)
+        logger.info(f"Bar store rebuilt: {total} bars for {len(symbols)} symbols")
+        return total
+
+    # Universe-wide readers with the same shapes as price_loader
+
+    def load_latest(self, symbols=None):
+        """(symbols, closes) of every symbol's newest bar"""
+        names, closes = [], []
+        for symbol in symbols or self.symbols():
+            close = self.read(symbol, columns=('close',))['close']
+            if len(close) and np.isfinite(close[-1]):
+                names.append(symbol)
+                closes.append(close[-1])
+        order = np.argsort(np.array(names, dtype=object)) if names else []
+        return np.array(names, dtype=object)[order], np.array(closes, dtype=np.float64)[order]
+
+    def load_histories(self, limit, symbols=None):
+        """Last limit bars per symbol, right-aligned (see load_price_histories)"""
+        names = sorted(symbols or self.symbols())
+        timestamps = np.zeros((len(names), limit), dtype=np.int64)
+        closes = np.full((len(names), limit), np.nan, dtype=np.float64)
+        counts = np.zeros(len(names), dtype=np.int64)
+        for i, symbol in enumerate(names):
+            bars = self.read(symbol)
+            n = min(limit, len(bars['timestamp']))
+            if n:
+                timestamps[i, limit - n:] = bars['timestamp'][-n:]
+                closes[i, limit - n:] = bars['close'][-n:]
+            counts[i] = n
+        keep = counts > 0
+        return np.array(names, dtype=object)[keep], timestamps[keep], closes[keep], counts[keep]
+
+    def load_aligned(self, symbols=None, start=None, end=None):
+        """(symbols, timestamps, closes) on the union time axis, NaN where missing"""
+        names = []
+        parts = []
+        for symbol in sorted(symbols or self.symbols()):
+            bars = self.read(symbol, start, end)
+            if len(bars['timestamp']):
+                names.append(symbol)
+                parts.append(bars)
+        if not parts:
+            return np.array([], dtype=object), np.array([], dtype=np.int64), np.empty((0, 0))
+
+        timestamps = np.unique(np.concatenate([bars['timestamp'] for bars in parts]))
+        closes = np.full((len(names), len(timestamps)), np.nan)
+        for i, bars in enumerate(parts):
+            closes[i, np.searchsorted(timestamps, bars['timestamp'])] = bars['close']
+        return np.array(names, dtype=object), timestamps, closes
+
+# Global bar store
+bar_store = BarStore()
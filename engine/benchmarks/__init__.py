@@ -0,0 +1,11 @@
+"""Offline benchmark suite for the trading pipeline.
+
+Run from the engine directory:
+
+    python -m benchmarks                       # 15, 500 and 5,000 symbols
+    python -m benchmarks --sizes 15,500 --compare data/benchmarks/<old>.json
+
+Every run fills a scratch SQLite database with seeded synthetic bars,
+serves quotes from a stubbed AlphaVantageClient and writes its timings
+as JSON to BENCHMARK_DIR.
+"""
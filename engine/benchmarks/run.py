@@ -0,0 +1,216 @@
+import sys
+import json
+import time
+import platform
+import argparse
+import logging
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+import metrics
+import dashboard_cache
+import ingestion
+import signal_generator
+from database import db
+from indicator_state import indicator_store
+from bar_store import bar_store
+from pairs import pair_store
+from optimizer import optimizer
+from executor import execute_trades
+from portfolio import calculate_portfolio_metrics
+from server import app, dashboard_cache as snapshot
+from config import (
+    BENCHMARK_DIR, BENCHMARK_SIZES, BENCHMARK_BARS, BENCHMARK_TICKS, BENCHMARK_WARMUP_TICKS,
+    BENCHMARK_REGRESSION_THRESHOLD,
+)
+from .synthetic import generate_bars, fill_database
+from .stub_client import StubAlphaVantageClient
+
+logger = logging.getLogger(__name__)
+
+STAGES = [
+    ('ingest', ingestion.ingest_market_data),
+    ('signals', signal_generator.generate_signals),
+    ('execute', execute_trades),
+    ('portfolio', calculate_portfolio_metrics),
+]
+
+def _summary(samples):
+    return {
+        'min': min(samples),
+        'median': statistics.median(samples),
+        'max': max(samples),
+        'runs': len(samples),
+    }
+
+def _timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+def _use_scratch(workdir, n_symbols):
+    """Point the database, bar store, change stamp and metrics at workdir"""
+    db.close()
+    db.db_path = str(workdir / f"bench-{n_symbols}.db")
+    dashboard_cache.STAMP_PATH = workdir / "dashboard.stamp"
+    metrics.METRICS_DIR = workdir / "metrics"
+    bar_store.root = workdir / f"bars-{n_symbols}"
+    indicator_store.states.clear()
+    pair_store.states.clear()
+    optimizer.path = workdir / f"covariance-{n_symbols}.npz"
+    optimizer.reset()
+    db.create_tables()
+
+def run_size(n_symbols, workdir, n_bars=BENCHMARK_BARS, ticks=BENCHMARK_TICKS, seed=0,
+             warmup=BENCHMARK_WARMUP_TICKS):
+    """Time every pipeline stage and the dashboard endpoint for one universe size"""
+    _use_scratch(workdir, n_symbols)
+    bars = generate_bars(n_symbols, n_bars, seed)
+    symbols = bars['symbols']
+    setup_time, rows = _timed(lambda: fill_database(db, bars))
+
+    client = StubAlphaVantageClient(bars, workdir / f"api_cache-{n_symbols}", seed)
+    ingestion.client = client
+    ingestion.SYMBOLS = symbols
+    signal_generator.SYMBOLS = symbols
+
+    samples = {name: [] for name, _ in STAGES}
+    samples['dashboard_cold'] = []
+    samples['dashboard_warm'] = []
+    http = app.test_client()
+
+    for tick in range(warmup + ticks):
+        timings = {}
+        client.expire_quotes()
+        for name, func in STAGES:
+            timings[name], _ = _timed(func)
+
+        snapshot.invalidate()
+        timings['dashboard_cold'], response = _timed(lambda: http.get('/trading-dashboard'))
+        etag = response.headers.get('ETag')
+        timings['dashboard_warm'], _ = _timed(
+            lambda: http.get('/trading-dashboard', headers={'If-None-Match': etag})
+        )
+
+        if tick >= warmup:
+            for name, elapsed in timings.items():
+                samples[name].append(elapsed)
+
+    result = {
+        'symbols': n_symbols,
+        'bars': n_bars,
+        'setup': {'seconds': setup_time, 'rows': rows},
+        'stages': {name: _summary(values) for name, values in samples.items()},
+        'api_requests': client.requests,
+    }
+    db.close()
+    return result
+
+def _git_revision():
+    try:
+        revision = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain'], capture_output=True, text=True).stdout.strip()
+        return revision + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def run_benchmarks(sizes=BENCHMARK_SIZES, n_bars=BENCHMARK_BARS, ticks=BENCHMARK_TICKS, seed=0, workdir=None,
+                   warmup=BENCHMARK_WARMUP_TICKS):
+    """Benchmark each universe size in its own scratch database"""
+    with tempfile.TemporaryDirectory(prefix='trading-bench-') as tmp:
+        workdir = Path(workdir or tmp)
+        workdir.mkdir(parents=True, exist_ok=True)
+        results = {}
+        for n_symbols in sizes:
+            logger.warning(f"Benchmarking {n_symbols} symbols x {n_bars} bars, {ticks} ticks...")
+            results[str(n_symbols)] = run_size(n_symbols, workdir, n_bars, ticks, seed, warmup)
+    return {
+        'revision': _git_revision(),
+        'timestamp': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': seed,
+        'ticks': ticks,
+        'warmup': warmup,
+        'results': results,
+    }
+
+def compare(baseline, current, threshold=BENCHMARK_REGRESSION_THRESHOLD):
+    """Median-to-median comparison; returns (rows, regressions)"""
+    rows = []
+    regressions = []
+    for size, result in current['results'].items():
+        old = baseline['results'].get(size)
+        if old is None:
+            continue
+        for stage, timing in result['stages'].items():
+            if stage not in old['stages']:
+                continue
+            before = old['stages'][stage]['median']
+            after = timing['median']
+            ratio = after / before if before > 0 else 1.0
+            row = (size, stage, before, after, ratio)
+            rows.append(row)
+            if ratio > 1 + threshold:
+                regressions.append(row)
+    return rows, regressions
+
+def _print_results(report):
+    for size, result in report['results'].items():
+        print(f"\n{size} symbols x {result['bars']} bars "
+              f"(setup {result['setup']['seconds']:.2f}s for {result['setup']['rows']} rows)")
+        for stage, timing in result['stages'].items():
+            print(f"  {stage:<16} median {timing['median'] * 1000:9.1f} ms   "
+                  f"min {timing['min'] * 1000:9.1f} ms   max {timing['max'] * 1000:9.1f} ms")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    parser.add_argument('--sizes', default=','.join(map(str, BENCHMARK_SIZES)),
+                        help='comma-separated symbol counts')
+    parser.add_argument('--bars', type=int, default=BENCHMARK_BARS)
+    parser.add_argument('--ticks', type=int, default=BENCHMARK_TICKS)
+    parser.add_argument('--warmup', type=int, default=BENCHMARK_WARMUP_TICKS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='result file (default: BENCHMARK_DIR/<revision>-<time>.json)')
+    parser.add_argument('--compare', help='baseline result file; exit 1 on regressions')
+    parser.add_argument('--threshold', type=float, default=BENCHMARK_REGRESSION_THRESHOLD)
+    parser.add_argument('--workdir', help='keep scratch databases here instead of a temp dir')
+    args = parser.parse_args(argv)
+
+    # Per-symbol info logs would dominate the timings
+    logging.basicConfig(level=logging.WARNING, format='%(message)s')
+
+    sizes = [int(s) for s in args.sizes.split(',') if s]
+    report = run_benchmarks(sizes, args.bars, args.ticks, args.seed, args.workdir, args.warmup)
+    _print_results(report)
+
+    if args.output:
+        output = Path(args.output)
+    else:
+        BENCHMARK_DIR.mkdir(parents=True, exist_ok=True)
+        output = BENCHMARK_DIR / f"{report['revision']}-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.json"
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows, regressions = compare(baseline, report, args.threshold)
+        print(f"\nCompared with {baseline['revision']}:")
+        for size, stage, before, after, ratio in rows:
+            flag = '  <-- regression' if (size, stage, before, after, ratio) in regressions else ''
+            print(f"  {size:>6} {stage:<16} {before * 1000:9.1f} -> {after * 1000:9.1f} ms  x{ratio:.2f}{flag}")
+        if regressions:
+            print(f"✗ {len(regressions)} regressions over {args.threshold:.0%}")
+            return 1
+        print("✓ No regressions")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+import math
+import random
+import shutil
+import threading
+from api_client import AlphaVantageClient, TokenBucket
+from response_cache import ResponseCache
+
+class StubAlphaVantageClient(AlphaVantageClient):
+    """AlphaVantageClient that answers from a seeded random walk.
+
+    Only _retry_request is replaced, so response parsing, the response
+    cache, bulk batching and the thread pool all run as in production.
+    Each quote request moves the symbol one GBM step from its last
+    synthetic close. No network access and no rate limiting.
+    """
+
+    def __init__(self, bars, cache_dir, seed=0, bars_per_year=252):
+        super().__init__(api_key='benchmark')
+        self.limiter = TokenBucket(1e9, 1e9)
+        self.cache = ResponseCache(cache_dir)
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.dt = 1 / bars_per_year
+        self.prices = dict(zip(bars['symbols'], bars['close'][:, -1].tolist()))
+        self.sigma = dict(zip(bars['symbols'], bars['sigma'].tolist()))
+        self.requests = 0
+
+    def _step(self, symbol):
+        with self.lock:
+            sigma = self.sigma.get(symbol, 0.3)
+            shock = self.rng.gauss(0, 1)
+            price = self.prices.get(symbol, 100.0) * math.exp(
+                -0.5 * sigma ** 2 * self.dt + sigma * math.sqrt(self.dt) * shock
+            )
+            self.prices[symbol] = price
+            volume = int(self.rng.lognormvariate(13, 1))
+        return {
+            'open': price, 'high': price * 1.001, 'low': price * 0.999,
+            'close': price, 'volume': volume,
+        }
+
+    def _retry_request(self, params):
+        with self.lock:
+            self.requests += 1
+        function = params['function']
+
+        if function == 'REALTIME_BULK_QUOTES':
+            data = []
+            for symbol in params['symbol'].split(','):
+                bar = self._step(symbol)
+                data.append({'symbol': symbol, **{k: str(v) for k, v in bar.items()}})
+            return {'data': data}
+
+        if function == 'GLOBAL_QUOTE':
+            bar = self._step(params['symbol'])
+            return {'Global Quote': {
+                '01. symbol': params['symbol'],
+                '02. open': str(bar['open']),
+                '03. high': str(bar['high']),
+                '04. low': str(bar['low']),
+                '05. price': str(bar['close']),
+                '06. volume': str(bar['volume']),
+            }}
+
+        return {'Error Message': f"{function} is not simulated"}
+
+    def expire_quotes(self):
+        """Drop cached quotes, as the TTL would between real ticks"""
+        for function in ('GLOBAL_QUOTE', 'REALTIME_BULK_QUOTES'):
+            shutil.rmtree(self.cache.cache_dir / function, ignore_errors=True)
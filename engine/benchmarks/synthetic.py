@@ -0,0 +1,64 @@
+import numpy as np
+from datetime import datetime
+from config import SYMBOLS
+
+def symbol_names(n):
+    """The configured symbols first (so PAIRS resolve), then SYN0001..."""
+    names = list(SYMBOLS[:n])
+    names += [f"SYN{i:04d}" for i in range(1, n - len(names) + 1)]
+    return names
+
+def generate_bars(n_symbols, n_bars, seed=0, interval=300, end=None, mu=0.05, bars_per_year=252):
+    """Seeded OHLCV bars following geometric Brownian motion.
+
+    Each symbol gets its own start price and volatility. Bars are
+    interval seconds apart and end one interval before end (default now),
+    so the next ingestion tick is the newest bar. Returns a dict of
+    (symbols x bars) arrays plus symbols and ms timestamps.
+    """
+    rng = np.random.default_rng(seed)
+    dt = 1 / bars_per_year
+    start_price = rng.uniform(20, 500, n_symbols)
+    sigma = rng.uniform(0.15, 0.6, n_symbols)[:, None]
+
+    shocks = rng.standard_normal((n_symbols, n_bars))
+    log_returns = (mu - 0.5 * sigma ** 2) * dt + sigma * np.sqrt(dt) * shocks
+    close = start_price[:, None] * np.exp(np.cumsum(log_returns, axis=1))
+
+    previous = np.concatenate([start_price[:, None], close[:, :-1]], axis=1)
+    opened = previous * np.exp(0.1 * sigma * np.sqrt(dt) * rng.standard_normal((n_symbols, n_bars)))
+    spread = np.abs(rng.standard_normal((n_symbols, n_bars))) * sigma * np.sqrt(dt) / 2
+    high = np.maximum(opened, close) * (1 + spread)
+    low = np.minimum(opened, close) * (1 - spread)
+    volume = rng.lognormal(13, 1, (n_symbols, n_bars)).astype(np.int64)
+
+    end_ms = int((end or datetime.utcnow()).timestamp() * 1000)
+    timestamps = end_ms - interval * 1000 * np.arange(n_bars, 0, -1, dtype=np.int64)
+
+    return {
+        'symbols': symbol_names(n_symbols),
+        'timestamps': timestamps,
+        'open': opened,
+        'high': high,
+        'low': low,
+        'close': close,
+        'volume': volume,
+        'sigma': sigma[:, 0],
+    }
+
+def fill_database(db, bars, chunk_size=10000):
+    """Bulk-load generated bars into market_prices; returns rows written"""
+    query = """
+    INSERT OR REPLACE INTO market_prices (symbol, timestamp, close, open, high, low, volume, ingestion_run_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, 'synthetic')
+    """
+    timestamps = bars['timestamps'].tolist()
+    columns = [bars[name].tolist() for name in ('close', 'open', 'high', 'low', 'volume')]
+
+    def rows():
+        for i, symbol in enumerate(bars['symbols']):
+            close, opened, high, low, volume = (column[i] for column in columns)
+            for t, timestamp in enumerate(timestamps):
+                yield (symbol, timestamp, close[t], opened[t], high[t], low[t], volume[t])
+
+    return db.execute_many(query, rows(), chunk_size=chunk_size)
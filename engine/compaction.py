@@ -0,0 +1,181 @@
+import csv
+import gzip
+import logging
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+from database import db
+from bar_store import bar_store
+from dashboard_cache import mark_dashboard_dirty
+from metrics import stage
+from config import RAW_RETENTION_DAYS, ARCHIVE_RAW_BARS, ARCHIVE_DIR, BAR_STORE_WRITE
+
+logger = logging.getLogger(__name__)
+
+DAY_MS = 86400 * 1000
+
+# Quote fields are day-to-date values (open, high, low and volume of the
+# session so far), so a day's bar is the first open, the extremes, the
+# last close and the largest volume seen. Compacted days are frozen.
+ROLLUP_QUERY = """
+INSERT INTO market_prices_daily (symbol, day, open, high, low, close, volume, bars, first_timestamp, last_timestamp)
+SELECT symbol, day,
+       MAX(CASE WHEN rn_first = 1 THEN open END),
+       MAX(high),
+       MIN(low),
+       MAX(CASE WHEN rn_last = 1 THEN close END),
+       MAX(volume),
+       COUNT(*),
+       MIN(timestamp),
+       MAX(timestamp)
+FROM (
+    SELECT symbol, timestamp, open, high, low, close, volume,
+           date(timestamp / 1000, 'unixepoch') AS day,
+           ROW_NUMBER() OVER (PARTITION BY symbol, timestamp / 86400000 ORDER BY timestamp) AS rn_first,
+           ROW_NUMBER() OVER (PARTITION BY symbol, timestamp / 86400000 ORDER BY timestamp DESC) AS rn_last
+    FROM market_prices
+    WHERE timestamp >= ?
+)
+WHERE true
+GROUP BY symbol, day
+ON CONFLICT(symbol, day) DO UPDATE SET
+    open = excluded.open,
+    high = excluded.high,
+    low = excluded.low,
+    close = excluded.close,
+    volume = excluded.volume,
+    bars = excluded.bars,
+    first_timestamp = excluded.first_timestamp,
+    last_timestamp = excluded.last_timestamp
+WHERE market_prices_daily.compacted = 0
+"""
+
+# Raw quotes of a day that will be folded into its last bar
+RAW_DAY_QUERY = """
+SELECT m.symbol, m.timestamp, m.close, m.open, m.high, m.low, m.volume, m.ingestion_run_id
+FROM market_prices m
+JOIN market_prices_daily d ON d.symbol = m.symbol AND d.day = ?
+WHERE m.timestamp >= ? AND m.timestamp < ? AND d.compacted = 0 AND d.bars > 1
+ORDER BY m.symbol, m.timestamp
+"""
+
+DELETE_RAW_QUERY = """
+DELETE FROM market_prices
+WHERE timestamp >= ? AND timestamp < ?
+  AND EXISTS (
+      SELECT 1 FROM market_prices_daily d
+      WHERE d.symbol = market_prices.symbol AND d.day = ? AND d.compacted = 0
+        AND market_prices.timestamp < d.last_timestamp
+  )
+"""
+
+DOWNSAMPLE_QUERY = """
+UPDATE market_prices
+SET open = d.open, high = d.high, low = d.low, close = d.close, volume = d.volume, ingestion_run_id = ?
+FROM market_prices_daily d
+WHERE d.symbol = market_prices.symbol AND d.day = ? AND d.compacted = 0 AND d.bars > 1
+  AND market_prices.timestamp = d.last_timestamp
+"""
+
+def _day_start(day):
+    """Unix ms at 00:00 UTC of a YYYY-MM-DD day"""
+    return int(datetime.strptime(day, '%Y-%m-%d').replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+def update_rollups():
+    """Refresh daily rollups from the last rolled day onwards.
+
+    Earlier days are complete (or compacted) and are not rescanned, so a
+    run costs O(new quotes). Returns the number of rollup rows written.
+    """
+    rows = db.execute("SELECT MAX(last_timestamp) AS last FROM market_prices_daily")
+    last = rows[0]['last'] if rows else None
+    since = 0 if last is None else last - last % DAY_MS
+    return db.execute(ROLLUP_QUERY, (since,))
+
+class _Archive:
+    """Gzipped CSV of raw quotes removed by one compaction run, opened lazily"""
+
+    def __init__(self, run_id):
+        self.path = ARCHIVE_DIR / f"market_prices-{run_id}.csv.gz"
+        self.file = None
+        self.writer = None
+
+    def write(self, rows):
+        if not rows:
+            return
+        if self.file is None:
+            ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+            self.file = gzip.open(self.path, 'wt', newline='')
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(['symbol', 'timestamp', 'close', 'open', 'high', 'low', 'volume', 'ingestion_run_id'])
+        self.writer.writerows(rows)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+def compact_day(day, run_id, archive=None):
+    """Fold one day's intraday quotes into a single bar per symbol.
+
+    The day's last quote is kept, rewritten with the day's OHLCV, so
+    history stays continuous for indicators and backtests. Runs as one
+    transaction. Returns (rows removed, symbols touched).
+    """
+    start = _day_start(day)
+    end = start + DAY_MS
+    with db.transaction():
+        raw = db.fetch_rows(RAW_DAY_QUERY, (day, start, end))
+        if archive is not None:
+            archive.write(raw)
+        removed = db.execute(DELETE_RAW_QUERY, (start, end, day))
+        db.execute(DOWNSAMPLE_QUERY, (run_id, day))
+        db.execute("UPDATE market_prices_daily SET compacted = 1 WHERE day = ? AND compacted = 0", (day,))
+    return removed, {row[0] for row in raw}
+
+@stage('compact', items=lambda result: result['removed'])
+def compact_market_prices(retention_days=RAW_RETENTION_DAYS, archive=ARCHIVE_RAW_BARS):
+    """Roll up recent quotes and downsample those older than retention_days"""
+    run_id = f"COMPACT-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}-{uuid4().hex[:8]}"
+    cutoff = (datetime.utcnow() - timedelta(days=retention_days)).strftime('%Y-%m-%d')
+    logger.info(f"Starting compaction: {run_id} (raw quotes kept since {cutoff})")
+
+    rolled = update_rollups()
+    days = [
+        row['day'] for row in db.execute(
+            "SELECT DISTINCT day FROM market_prices_daily WHERE compacted = 0 AND day < ? ORDER BY day",
+            (cutoff,)
+        )
+    ]
+
+    writer = _Archive(run_id) if archive else None
+    removed = 0
+    symbols = set()
+    try:
+        for day in days:
+            day_removed, day_symbols = compact_day(day, run_id, writer)
+            removed += day_removed
+            symbols |= day_symbols
+            if day_removed:
+                logger.info(f"{day}: {day_removed} quotes folded into {len(day_symbols)} daily bars")
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if removed:
+        # Let SQLite refresh planner statistics after a large delete
+        db.execute("PRAGMA optimize")
+        if BAR_STORE_WRITE:
+            bar_store.export_from_database(sorted(symbols))
+        mark_dashboard_dirty()
+
+    logger.info(f"Compaction complete: {rolled} rollups updated, {len(days)} days compacted, {removed} quotes removed")
+    return {
+        'run_id': run_id,
+        'rollups': rolled,
+        'days': len(days),
+        'removed': removed,
+        'archive': str(writer.path) if writer is not None and writer.file is not None else None,
+    }
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    compact_market_prices()
@@ -8,6 +8,21 @@ ALPHA_VANTAGE_API_KEY = "HHTBY253E9Q9RPVV"
 TRADING_CAPITAL = 100000
 RISK_PER_TRADE = 0.01  # 1% per trade
 MAX_POSITIONS = 50
+RESIZE_TOLERANCE = 0.25  # open positions are resized only when off their target by more than this fraction
+
+# Pre-trade risk limits (see risk.py); exposures are fractions of portfolio value
+MAX_GROSS_EXPOSURE = 1.0
+MAX_NET_EXPOSURE = 0.5
+MAX_SYMBOL_EXPOSURE = 0.1  # gross, summed over strategies
+MAX_SECTOR_EXPOSURE = 0.3  # gross, by SECTORS below
+MAX_STRATEGY_EXPOSURE = {  # gross; strategies not listed get MAX_GROSS_EXPOSURE
+    'mean_reversion': 0.4,
+    'momentum': 0.4,
+    'statistical_arbitrage': 0.4,
+}
+MAX_VAR = 0.02  # one-bar parametric VaR of the post-trade book; 0 disables the check
+VAR_CONFIDENCE = 0.99
+VAR_LOOKBACK = 60  # bars of returns behind the covariance estimate
 
 # Symbols to track
 SYMBOLS = ['AAPL', 'MSFT', 'GOOGL', 'AMZN', 'TSLA', 'META', 'NVDA', 'JPM', 'BAC', 'WFC', 'XOM', 'CVX', 'MCD', 'NKE', 'COST']
@@ -21,14 +36,127 @@ PAIRS = [
     ('NVDA', 'META'),
 ]
 
+# Pairs engine (see pairs.py); PAIRS above are always traded
+PAIR_WINDOW = 60  # bars in the rolling hedge-ratio regression
+PAIR_DISCOVERY = True  # also trade the best pairs found by the universe scan
+PAIR_LOOKBACK = 250  # bars of history the discovery scan tests
+PAIR_MIN_CORRELATION = 0.7  # log-return correlation a candidate needs
+PAIR_MAX_CANDIDATES = 5000  # most correlated candidates given the cointegration test
+PAIR_ADF_CRITICAL = -3.34  # Engle-Granger 5% critical value for two series
+PAIR_MAX_HALF_LIFE = 60  # bars; slower-reverting spreads are skipped
+PAIR_MAX_ACTIVE = 20  # discovered pairs traded on top of PAIRS
+
+# Momentum ranking (see ranking.py)
+MOMENTUM_LOOKBACKS = [(90, 0)]  # (lookback, skip) bars; several are z-scored and averaged, (252, 21) is 12-1 month
+MOMENTUM_MODE = 'rank'  # 'rank' (universe fractions), 'sector' (fractions per sector) or 'percentile'
+MOMENTUM_BUCKETS = 5  # percentile mode: long the top bucket, short the bottom one
+# Symbols missing here are their own sector: not ranked in sector mode, own limit in risk.py
+SECTORS = {
+    'AAPL': 'Technology', 'MSFT': 'Technology', 'NVDA': 'Technology',
+    'GOOGL': 'Communication', 'META': 'Communication',
+    'AMZN': 'Consumer Discretionary', 'TSLA': 'Consumer Discretionary',
+    'MCD': 'Consumer Discretionary', 'NKE': 'Consumer Discretionary',
+    'COST': 'Consumer Staples',
+    'JPM': 'Financials', 'BAC': 'Financials', 'WFC': 'Financials',
+    'XOM': 'Energy', 'CVX': 'Energy',
+}
+
+# Realized PnL (see ledger.py)
+LEDGER_METHOD = 'fifo'  # lot matching: 'fifo' or 'average' (average cost)
+
+# Equity curve statistics (see performance.py)
+EQUITY_VOL_WINDOW = 30  # portfolio runs in the rolling volatility
+EQUITY_MIN_CAGR_DAYS = 30  # shorter histories report plain return as CAGR
+
+# Portfolio optimizer (see optimizer.py): sizes merged signals jointly from a shrunk covariance
+OPTIMIZER = 'mean_variance'  # 'mean_variance', 'risk_parity' or 'none' (independent inverse-vol sizes)
+OPTIMIZER_LOOKBACK = 250  # bars of returns in the covariance estimate
+OPTIMIZER_TURNOVER_PENALTY = 0.1  # pull towards the previous targets, relative to the average variance
+OPTIMIZER_MAX_SCALE = 2.0  # cap on how far a signal's size can grow over its independent size
+
+# Signal netting (see netting.py); pair signals are always split into legs
+NET_ACROSS_STRATEGIES = True  # one net target per symbol; False keeps opposing strategy positions
+
 # Paths
 WORKSPACE_DIR = Path(__file__).parent.parent
 LOG_DIR = WORKSPACE_DIR / "logs"
 DATA_DIR = WORKSPACE_DIR / "data"
+COVARIANCE_CACHE_PATH = DATA_DIR / "covariance.npz"  # optimizer state between runs
 
 LOG_DIR.mkdir(exist_ok=True)
 DATA_DIR.mkdir(exist_ok=True)
 
 # API Settings
 API_CALL_DELAY = 0.5  # seconds between API calls (Alpha Vantage free tier limit)
+API_BURST = 5  # calls the rate limiter lets through back-to-back
+API_MAX_WORKERS = 4  # concurrent requests in batch fetches
+API_BACKOFF_BASE = 2  # seconds, doubled on every retry
+API_BACKOFF_MAX = 30  # seconds, cap on a single backoff
+API_RATE_LIMIT_COOLDOWN = 60  # seconds all requests pause after a rate-limit Note
 MAX_RETRIES = 3
+API_BULK_QUOTES = True  # try REALTIME_BULK_QUOTES first (premium keys only)
+API_BULK_BATCH_SIZE = 100  # symbols per bulk quote call (provider maximum)
+
+# Columnar bar store (see bar_store.py)
+BAR_STORE_DIR = DATA_DIR / "bars"
+BAR_STORE_WRITE = True  # ingestion and backfill append to the bar store next to market_prices
+PRICE_SOURCE = 'sqlite'  # 'bar_store' to read history from the bar store (run main.py bars first)
+
+# Retention (see compaction.py)
+RAW_RETENTION_DAYS = 7  # intraday quotes older than this are downsampled to one bar per day
+ARCHIVE_RAW_BARS = True  # write downsampled raw quotes to ARCHIVE_DIR before deleting them
+ARCHIVE_DIR = DATA_DIR / "archive"
+
+# Historical backfill
+BACKFILL_CHUNK_SIZE = 1000  # bars upserted (and checkpointed) per transaction
+
+# API response cache
+API_CACHE_DIR = DATA_DIR / "api_cache"
+API_CACHE_TTL = {  # seconds a cached response is served without refetching
+    'GLOBAL_QUOTE': 60,
+    'REALTIME_BULK_QUOTES': 60,
+    'TIME_SERIES_DAILY': 12 * 3600,
+}
+API_CACHE_COMPACT_REFRESH_DAYS = 90  # stale full history younger than this is topped up with a compact fetch
+
+# Parameter sweeps (see sweep.py)
+SWEEP_GRID = {
+    'rsi_oversold': [20, 25, 30, 35],
+    'rsi_overbought': [65, 70, 75, 80],
+    'bb_period': [15, 20, 30],
+    'bb_num_std': [1.5, 2, 2.5],
+    'momentum_top': [0.1, 0.2, 0.3],
+    'momentum_bottom': [0.1, 0.2, 0.3],
+    'z_entry': [1.5, 2, 2.5],
+}
+SWEEP_FLUSH_EVERY = 25  # results buffered before a write to sweep_results
+
+# Dashboard push channel (see events.py)
+EVENT_RETENTION = 1000  # most recent events kept for reconnecting clients
+EVENT_POLL_INTERVAL = 1.0  # seconds between change-stamp checks in the server
+EVENT_HEARTBEAT = 15  # seconds between keep-alive comments on idle streams
+EVENT_QUEUE_SIZE = 256  # events buffered per client before it is dropped
+
+# Daemon mode (main.py daemon): seconds between runs of each workflow
+SCHEDULE = {
+    'ingest': 5 * 60,
+    'signals': 15 * 60,
+    'pairs': 6 * 60 * 60,  # universe scan for cointegrated pairs (PAIR_DISCOVERY)
+    'execute': 30 * 60,
+    'portfolio': 60 * 60,
+    'compact': 24 * 60 * 60,
+}
+
+# Instrumentation (see metrics.py)
+METRICS_DIR = DATA_DIR / "metrics"  # per-process snapshots merged by the server's /metrics
+PROFILE_DIR = DATA_DIR / "profiles"
+# Stages to run under cProfile, e.g. TRADING_PROFILE=ingest,signals or =all
+PROFILE_STAGES = {s.strip() for s in os.environ.get('TRADING_PROFILE', '').split(',') if s.strip()}
+
+# Benchmarks (python -m benchmarks)
+BENCHMARK_DIR = DATA_DIR / "benchmarks"  # JSON results, one file per run
+BENCHMARK_SIZES = [15, 500, 5000]  # symbol counts
+BENCHMARK_BARS = 120  # synthetic history per symbol; signals need INDICATOR_BARS
+BENCHMARK_TICKS = 3  # pipeline ticks timed per size
+BENCHMARK_WARMUP_TICKS = 1  # untimed ticks first (indicator seeding, statement caches)
+BENCHMARK_REGRESSION_THRESHOLD = 0.2  # median slowdown flagged by --compare
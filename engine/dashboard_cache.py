@@ -0,0 +1,63 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from config import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+# Pipeline stages touch this file after they commit; the dashboard server
+# compares its stat() against the one its snapshot was built from. That
+# keeps idle polls away from SQLite entirely, even across processes.
+STAMP_PATH = DATA_DIR / "dashboard.stamp"
+
+def mark_dashboard_dirty():
+    """Signal that dashboard data changed (call after the stage commits)"""
+    fd, tmp_path = tempfile.mkstemp(dir=STAMP_PATH.parent, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        f.write(str(time.time_ns()))
+    os.replace(tmp_path, STAMP_PATH)
+
+def read_stamp():
+    """Current change stamp, or None if nothing was ever marked"""
+    try:
+        st = os.stat(STAMP_PATH)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+class SnapshotCache:
+    """Serialized dashboard payload, rebuilt only after a pipeline change.
+    
+    get() returns (body, etag). The builder runs at most once per change
+    stamp, however many clients are polling.
+    """
+    
+    def __init__(self, builder):
+        self.builder = builder
+        self.lock = threading.Lock()
+        self.stamp = None
+        self.body = None
+        self.etag = None
+    
+    def get(self):
+        stamp = read_stamp()
+        if self.body is not None and stamp == self.stamp:
+            return self.body, self.etag
+        
+        with self.lock:
+            # Another request may have rebuilt while we waited
+            if self.body is None or stamp != self.stamp:
+                body = json.dumps(self.builder(), default=str)
+                self.body = body
+                self.etag = hashlib.sha1(body.encode()).hexdigest()
+                self.stamp = stamp
+                logger.info(f"Dashboard snapshot rebuilt ({len(body)} bytes)")
+            return self.body, self.etag
+    
+    def invalidate(self):
+        with self.lock:
+            self.body = None
@@ -1,65 +1,246 @@
+import time
 import sqlite3
 import logging
+import threading
 from contextlib import contextmanager
+from metrics import registry
 
 logger = logging.getLogger(__name__)
 
 # Use SQLite for local implementation
 DB_PATH = "/home/bob/.openclaw/workspace/trading-engine/trading_engine.db"
 
+# Connection tuning
+DB_TIMEOUT = 30  # seconds to wait on a locked database
+DB_CACHE_SIZE = -64000  # page cache in KiB (negative = KiB, not pages)
+DB_MMAP_SIZE = 256 * 1024 * 1024  # bytes of the file mapped into memory
+DB_STATEMENT_CACHE = 256  # prepared statements kept per connection
+
+def _chunked(iterable, size):
+    """Yield lists of at most size items from iterable"""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _record_query(kind, start, rows):
+    registry.inc('trading_db_queries_total', kind=kind)
+    registry.observe('trading_db_query_duration_seconds', time.perf_counter() - start, kind=kind)
+    if rows > 0:
+        registry.inc('trading_db_rows_total', rows, kind=kind)
+
+PAPER_POSITIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS paper_positions (
+    symbol TEXT NOT NULL,
+    strategy_type TEXT NOT NULL,
+    quantity INTEGER,
+    entry_price REAL,
+    current_price REAL,
+    unrealized_pnl REAL,
+    position_value REAL,
+    entry_date TIMESTAMP,
+    PRIMARY KEY (symbol, strategy_type)
+);
+"""
+
 class Database:
     def __init__(self, db_path=None):
         self.db_path = db_path or DB_PATH
+        self._local = threading.local()
         logger.info(f"Using SQLite database: {self.db_path}")
     
+    def _connect(self):
+        """Open a long-lived connection with tuned pragmas"""
+        # isolation_level=None puts sqlite3 in autocommit mode; transactions
+        # are opened explicitly by transaction() so several statements can
+        # share a single commit.
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=DB_TIMEOUT,
+            isolation_level=None,
+            cached_statements=DB_STATEMENT_CACHE,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size={DB_CACHE_SIZE}")
+        conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+    
+    def _get_conn(self):
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            self._local.depth = 0
+        return conn
+    
     @contextmanager
     def get_connection(self):
-        """Context manager for database connections"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        """Context manager for the calling thread's persistent connection"""
+        yield self._get_conn()
+    
+    @contextmanager
+    def transaction(self):
+        """Unit of work: every statement inside commits once at the end.
+        
+        Nested calls join the outermost transaction. Any exception rolls
+        the whole unit back.
+        """
+        conn = self._get_conn()
+        if self._local.depth == 0:
+            conn.execute("BEGIN")
+        self._local.depth += 1
         try:
             yield conn
-        finally:
+        except BaseException:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                conn.rollback()
+            raise
+        self._local.depth -= 1
+        if self._local.depth == 0:
+            conn.commit()
+    
+    def in_transaction(self):
+        """True when the calling thread is inside transaction()"""
+        return getattr(self._local, 'depth', 0) > 0
+    
+    def close(self):
+        """Close the calling thread's connection"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
             conn.close()
+            self._local.conn = None
+            self._local.depth = 0
     
     def execute(self, query, params=None):
         """Execute query and return results"""
+        start = time.perf_counter()
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                if params:
-                    cursor.execute(query, params)
-                else:
-                    cursor.execute(query)
-                
-                # Check if it's a SELECT query
-                if query.strip().upper().startswith('SELECT'):
-                    rows = cursor.fetchall()
-                    return [dict(row) for row in rows]
-                else:
-                    conn.commit()
-                    return cursor.rowcount
+            conn = self._get_conn()
+            if params:
+                cursor = conn.execute(query, params)
+            else:
+                cursor = conn.execute(query)
+            
+            # Check if it's a SELECT query
+            if query.strip().upper().startswith(('SELECT', 'WITH')):
+                rows = cursor.fetchall()
+                _record_query('read', start, len(rows))
+                return [dict(row) for row in rows]
+            else:
+                # Autocommit outside transaction(); inside, the unit of work commits
+                _record_query('write', start, cursor.rowcount)
+                return cursor.rowcount
         except Exception as e:
             logger.error(f"Query error: {e}")
             logger.error(f"Query: {query}")
             logger.error(f"Params: {params}")
             raise
     
-    def execute_many(self, query, params_list):
-        """Execute query multiple times with different params"""
+    def fetch_rows(self, query, params=None):
+        """Run a SELECT and return plain tuples, skipping dict conversion.
+        
+        Meant for bulk readers that turn the result into arrays.
+        """
+        start = time.perf_counter()
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                for params in params_list:
-                    cursor.execute(query, params)
-                conn.commit()
-                return cursor.rowcount
+            cursor = self._get_conn().cursor()
+            cursor.row_factory = None
+            cursor.execute(query, params or ())
+            rows = cursor.fetchall()
+            _record_query('read', start, len(rows))
+            return rows
+        except Exception as e:
+            logger.error(f"Query error: {e}")
+            logger.error(f"Query: {query}")
+            logger.error(f"Params: {params}")
+            raise
+    
+    def execute_many(self, query, params_list, chunk_size=None):
+        """Bulk-execute query over params_list with executemany.
+        
+        Without chunk_size the whole batch is one transaction. With it,
+        params_list (any iterable, including a generator) is consumed and
+        committed chunk_size rows at a time, which keeps memory flat for
+        large backfills. Returns the total number of rows affected.
+        """
+        start = time.perf_counter()
+        try:
+            if chunk_size is None:
+                with self.transaction() as conn:
+                    total = conn.executemany(query, params_list).rowcount
+            else:
+                total = 0
+                for chunk in _chunked(params_list, chunk_size):
+                    with self.transaction() as conn:
+                        total += conn.executemany(query, chunk).rowcount
+            _record_query('batch', start, total)
+            return total
         except Exception as e:
             logger.error(f"Batch query error: {e}")
+            logger.error(f"Query: {query}")
             raise
     
+    def _migrate_paper_positions(self):
+        """Rekey paper_positions from symbol to (symbol, strategy_type)"""
+        columns = self.fetch_rows("PRAGMA table_info(paper_positions)")
+        if [column[1] for column in columns if column[5]] != ['symbol']:
+            return
+        with self.transaction():
+            self.execute("ALTER TABLE paper_positions RENAME TO paper_positions_old")
+            self.execute(PAPER_POSITIONS_TABLE)
+            self.execute("""
+                INSERT INTO paper_positions
+                (symbol, strategy_type, quantity, entry_price, current_price, unrealized_pnl, position_value, entry_date)
+                SELECT symbol, COALESCE(strategy_type, 'unknown'), quantity, entry_price, current_price,
+                       unrealized_pnl, position_value, entry_date
+                FROM paper_positions_old
+            """)
+            self.execute("DROP TABLE paper_positions_old")
+        logger.info("Migrated paper_positions to one row per (symbol, strategy)")
+    
+    def _add_column(self, table, column, definition):
+        """Add a column that tables created by older versions lack"""
+        columns = self.fetch_rows(f"PRAGMA table_info({table})")
+        if columns and column not in [row[1] for row in columns]:
+            self.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            logger.info(f"Added column {table}.{column}")
+    
+    def _backfill_latest_signals(self):
+        """Fill latest_signals from signals written before the trigger existed"""
+        if self.fetch_rows("SELECT 1 FROM latest_signals LIMIT 1"):
+            return
+        count = self.execute("""
+            INSERT INTO latest_signals
+            (symbol, strategy_type, signal_id, signal, signal_strength, z_score, momentum_score, rsi,
+             realized_vol, recommended_size, size_scale, hedge_ratio, timestamp)
+            SELECT symbol, strategy, id, signal, signal_strength, z_score, momentum_score, rsi,
+                   realized_vol, recommended_size, size_scale, hedge_ratio, timestamp
+            FROM (
+                SELECT *, COALESCE(strategy_type, 'unknown') AS strategy,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY symbol, COALESCE(strategy_type, 'unknown') ORDER BY timestamp DESC, id DESC
+                       ) AS rn
+                FROM signals
+            )
+            WHERE rn = 1
+        """)
+        if count:
+            logger.info(f"Backfilled latest_signals with {count} rows")
+    
     def create_tables(self):
         """Create all required tables"""
+        self._migrate_paper_positions()
+        self._add_column('signals', 'size_scale', 'REAL DEFAULT 1')
+        self._add_column('signals', 'hedge_ratio', 'REAL')
         queries = [
             # Market prices
             """
@@ -76,8 +257,102 @@ class Database:
                 UNIQUE(symbol, timestamp)
             );
             """,
-            "CREATE INDEX IF NOT EXISTS idx_market_prices_symbol ON market_prices(symbol);",
+            # UNIQUE(symbol, timestamp) already serves symbol lookups
+            "DROP INDEX IF EXISTS idx_market_prices_symbol;",
             "CREATE INDEX IF NOT EXISTS idx_market_prices_timestamp ON market_prices(timestamp);",
+            "CREATE INDEX IF NOT EXISTS idx_market_prices_symbol_timestamp ON market_prices(symbol, timestamp DESC);",
+            
+            # Daily OHLCV rollups of market_prices (see compaction.py)
+            """
+            CREATE TABLE IF NOT EXISTS market_prices_daily (
+                symbol TEXT NOT NULL,
+                day DATE NOT NULL,
+                open REAL,
+                high REAL,
+                low REAL,
+                close REAL,
+                volume INTEGER,
+                bars INTEGER NOT NULL,
+                first_timestamp INTEGER NOT NULL,
+                last_timestamp INTEGER NOT NULL,
+                compacted INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (symbol, day)
+            );
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_market_prices_daily_day ON market_prices_daily(day);",
+            
+            # Dashboard push events (see events.py)
+            """
+            CREATE TABLE IF NOT EXISTS dashboard_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                event_type TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                timestamp TIMESTAMP
+            );
+            """,
+            
+            # Historical backfill progress (see backfill.py)
+            """
+            CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+                symbol TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                last_date TEXT,
+                rows_written INTEGER DEFAULT 0,
+                error_message TEXT,
+                updated_at TIMESTAMP
+            );
+            """,
+            
+            # Parameter sweep results (see sweep.py)
+            """
+            CREATE TABLE IF NOT EXISTS sweep_results (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                sweep_id TEXT NOT NULL,
+                params TEXT NOT NULL,
+                total_return REAL,
+                cagr REAL,
+                sharpe_ratio REAL,
+                max_drawdown REAL,
+                win_rate REAL,
+                num_trades INTEGER,
+                error_message TEXT,
+                timestamp TIMESTAMP,
+                UNIQUE(sweep_id, params)
+            );
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_sweep_results_sharpe ON sweep_results(sweep_id, sharpe_ratio);",
+            
+            # Streaming indicator state (see indicator_state.py)
+            """
+            CREATE TABLE IF NOT EXISTS indicator_state (
+                symbol TEXT PRIMARY KEY,
+                last_timestamp INTEGER NOT NULL,
+                state TEXT NOT NULL
+            );
+            """,
+            
+            # Streaming spread statistics per pair (see pairs.py)
+            """
+            CREATE TABLE IF NOT EXISTS pair_state (
+                pair TEXT PRIMARY KEY,
+                last_timestamp INTEGER NOT NULL,
+                state TEXT NOT NULL
+            );
+            """,
+            
+            # Latest pair discovery scan
+            """
+            CREATE TABLE IF NOT EXISTS pair_candidates (
+                y_symbol TEXT NOT NULL,
+                x_symbol TEXT NOT NULL,
+                correlation REAL,
+                hedge_ratio REAL,
+                adf_stat REAL,
+                half_life REAL,
+                timestamp TIMESTAMP,
+                PRIMARY KEY (y_symbol, x_symbol)
+            );
+            """,
             
             # Signals
             """
@@ -92,25 +367,61 @@ class Database:
                 rsi REAL,
                 realized_vol REAL,
                 recommended_size REAL,
+                size_scale REAL DEFAULT 1,
+                hedge_ratio REAL,
                 timestamp TIMESTAMP
             );
             """,
             "CREATE INDEX IF NOT EXISTS idx_signals_timestamp ON signals(timestamp);",
             "CREATE INDEX IF NOT EXISTS idx_signals_strategy ON signals(strategy_type);",
             
-            # Positions
+            # Latest signal per (symbol, strategy), kept current by a trigger
+            # on signals so the executor never scans the signal history
             """
-            CREATE TABLE IF NOT EXISTS paper_positions (
-                symbol TEXT PRIMARY KEY,
-                quantity INTEGER,
-                entry_price REAL,
-                current_price REAL,
-                unrealized_pnl REAL,
-                position_value REAL,
-                strategy_type TEXT,
-                entry_date TIMESTAMP
+            CREATE TABLE IF NOT EXISTS latest_signals (
+                symbol TEXT NOT NULL,
+                strategy_type TEXT NOT NULL,
+                signal_id INTEGER,
+                signal INTEGER,
+                signal_strength REAL,
+                z_score REAL,
+                momentum_score REAL,
+                rsi REAL,
+                realized_vol REAL,
+                recommended_size REAL,
+                size_scale REAL,
+                hedge_ratio REAL,
+                timestamp TIMESTAMP,
+                PRIMARY KEY (symbol, strategy_type)
             );
             """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_signals_latest AFTER INSERT ON signals
+            BEGIN
+                INSERT INTO latest_signals
+                (symbol, strategy_type, signal_id, signal, signal_strength, z_score, momentum_score, rsi,
+                 realized_vol, recommended_size, size_scale, hedge_ratio, timestamp)
+                VALUES (NEW.symbol, COALESCE(NEW.strategy_type, 'unknown'), NEW.id, NEW.signal, NEW.signal_strength,
+                        NEW.z_score, NEW.momentum_score, NEW.rsi, NEW.realized_vol, NEW.recommended_size,
+                        NEW.size_scale, NEW.hedge_ratio, NEW.timestamp)
+                ON CONFLICT(symbol, strategy_type) DO UPDATE SET
+                    signal_id = excluded.signal_id,
+                    signal = excluded.signal,
+                    signal_strength = excluded.signal_strength,
+                    z_score = excluded.z_score,
+                    momentum_score = excluded.momentum_score,
+                    rsi = excluded.rsi,
+                    realized_vol = excluded.realized_vol,
+                    recommended_size = excluded.recommended_size,
+                    size_scale = excluded.size_scale,
+                    hedge_ratio = excluded.hedge_ratio,
+                    timestamp = excluded.timestamp
+                WHERE excluded.timestamp >= latest_signals.timestamp;
+            END;
+            """,
+            
+            # Positions, one per (symbol, strategy) (see position_book.py)
+            PAPER_POSITIONS_TABLE,
             
             # Trade log
             """
@@ -128,6 +439,37 @@ class Database:
             "CREATE INDEX IF NOT EXISTS idx_trade_log_symbol ON trade_log(symbol);",
             "CREATE INDEX IF NOT EXISTS idx_trade_log_timestamp ON trade_log(timestamp);",
             
+            # Open lots and realized PnL totals, built from trade_log (see ledger.py)
+            """
+            CREATE TABLE IF NOT EXISTS position_lots (
+                symbol TEXT NOT NULL,
+                strategy_type TEXT NOT NULL,
+                trade_id INTEGER NOT NULL,
+                quantity INTEGER NOT NULL,
+                price REAL NOT NULL,
+                opened_at TIMESTAMP,
+                PRIMARY KEY (symbol, strategy_type, trade_id)
+            );
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS realized_pnl (
+                symbol TEXT NOT NULL,
+                strategy_type TEXT NOT NULL,
+                realized_pnl REAL NOT NULL DEFAULT 0,
+                closed_quantity INTEGER NOT NULL DEFAULT 0,
+                closing_trades INTEGER NOT NULL DEFAULT 0,
+                winning_trades INTEGER NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP,
+                PRIMARY KEY (symbol, strategy_type)
+            );
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS ledger_state (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                last_trade_id INTEGER NOT NULL
+            );
+            """,
+            
             # Portfolio summary
             """
             CREATE TABLE IF NOT EXISTS portfolio_summary (
@@ -146,6 +488,30 @@ class Database:
             """,
             "CREATE INDEX IF NOT EXISTS idx_portfolio_summary_timestamp ON portfolio_summary(timestamp);",
             
+            # Mark-to-market equity per portfolio run and its running statistics (see performance.py)
+            """
+            CREATE TABLE IF NOT EXISTS equity_curve (
+                timestamp TIMESTAMP PRIMARY KEY,
+                equity REAL NOT NULL,
+                realized_pnl REAL,
+                unrealized_pnl REAL,
+                period_return REAL,
+                drawdown REAL,
+                volatility REAL,
+                sharpe_ratio REAL,
+                sortino_ratio REAL,
+                max_drawdown REAL,
+                cagr REAL
+            );
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS equity_state (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                last_timestamp TIMESTAMP NOT NULL,
+                state TEXT NOT NULL
+            );
+            """,
+            
             # Strategy breakdown
             """
             CREATE TABLE IF NOT EXISTS strategy_breakdown (
@@ -183,6 +549,8 @@ class Database:
                 # Ignore "already exists" errors
                 if "already exists" not in str(e).lower():
                     logger.error(f"Table creation error: {e}")
+        
+        self._backfill_latest_signals()
 
 # Global database instance
 db = Database()
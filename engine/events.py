@@ -0,0 +1,109 @@
+import json
+import queue
+import logging
+import threading
+from datetime import datetime
+from database import db
+from dashboard_cache import read_stamp
+from config import EVENT_RETENTION, EVENT_POLL_INTERVAL, EVENT_QUEUE_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Event types pushed to dashboard clients
+TRADES = 'trades'
+POSITIONS = 'positions'
+SIGNALS = 'signals'
+PORTFOLIO = 'portfolio'
+
+def publish(event_type, payload):
+    """Record a dashboard event.
+    
+    Call inside the stage's transaction so the event commits together
+    with the data it describes. Old events beyond EVENT_RETENTION are
+    pruned on the way.
+    """
+    db.execute(
+        "INSERT INTO dashboard_events (event_type, payload, timestamp) VALUES (?, ?, ?)",
+        (event_type, json.dumps(payload, default=str), datetime.utcnow())
+    )
+    db.execute(
+        "DELETE FROM dashboard_events WHERE id <= (SELECT MAX(id) FROM dashboard_events) - ?",
+        (EVENT_RETENTION,)
+    )
+
+def load_events(after_id, limit=EVENT_RETENTION):
+    """Events newer than after_id, oldest first"""
+    rows = db.execute(
+        "SELECT id, event_type, payload FROM dashboard_events WHERE id > ? ORDER BY id LIMIT ?",
+        (after_id, limit)
+    )
+    return [(row['id'], row['event_type'], row['payload']) for row in rows]
+
+def latest_event_id():
+    rows = db.execute("SELECT MAX(id) AS id FROM dashboard_events")
+    return (rows[0]['id'] or 0) if rows else 0
+
+class EventBroadcaster:
+    """Fans new dashboard events out to every connected client.
+    
+    A single background thread watches the dashboard change stamp and
+    only queries SQLite after a pipeline stage committed, however many
+    clients are connected. Each client gets its own bounded queue; a
+    client that falls behind is dropped and resumes via Last-Event-ID.
+    """
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.last_id = None
+        self.thread = None
+    
+    def _start(self):
+        if self.thread is None:
+            self.last_id = latest_event_id()
+            self.thread = threading.Thread(target=self._run, name='event-broadcaster', daemon=True)
+            self.thread.start()
+    
+    def subscribe(self):
+        """Register a client; returns (queue, id of the newest event already sent)"""
+        q = queue.Queue(maxsize=EVENT_QUEUE_SIZE)
+        with self.lock:
+            self._start()
+            self.subscribers.add(q)
+            return q, self.last_id
+    
+    def unsubscribe(self, q):
+        with self.lock:
+            self.subscribers.discard(q)
+    
+    def _run(self):
+        stamp = read_stamp()
+        stop = threading.Event()
+        while not stop.wait(EVENT_POLL_INTERVAL):
+            current = read_stamp()
+            if current == stamp:
+                continue
+            stamp = current
+            try:
+                self._dispatch(load_events(self.last_id))
+            except Exception as e:
+                logger.error(f"Event broadcast error: {e}")
+    
+    def _dispatch(self, events):
+        if not events:
+            return
+        with self.lock:
+            self.last_id = events[-1][0]
+            for q in list(self.subscribers):
+                try:
+                    for event in events:
+                        q.put_nowait(event)
+                except queue.Full:
+                    # Slow client: drop it; EventSource reconnects with Last-Event-ID
+                    self.subscribers.discard(q)
+                    with q.mutex:
+                        q.queue.clear()
+                    q.put_nowait(None)
+
+# Global broadcaster used by the dashboard server
+broadcaster = EventBroadcaster()
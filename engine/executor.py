@@ -1,44 +1,32 @@
 import logging
 from datetime import datetime
 from database import db
-from config import TRADING_CAPITAL, RISK_PER_TRADE
+from dashboard_cache import mark_dashboard_dirty
+from metrics import stage
+from events import publish, TRADES, POSITIONS
+from price_loader import load_latest_prices
+from position_book import position_book
+from ledger import ledger
+from netting import net_signals
+from risk import risk_engine, load_returns
+from config import TRADING_CAPITAL, RISK_PER_TRADE, RESIZE_TOLERANCE
 
 logger = logging.getLogger(__name__)
 
 def load_positions():
-    """Load all open positions"""
+    """Load all open positions as {(symbol, strategy): position}"""
     query = "SELECT * FROM paper_positions WHERE quantity != 0"
     results = db.execute(query)
-    return {row['symbol']: dict(row) for row in results}
+    return {(row['symbol'], row['strategy_type']): dict(row) for row in results}
 
 def load_signals():
-    """Load latest signals for each symbol"""
-    query = "SELECT * FROM signals ORDER BY timestamp DESC"
-    all_signals = db.execute(query)
-    
-    # Get latest signal for each symbol/strategy combination
-    latest = {}
-    for sig in all_signals:
-        key = (sig['symbol'], sig['strategy_type'])
-        if key not in latest:
-            latest[key] = sig
-    
-    return {sig['symbol']: dict(sig) for sig in latest.values()}
-
-def load_prices():
-    """Load current prices"""
-    query = "SELECT DISTINCT symbol FROM market_prices"
-    symbols = db.execute(query)
-    
-    prices = {}
-    for sym_row in symbols:
-        symbol = sym_row['symbol']
-        price_query = "SELECT close FROM market_prices WHERE symbol = ? ORDER BY timestamp DESC LIMIT 1"
-        price_results = db.execute(price_query, (symbol,))
-        if price_results:
-            prices[symbol] = float(price_results[0]['close'])
-    
-    return prices
+    """Load the latest signal of every (symbol, strategy) combination.
+    
+    latest_signals is kept current by a trigger on signals, so this reads
+    one row per key instead of the signal history.
+    """
+    query = "SELECT * FROM latest_signals"
+    return {(sig['symbol'], sig['strategy_type']): sig for sig in db.execute(query)}
 
 def load_portfolio_value():
     """Load current portfolio value"""
@@ -48,125 +36,197 @@ def load_portfolio_value():
         return float(results[0]['total_portfolio_value'])
     return TRADING_CAPITAL
 
-def execute_trades():
-    """Match signals to prices and execute trades"""
-    logger.info("Starting trade execution...")
+def _order(symbol, strategy, quantity, price, timestamp, action):
+    return {
+        'symbol': symbol,
+        'side': 'BUY' if quantity > 0 else 'SELL',
+        'quantity': abs(quantity),
+        'price': price,
+        'strategy_type': strategy,
+        'timestamp': timestamp,
+        'action': action,
+    }
+
+def plan_trades(signals, positions, prices, capital_per_trade, timestamp, tolerance=RESIZE_TOLERANCE):
+    """Turn signals into orders against the current positions.
     
-    positions = load_positions()
-    signals = load_signals()
-    prices = load_prices()
-    portfolio_value = load_portfolio_value()
+    signals: {(symbol, strategy): signal} as netted by netting.net_signals,
+    positions: {(symbol, strategy): position} (or a PositionBook), prices:
+    {symbol: price}. Each strategy holds its own position per symbol.
+    Pure function shared by execute_trades and the backtester.
     
+    Every signal sets a target quantity of capital_per_trade / price *
+    signal_strength * size_scale in its direction, and the order trades
+    the difference to the held quantity: action 'open' from flat,
+    'close' to flat, 'increase' or 'reduce' on the same side, and a
+    'close' followed by an 'open' when the side flips. Held positions
+    within tolerance (a fraction of the target) of it are left alone.
+    """
     trades = []
-    timestamp = datetime.utcnow()
-    capital_per_trade = portfolio_value * RISK_PER_TRADE
     
-    for symbol, signal in signals.items():
+    for (symbol, strategy), signal in signals.items():
         if symbol not in prices:
-            logger.warning(f"No price for {symbol}")
             continue
         
         current_price = prices[symbol]
-        existing_pos = positions.get(symbol)
+        existing_pos = positions.get((symbol, strategy))
+        held = existing_pos['quantity'] if existing_pos else 0
         
         signal_val = signal.get('signal', 0)
-        signal_strength = signal.get('signal_strength', 0)
+        target = 0
+        if signal_val in (1, -1):
+            # size_scale: netting and the portfolio optimizer's adjustments
+            position_size = capital_per_trade / current_price * signal.get('signal_strength', 0) * signal.get('size_scale', 1.0)
+            target = signal_val * int(position_size)
         
-        if signal_val == 0:
-            # No signal
-            if existing_pos and existing_pos['quantity'] != 0:
-                # Close position
-                side = 'SELL' if existing_pos['quantity'] > 0 else 'BUY'
-                quantity = abs(existing_pos['quantity'])
-                trades.append({
-                    'symbol': symbol,
-                    'side': side,
-                    'quantity': quantity,
-                    'price': current_price,
-                    'strategy_type': existing_pos['strategy_type'],
-                    'timestamp': timestamp,
-                })
-                logger.info(f"Closing {symbol}: {side} {quantity} @ ${current_price:.2f}")
-        
-        elif signal_val == 1 and not existing_pos:
-            # Long signal, no existing position
-            position_size = capital_per_trade / current_price * signal_strength
-            quantity = int(position_size)
-            if quantity > 0:
-                trades.append({
-                    'symbol': symbol,
-                    'side': 'BUY',
-                    'quantity': quantity,
-                    'price': current_price,
-                    'strategy_type': signal['strategy_type'],
-                    'timestamp': timestamp,
-                })
-                logger.info(f"Opening LONG {symbol}: BUY {quantity} @ ${current_price:.2f}")
-        
-        elif signal_val == -1 and not existing_pos:
-            # Short signal, no existing position
-            position_size = capital_per_trade / current_price * signal_strength
-            quantity = int(position_size)
-            if quantity > 0:
-                trades.append({
-                    'symbol': symbol,
-                    'side': 'SELL',
-                    'quantity': quantity,
-                    'price': current_price,
-                    'strategy_type': signal['strategy_type'],
-                    'timestamp': timestamp,
-                })
-                logger.info(f"Opening SHORT {symbol}: SELL {quantity} @ ${current_price:.2f}")
-    
-    # Insert trades and update positions
-    if trades:
-        trade_query = "INSERT INTO trade_log (symbol, side, quantity, price, pnl, strategy_type, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?)"
-        
-        for trade in trades:
-            db.execute(trade_query, (
-                trade['symbol'],
-                trade['side'],
-                trade['quantity'],
-                trade['price'],
-                0,  # Will calculate PnL later
-                trade['strategy_type'],
-                trade['timestamp'],
-            ))
+        if target == held:
+            continue
+        if held == 0:
+            trades.append(_order(symbol, strategy, target, current_price, timestamp, 'open'))
+        elif target == 0 or (target > 0) != (held > 0):
+            trades.append(_order(symbol, strategy, -held, current_price, timestamp, 'close'))
+            if target:
+                trades.append(_order(symbol, strategy, target, current_price, timestamp, 'open'))
+        elif abs(target - held) > tolerance * abs(target):
+            action = 'increase' if abs(target) > abs(held) else 'reduce'
+            trades.append(_order(symbol, strategy, target - held, current_price, timestamp, action))
+    
+    return trades
+
+def apply_fill(positions, trade):
+    """Apply a filled order to an in-memory {(symbol, strategy): position} map.
+    
+    Shorts are held as negative quantities; an increase moves the entry
+    price to the average cost. Returns the part of the position that was
+    closed (all of it for 'close', the sold part for 'reduce') with its
+    entry price, None otherwise.
+    """
+    key = (trade['symbol'], trade['strategy_type'])
+    if trade['action'] == 'close':
+        return positions.pop(key, None)
+    
+    quantity = trade['quantity'] if trade['side'] == 'BUY' else -trade['quantity']
+    existing = positions.get(key)
+    if trade['action'] == 'reduce' and existing:
+        existing['quantity'] += quantity
+        return {**existing, 'quantity': -quantity}
+    if trade['action'] == 'increase' and existing:
+        total = existing['quantity'] + quantity
+        existing['entry_price'] = (existing['entry_price'] * existing['quantity'] + trade['price'] * quantity) / total
+        existing['quantity'] = total
+        return None
+    
+    positions[key] = {
+        'symbol': trade['symbol'],
+        'quantity': quantity,
+        'entry_price': trade['price'],
+        'strategy_type': trade['strategy_type'],
+        'entry_date': trade['timestamp'],
+    }
+    return None
+
+@stage('execute', items=len)
+def execute_trades():
+    """Match signals to prices and execute trades against the position book"""
+    logger.info("Starting trade execution...")
+    
+    position_book.refresh()
+    # Pair signals become legs, opposing strategies net to one target per symbol
+    latest = load_signals()
+    signals, targets = net_signals(latest)
+    logger.info(f"Netted {len(latest)} signals into {sum(1 for t in targets.values() if t)} non-zero symbol targets")
+    names, closes = load_latest_prices()
+    prices = dict(zip(names.tolist(), closes.tolist()))
+    portfolio_value = load_portfolio_value()
+    
+    timestamp = datetime.utcnow()
+    capital_per_trade = portfolio_value * RISK_PER_TRADE
+    
+    for symbol in {symbol for symbol, _ in signals}:
+        if symbol not in prices:
+            logger.warning(f"No price for {symbol}")
+    
+    # Mark first, so the risk checks see current exposures
+    position_book.mark(names, closes)
+    trades = plan_trades(signals, position_book, prices, capital_per_trade, timestamp)
+    
+    # Pre-trade risk: scale or reject opening orders that would breach a limit
+    closing = [(trade['symbol'], trade['strategy_type']) for trade in trades if trade['action'] == 'close']
+    trades, rejected = risk_engine.check(
+        trades, position_book.exposures(closing), portfolio_value, load_returns
+    )
+    for trade in rejected:
+        logger.info(f"Rejected {trade['side']} {trade['quantity']} {trade['symbol']} ({trade['strategy_type']}): {trade['risk_reason']} limit")
+    
+    for trade in trades:
+        if trade['action'] == 'close':
+            logger.info(f"Closing {trade['symbol']} ({trade['strategy_type']}): {trade['side']} {trade['quantity']} @ ${trade['price']:.2f}")
+        elif trade['action'] in ('increase', 'reduce'):
+            logger.info(f"Resizing {trade['symbol']} ({trade['strategy_type']}): {trade['side']} {trade['quantity']} @ ${trade['price']:.2f}")
+        else:
+            direction = 'LONG' if trade['side'] == 'BUY' else 'SHORT'
+            logger.info(f"Opening {direction} {trade['symbol']} ({trade['strategy_type']}): {trade['side']} {trade['quantity']} @ ${trade['price']:.2f}")
+    
+    trade_query = "INSERT INTO trade_log (symbol, side, quantity, price, pnl, strategy_type, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?)"
+    trade_rows = [
+        (
+            trade['symbol'],
+            trade['side'],
+            trade['quantity'],
+            trade['price'],
+            0,  # Set by the ledger for closing fills
+            trade['strategy_type'],
+            trade['timestamp'],
+        )
+        for trade in trades
+    ]
+    
+    # Fill, mark to market and write the book's diff as one unit of work
+    try:
+        with db.transaction():
+            for trade in trades:
+                position_book.apply_fill(trade)
+            if trades:
+                db.execute_many(trade_query, trade_rows)
+                ledger.sync()
+                logger.info(f"Executed {len(trades)} trades")
+            else:
+                logger.info("No trades executed")
+            updated, closed = position_book.flush()
             
-            # Update position
-            if trade['side'] == 'BUY':
-                pos_query = """
-                INSERT OR REPLACE INTO paper_positions (symbol, quantity, entry_price, current_price, unrealized_pnl, position_value, strategy_type, entry_date)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """
-                db.execute(pos_query, (
-                    trade['symbol'],
-                    trade['quantity'],
-                    trade['price'],
-                    trade['price'],
-                    0,
-                    trade['quantity'] * trade['price'],
-                    trade['strategy_type'],
-                    timestamp,
-                ))
-            elif trade['side'] == 'SELL':
-                # Close position
-                db.execute("DELETE FROM paper_positions WHERE symbol=?", (trade['symbol'],))
-        
-        logger.info(f"Executed {len(trades)} trades")
-    else:
-        logger.info("No trades executed")
-    
-    # Update unrealized PnL for all positions
-    positions = load_positions()
-    for symbol, pos in positions.items():
-        if symbol in prices:
-            unrealized = (prices[symbol] - pos['entry_price']) * pos['quantity']
-            position_value = prices[symbol] * pos['quantity']
-            db.execute(
-                "UPDATE paper_positions SET unrealized_pnl=?, current_price=?, position_value=? WHERE symbol=?",
-                (unrealized, prices[symbol], position_value, symbol)
-            )
+            # Push the changes to dashboard clients
+            if trades:
+                publish(TRADES, [
+                    {
+                        'symbol': trade['symbol'],
+                        'side': trade['side'],
+                        'quantity': int(trade['quantity']),
+                        'price': float(trade['price']),
+                        'strategy': trade['strategy_type'],
+                        'timestamp': str(trade['timestamp']),
+                    }
+                    for trade in trades
+                ])
+            publish(POSITIONS, {
+                'updated': [
+                    {
+                        'symbol': pos['symbol'],
+                        'pnl': pos['unrealized_pnl'],
+                        'quantity': pos['quantity'],
+                        'entry_price': pos['entry_price'],
+                        'current_price': pos['current_price'],
+                        'position_value': pos['position_value'],
+                        'strategy': pos['strategy_type'],
+                    }
+                    for pos in updated
+                ],
+                'closed': [{'symbol': symbol, 'strategy': strategy} for symbol, strategy in closed],
+            })
+    except Exception:
+        # The book already holds the fills; reload it from the database
+        position_book.invalidate()
+        raise
+    mark_dashboard_dirty()
     
     return trades
 
@@ -0,0 +1,303 @@
+import json
+import math
+import logging
+from database import db
+from bar_store import bar_store
+from price_loader import load_symbols, load_price_histories
+from indicators import INDICATOR_BARS
+from config import PRICE_SOURCE
+
+logger = logging.getLogger(__name__)
+
+class RollingWindow:
+    """Fixed-size ring buffer with running sum and sum of squares.
+
+    push() is O(1). The running sums are rebuilt from the buffer every time
+    the ring wraps, so floating-point drift cannot accumulate.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.values = []
+        self.pos = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+
+    def push(self, value):
+        if len(self.values) < self.size:
+            self.values.append(value)
+            self.total += value
+            self.total_sq += value * value
+            return
+        old = self.values[self.pos]
+        self.values[self.pos] = value
+        self.total += value - old
+        self.total_sq += value * value - old * old
+        self.pos = (self.pos + 1) % self.size
+        if self.pos == 0:
+            self.total = math.fsum(self.values)
+            self.total_sq = math.fsum(v * v for v in self.values)
+
+    @property
+    def full(self):
+        return len(self.values) == self.size
+
+    def oldest(self):
+        """Value pushed size - 1 updates ago"""
+        return self.values[self.pos] if self.full else self.values[0]
+
+    def mean(self):
+        return self.total / len(self.values)
+
+    def std(self):
+        """Population standard deviation"""
+        mean = self.mean()
+        return math.sqrt(max(self.total_sq / len(self.values) - mean * mean, 0.0))
+
+    def to_dict(self):
+        return {'size': self.size, 'values': self.values, 'pos': self.pos}
+
+    @classmethod
+    def from_dict(cls, data):
+        window = cls(data['size'])
+        window.values = list(data['values'])
+        window.pos = data['pos']
+        window.total = math.fsum(window.values)
+        window.total_sq = math.fsum(v * v for v in window.values)
+        return window
+
+class WilderRSI:
+    """Relative Strength Index with Wilder smoothing.
+
+    The first period changes seed simple averages; after that each change
+    updates the averages as avg = (avg * (period - 1) + x) / period.
+    """
+
+    def __init__(self, period=14):
+        self.period = period
+        self.count = 0
+        self.avg_gain = 0.0
+        self.avg_loss = 0.0
+
+    def update(self, change):
+        gain = max(change, 0.0)
+        loss = max(-change, 0.0)
+        self.count += 1
+        if self.count <= self.period:
+            self.avg_gain += (gain - self.avg_gain) / self.count
+            self.avg_loss += (loss - self.avg_loss) / self.count
+        else:
+            self.avg_gain = (self.avg_gain * (self.period - 1) + gain) / self.period
+            self.avg_loss = (self.avg_loss * (self.period - 1) + loss) / self.period
+
+    def value(self):
+        if self.count < self.period:
+            return None
+        if self.avg_loss == 0:
+            return 100 if self.avg_gain > 0 else 50
+        return 100 - 100 / (1 + self.avg_gain / self.avg_loss)
+
+    def to_dict(self):
+        return {'period': self.period, 'count': self.count,
+                'avg_gain': self.avg_gain, 'avg_loss': self.avg_loss}
+
+    @classmethod
+    def from_dict(cls, data):
+        rsi = cls(data['period'])
+        rsi.count = data['count']
+        rsi.avg_gain = data['avg_gain']
+        rsi.avg_loss = data['avg_loss']
+        return rsi
+
+class SymbolIndicators:
+    """Streaming counterpart of calculate_all_indicators for one symbol"""
+
+    def __init__(self):
+        self.bars = 0
+        self.last_close = None
+        self.last_timestamp = None
+        self.sma20 = RollingWindow(20)
+        self.sma90 = RollingWindow(90)
+        self.returns30 = RollingWindow(30)
+        self.momentum90 = RollingWindow(91)
+        self.rsi14 = WilderRSI(14)
+
+    def update(self, timestamp, close):
+        """Apply one new bar in constant time"""
+        if self.last_close is not None:
+            self.rsi14.update(close - self.last_close)
+            self.returns30.push((close - self.last_close) / self.last_close)
+        self.sma20.push(close)
+        self.sma90.push(close)
+        self.momentum90.push(close)
+        self.last_close = close
+        self.last_timestamp = timestamp
+        self.bars += 1
+
+    def indicators(self):
+        """Current indicators, or None until INDICATOR_BARS bars were seen"""
+        if self.bars < INDICATOR_BARS:
+            return None
+
+        sma20 = self.sma20.mean()
+        std20 = self.sma20.std()
+        past = self.momentum90.oldest()
+        indicators = {
+            'current_price': self.last_close,
+            'sma20': sma20,
+            'sma90': self.sma90.mean(),
+            'rsi': self.rsi14.value(),
+            'volatility': self.returns30.std(),
+            'momentum': (self.last_close - past) / past * 100 if past else None,
+        }
+        if std20 > 0:
+            indicators['bb_upper'] = sma20 + 2 * std20
+            indicators['bb_middle'] = sma20
+            indicators['bb_lower'] = sma20 - 2 * std20
+
+        # Filter out None values
+        return {k: v for k, v in indicators.items() if v is not None}
+
+    def to_dict(self):
+        return {
+            'bars': self.bars,
+            'last_close': self.last_close,
+            'sma20': self.sma20.to_dict(),
+            'sma90': self.sma90.to_dict(),
+            'returns30': self.returns30.to_dict(),
+            'momentum90': self.momentum90.to_dict(),
+            'rsi14': self.rsi14.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data, last_timestamp):
+        state = cls()
+        state.bars = data['bars']
+        state.last_close = data['last_close']
+        state.last_timestamp = last_timestamp
+        state.sma20 = RollingWindow.from_dict(data['sma20'])
+        state.sma90 = RollingWindow.from_dict(data['sma90'])
+        state.returns30 = RollingWindow.from_dict(data['returns30'])
+        state.momentum90 = RollingWindow.from_dict(data['momentum90'])
+        state.rsi14 = WilderRSI.from_dict(data['rsi14'])
+        return state
+
+class IndicatorStateStore:
+    """Per-symbol streaming indicator state, persisted in indicator_state.
+
+    sync() reads only the bars that arrived since each symbol's last
+    update, so a run costs O(new bars) per symbol regardless of window
+    length. States are kept in memory between calls in long-lived
+    processes and restored from the table otherwise.
+    """
+
+    def __init__(self):
+        self.states = {}
+
+    def load(self):
+        """Restore persisted state that is newer than what is in memory"""
+        rows = db.execute("SELECT symbol, last_timestamp, state FROM indicator_state")
+        for row in rows:
+            # Another process may have advanced the persisted state
+            current = self.states.get(row['symbol'])
+            if current is None or row['last_timestamp'] > current.last_timestamp:
+                self.states[row['symbol']] = SymbolIndicators.from_dict(
+                    json.loads(row['state']), row['last_timestamp']
+                )
+
+    def _load_new_bars(self):
+        """Bars newer than each symbol's persisted state, at most INDICATOR_BARS each"""
+        if PRICE_SOURCE == 'bar_store':
+            return self._load_new_bars_from_store()
+        # Driven from indicator_state: one index range seek per symbol
+        # (CROSS JOIN keeps SQLite from scanning market_prices instead)
+        query = """
+        SELECT symbol, timestamp, close, new_bars FROM (
+            SELECT m.symbol, m.timestamp, m.close,
+                   ROW_NUMBER() OVER (PARTITION BY m.symbol ORDER BY m.timestamp DESC) AS rn,
+                   COUNT(*) OVER (PARTITION BY m.symbol) AS new_bars
+            FROM indicator_state s CROSS JOIN market_prices m
+            WHERE m.symbol = s.symbol AND m.timestamp > s.last_timestamp
+        )
+        WHERE rn <= ?
+        ORDER BY symbol, timestamp
+        """
+        rows = db.execute(query, (INDICATOR_BARS,))
+        
+        # Symbols without state yet start from their last INDICATOR_BARS bars
+        persisted = {row[0] for row in db.fetch_rows("SELECT symbol FROM indicator_state")}
+        fresh = [symbol for symbol in load_symbols() if symbol not in persisted]
+        if fresh:
+            names, timestamps, closes, counts = load_price_histories(INDICATOR_BARS, fresh)
+            for i, symbol in enumerate(names.tolist()):
+                n = int(counts[i])
+                for timestamp, close in zip(timestamps[i, -n:].tolist(), closes[i, -n:].tolist()):
+                    if math.isnan(close):
+                        continue
+                    rows.append({'symbol': symbol, 'timestamp': timestamp, 'close': close, 'new_bars': n})
+        return rows
+    
+    def _load_new_bars_from_store(self):
+        """Same rows as _load_new_bars, sliced from the memory-mapped bar store"""
+        persisted = {
+            row['symbol']: row['last_timestamp']
+            for row in db.execute("SELECT symbol, last_timestamp FROM indicator_state")
+        }
+        rows = []
+        for symbol in bar_store.symbols():
+            last = persisted.get(symbol)
+            bars = bar_store.read(symbol, start=None if last is None else last + 1)
+            new_bars = len(bars['timestamp'])
+            for timestamp, close in zip(bars['timestamp'][-INDICATOR_BARS:].tolist(),
+                                        bars['close'][-INDICATOR_BARS:].tolist()):
+                rows.append({'symbol': symbol, 'timestamp': timestamp, 'close': close, 'new_bars': new_bars})
+        return rows
+
+    def sync(self):
+        """Apply new bars to every symbol's state and persist the changes.
+
+        Returns {symbol: indicators} for every symbol with enough history.
+        """
+        self.load()
+
+        updated = set()
+        for row in self._load_new_bars():
+            symbol = row['symbol']
+            state = self.states.get(symbol)
+            # A gap longer than every window makes the old state useless:
+            # reseed from the most recent bars instead
+            if state is None or (symbol not in updated and row['new_bars'] >= INDICATOR_BARS):
+                state = SymbolIndicators()
+                self.states[symbol] = state
+            state.update(row['timestamp'], float(row['close']))
+            updated.add(symbol)
+
+        if updated:
+            db.execute_many(
+                "INSERT OR REPLACE INTO indicator_state (symbol, last_timestamp, state) VALUES (?, ?, ?)",
+                [
+                    (symbol, self.states[symbol].last_timestamp, json.dumps(self.states[symbol].to_dict()))
+                    for symbol in updated
+                ]
+            )
+            logger.info(f"Indicator state updated for {len(updated)} symbols")
+
+        result = {}
+        for symbol, state in self.states.items():
+            indicators = state.indicators()
+            if indicators:
+                result[symbol] = indicators
+        return result
+
+    def reset(self, symbols=None):
+        """Drop state so the next sync reseeds from stored history"""
+        if symbols is None:
+            self.states.clear()
+            db.execute("DELETE FROM indicator_state")
+            return
+        for symbol in symbols:
+            self.states.pop(symbol, None)
+        db.execute_many("DELETE FROM indicator_state WHERE symbol = ?", [(s,) for s in symbols])
+
+# Global state store
+indicator_store = IndicatorStateStore()
@@ -1,109 +1,291 @@
-import math
 import logging
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
+# Bars of history calculate_all_indicators needs per symbol
+INDICATOR_BARS = 100
+
+# Vectorized engine
+#
+# Every function below takes a 2-D float array of closes shaped
+# (symbols x bars) in chronological order (last column = newest bar) and
+# returns one value per symbol. Symbols without enough history get NaN.
+
+def _last(closes, n):
+    """Trailing n bars of every row, or None if the matrix is too short"""
+    if closes.shape[1] < n:
+        return None
+    return closes[:, -n:]
+
+def _nan(closes):
+    return np.full(closes.shape[0], np.nan)
+
+def sma(closes, period=20):
+    """Simple Moving Average per symbol"""
+    window = _last(closes, period)
+    if window is None:
+        return _nan(closes)
+    return window.mean(axis=1)
+
+def std_dev(closes, period=20, mean=None):
+    """Population standard deviation of the last period closes per symbol"""
+    window = _last(closes, period)
+    if window is None:
+        return _nan(closes)
+    if mean is None:
+        mean = window.mean(axis=1)
+    return np.sqrt(((window - mean[:, None]) ** 2).mean(axis=1))
+
+def bollinger_bands(closes, period=20, num_std=2):
+    """Bollinger Bands per symbol as (upper, middle, lower).
+
+    Bands are NaN where the window is flat (zero deviation).
+    """
+    mean = sma(closes, period)
+    std = std_dev(closes, period, mean)
+    middle = np.where(std > 0, mean, np.nan)
+    return middle + num_std * std, middle, middle - num_std * std
+
+def rsi(closes, period=14):
+    """Relative Strength Index per symbol with Wilder smoothing.
+
+    The first period changes in the window seed simple averages; every
+    later change updates them as avg = (avg * (period - 1) + x) / period,
+    matching the streaming WilderRSI in indicator_state.py.
+    """
+    if closes.shape[1] < period + 1:
+        return _nan(closes)
+    changes = np.diff(closes, axis=1)
+    gains = np.clip(changes, 0, None)
+    losses = np.clip(-changes, 0, None)
+    avg_gain = gains[:, :period].mean(axis=1)
+    avg_loss = losses[:, :period].mean(axis=1)
+    for i in range(period, changes.shape[1]):
+        avg_gain = (avg_gain * (period - 1) + gains[:, i]) / period
+        avg_loss = (avg_loss * (period - 1) + losses[:, i]) / period
+    with np.errstate(divide='ignore', invalid='ignore'):
+        value = 100 - 100 / (1 + avg_gain / avg_loss)
+    flat = np.where(avg_gain > 0, 100.0, 50.0)
+    return np.where(avg_loss == 0, flat, value)
+
+def volatility(closes, period=30):
+    """Realized volatility (std of simple returns) per symbol"""
+    window = _last(closes, period + 1)
+    if window is None:
+        return _nan(closes)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = np.diff(window, axis=1) / window[:, :-1]
+    return returns.std(axis=1)
+
+def momentum(closes, period=90):
+    """Percentage change over period bars per symbol"""
+    window = _last(closes, period + 1)
+    if window is None:
+        return _nan(closes)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (window[:, -1] - window[:, 0]) / window[:, 0] * 100
+
+def compute_indicators(closes):
+    """Compute every indicator for every symbol in one vectorized pass.
+
+    closes: (symbols x bars) array, chronological. Returns {name: array}.
+    """
+    closes = np.asarray(closes, dtype=np.float64)
+    upper, middle, lower = bollinger_bands(closes, 20, 2)
+    return {
+        'current_price': closes[:, -1],
+        'sma20': sma(closes, 20),
+        'sma90': sma(closes, 90),
+        'rsi': rsi(closes, 14),
+        'volatility': volatility(closes, 30),
+        'momentum': momentum(closes, 90),
+        'bb_upper': upper,
+        'bb_middle': middle,
+        'bb_lower': lower,
+    }
+
+def build_price_matrix(histories, bars=INDICATOR_BARS):
+    """Stack per-symbol histories into a (symbols x bars) matrix.
+
+    histories: {symbol: [close, ...]} newest first (a row of
+    price_loader.load_price_histories, reversed). Symbols with fewer than
+    bars closes are dropped.
+    Returns (symbols, matrix) with the matrix in chronological order.
+    """
+    symbols = [s for s, prices in histories.items() if prices and len(prices) >= bars]
+    matrix = np.empty((len(symbols), bars), dtype=np.float64)
+    for i, symbol in enumerate(symbols):
+        matrix[i] = histories[symbol][bars - 1::-1]
+    return symbols, matrix
+
+def calculate_indicators_batch(symbols, closes):
+    """Calculate all indicators for many symbols at once.
+
+    Returns {symbol: indicators} in the same per-symbol dict shape as
+    calculate_all_indicators. Symbols whose window has gaps are skipped.
+    """
+    closes = np.asarray(closes, dtype=np.float64)
+    if len(symbols) == 0 or closes.shape[1] < INDICATOR_BARS:
+        return {}
+
+    try:
+        closes = closes[:, -INDICATOR_BARS:]
+        values = compute_indicators(closes)
+        complete = np.isfinite(closes).all(axis=1)
+
+        names = list(values)
+        table = np.column_stack([values[name] for name in names])
+        finite = np.isfinite(table)
+
+        result = {}
+        for i in np.flatnonzero(complete):
+            # Filter out undefined values
+            result[symbols[i]] = {
+                name: float(table[i, j]) for j, name in enumerate(names) if finite[i, j]
+            }
+        return result
+    except Exception as e:
+        logger.error(f"Indicator calculation error: {e}")
+        return {}
+
+# Rolling engine
+#
+# Same indicators as compute_indicators, but evaluated at every bar of a
+# (symbols x bars) matrix instead of only the newest one. Used to replay
+# history in the backtester. NaN marks bars before a symbol has
+# INDICATOR_BARS of history, matching what the live pipeline would see.
+
+def _windows(values, n):
+    """(symbols x bars - n + 1 x n) view of trailing windows"""
+    return np.lib.stride_tricks.sliding_window_view(values, n, axis=1)
+
+def _align(values, n, total):
+    """Right-align per-window results into a (symbols x total) array"""
+    out = np.full((values.shape[0], total), np.nan)
+    out[:, n - 1:] = values
+    return out
+
+def rolling_sma(closes, period=20):
+    if closes.shape[1] < period:
+        return np.full(closes.shape, np.nan)
+    return _align(_windows(closes, period).mean(axis=2), period, closes.shape[1])
+
+def rolling_std(closes, period=20):
+    if closes.shape[1] < period:
+        return np.full(closes.shape, np.nan)
+    return _align(_windows(closes, period).std(axis=2), period, closes.shape[1])
+
+def rolling_rsi(closes, period=14):
+    """Wilder RSI at every bar, seeded from each symbol's first changes"""
+    n_symbols, n_bars = closes.shape
+    out = np.full((n_symbols, n_bars), np.nan)
+    changes = np.diff(closes, axis=1)
+    count = np.zeros(n_symbols)
+    avg_gain = np.zeros(n_symbols)
+    avg_loss = np.zeros(n_symbols)
+    for t in range(n_bars - 1):
+        change = changes[:, t]
+        ok = np.isfinite(change)
+        gain = np.where(ok, np.clip(change, 0, None), 0)
+        loss = np.where(ok, np.clip(-change, 0, None), 0)
+        count += ok
+        seed = ok & (count <= period)
+        smooth = ok & (count > period)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            avg_gain = np.where(seed, avg_gain + (gain - avg_gain) / count, avg_gain)
+            avg_loss = np.where(seed, avg_loss + (loss - avg_loss) / count, avg_loss)
+            avg_gain = np.where(smooth, (avg_gain * (period - 1) + gain) / period, avg_gain)
+            avg_loss = np.where(smooth, (avg_loss * (period - 1) + loss) / period, avg_loss)
+            value = 100 - 100 / (1 + avg_gain / avg_loss)
+        value = np.where(avg_loss == 0, np.where(avg_gain > 0, 100.0, 50.0), value)
+        out[:, t + 1] = np.where(count >= period, value, np.nan)
+    return out
+
+def rolling_volatility(closes, period=30):
+    n_bars = closes.shape[1]
+    if n_bars < period + 1:
+        return np.full(closes.shape, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = np.diff(closes, axis=1) / closes[:, :-1]
+    return _align(_windows(returns, period).std(axis=2), period + 1, n_bars)
+
+def rolling_momentum(closes, period=90):
+    out = np.full(closes.shape, np.nan)
+    if closes.shape[1] > period:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            out[:, period:] = (closes[:, period:] - closes[:, :-period]) / closes[:, :-period] * 100
+    return out
+
+def rolling_indicators(closes, bb_period=20, num_std=2):
+    """Every indicator at every bar for every symbol.
+
+    closes: (symbols x bars) array, chronological, NaN before a symbol's
+    first bar. Returns {name: (symbols x bars) array}.
+    """
+    closes = np.asarray(closes, dtype=np.float64)
+    sma_bb = rolling_sma(closes, bb_period)
+    std_bb = rolling_std(closes, bb_period)
+    middle = np.where(std_bb > 0, sma_bb, np.nan)
+    values = {
+        'current_price': closes,
+        'sma20': rolling_sma(closes, 20),
+        'sma90': rolling_sma(closes, 90),
+        'rsi': rolling_rsi(closes, 14),
+        'volatility': rolling_volatility(closes, 30),
+        'momentum': rolling_momentum(closes, 90),
+        'bb_upper': middle + num_std * std_bb,
+        'bb_middle': middle,
+        'bb_lower': middle - num_std * std_bb,
+    }
+
+    # Live indicators need INDICATOR_BARS of history before they exist
+    history = np.cumsum(np.isfinite(closes), axis=1)
+    warm = history >= INDICATOR_BARS
+    return {name: np.where(warm, array, np.nan) for name, array in values.items()}
+
+# Single-symbol API
+#
+# Prices are lists ordered newest first, i.e. a row of
+# price_loader.load_price_histories reversed.
+
+def _as_matrix(prices):
+    return np.asarray(prices, dtype=np.float64)[::-1].reshape(1, -1)
+
+def _scalar(values):
+    value = values[0]
+    return float(value) if np.isfinite(value) else None
+
 def calculate_sma(prices, period=20):
     """Calculate Simple Moving Average"""
-    if len(prices) < period:
-        return None
-    return sum(prices[:period]) / period
+    return _scalar(sma(_as_matrix(prices), period))
 
 def calculate_std_dev(prices, mean, period=20):
     """Calculate standard deviation"""
-    if len(prices) < period:
-        return None
-    variance = sum((p - mean) ** 2 for p in prices[:period]) / period
-    return math.sqrt(variance)
+    return _scalar(std_dev(_as_matrix(prices), period, np.array([mean], dtype=np.float64)))
 
 def calculate_bollinger_bands(prices, period=20, num_std=2):
     """Calculate Bollinger Bands"""
-    sma = calculate_sma(prices, period)
-    if not sma:
+    upper, middle, lower = bollinger_bands(_as_matrix(prices), period, num_std)
+    if not np.isfinite(upper[0]):
         return None, None, None
-    
-    std = calculate_std_dev(prices, sma, period)
-    if not std:
-        return None, None, None
-    
-    upper = sma + (num_std * std)
-    lower = sma - (num_std * std)
-    return upper, sma, lower
+    return float(upper[0]), float(middle[0]), float(lower[0])
 
 def calculate_rsi(prices, period=14):
     """Calculate Relative Strength Index"""
-    if len(prices) < period + 1:
-        return None
-    
-    gains = []
-    losses = []
-    
-    for i in range(1, period + 1):
-        change = prices[i] - prices[i-1]
-        if change > 0:
-            gains.append(change)
-            losses.append(0)
-        else:
-            gains.append(0)
-            losses.append(abs(change))
-    
-    avg_gain = sum(gains) / period
-    avg_loss = sum(losses) / period
-    
-    if avg_loss == 0:
-        return 100 if avg_gain > 0 else 50
-    
-    rs = avg_gain / avg_loss
-    rsi = 100 - (100 / (1 + rs))
-    return rsi
+    return _scalar(rsi(_as_matrix(prices), period))
 
 def calculate_volatility(prices, period=30):
     """Calculate realized volatility"""
-    if len(prices) < period + 1:
-        return None
-    
-    returns = []
-    for i in range(1, period + 1):
-        ret = (prices[i] - prices[i-1]) / prices[i-1]
-        returns.append(ret)
-    
-    mean_ret = sum(returns) / len(returns)
-    variance = sum((r - mean_ret) ** 2 for r in returns) / len(returns)
-    volatility = math.sqrt(variance)
-    return volatility
+    return _scalar(volatility(_as_matrix(prices), period))
 
 def calculate_momentum(prices, period=90):
     """Calculate 90-day momentum"""
-    if len(prices) < period + 1:
-        return None
-    
-    current = prices[0]
-    past = prices[period]
-    momentum = (current - past) / past * 100
-    return momentum
+    return _scalar(momentum(_as_matrix(prices), period))
 
 def calculate_all_indicators(prices):
     """Calculate all technical indicators for a price series"""
-    if not prices or len(prices) < 100:
-        return None
-    
-    try:
-        indicators = {
-            'current_price': prices[0],
-            'sma20': calculate_sma(prices, 20),
-            'sma90': calculate_sma(prices, 90),
-            'rsi': calculate_rsi(prices, 14),
-            'volatility': calculate_volatility(prices, 30),
-            'momentum': calculate_momentum(prices, 90),
-        }
-        
-        upper, middle, lower = calculate_bollinger_bands(prices, 20, 2)
-        indicators['bb_upper'] = upper
-        indicators['bb_middle'] = middle
-        indicators['bb_lower'] = lower
-        
-        # Filter out None values
-        return {k: v for k, v in indicators.items() if v is not None}
-    except Exception as e:
-        logger.error(f"Indicator calculation error: {e}")
+    if not prices or len(prices) < INDICATOR_BARS:
         return None
+
+    return calculate_indicators_batch(['_'], _as_matrix(prices)).get('_')
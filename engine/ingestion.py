@@ -3,10 +3,14 @@ from datetime import datetime
 from uuid import uuid4
 from api_client import client
 from database import db
-from config import SYMBOLS
+from bar_store import bar_store
+from dashboard_cache import mark_dashboard_dirty
+from metrics import stage
+from config import SYMBOLS, BAR_STORE_WRITE
 
 logger = logging.getLogger(__name__)
 
+@stage('ingest', items=lambda result: result['records'])
 def ingest_market_data():
     """Fetch latest prices and store in database"""
     run_id = f"INGEST-{datetime.utcnow().isoformat()}-{uuid4().hex[:8]}"
@@ -14,41 +18,45 @@ def ingest_market_data():
     
     logger.info(f"Starting market data ingestion: {run_id}")
     
-    inserted = 0
+    quotes = []
     errors = []
     
-    for symbol in SYMBOLS:
-        try:
-            logger.info(f"Fetching {symbol}...")
-            quote = client.get_quote(symbol)
-            
-            if not quote or quote['close'] == 0:
-                logger.warning(f"Invalid quote for {symbol}")
-                continue
-            
-            query = """
-            INSERT OR REPLACE INTO market_prices (symbol, timestamp, close, open, high, low, volume, ingestion_run_id)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """
-            
-            params = (
-                quote['symbol'],
-                timestamp,
-                quote['close'],
-                quote['open'],
-                quote['high'],
-                quote['low'],
-                quote['volume'],
-                run_id
-            )
-            
-            db.execute(query, params)
-            inserted += 1
-            logger.info(f"Inserted {symbol}: ${quote['close']}")
-        except Exception as e:
-            error_msg = f"{symbol}: {str(e)}"
+    # Quotes come from the cache, bulk calls or concurrent single calls and
+    # arrive as they complete; the client's shared rate limiter keeps the
+    # requests within the provider quota
+    for symbol, quote, error in client.get_batch_quotes(SYMBOLS):
+        if error is not None:
+            error_msg = f"{symbol}: {str(error)}"
             logger.error(error_msg)
             errors.append(error_msg)
+            continue
+        
+        if not quote or quote['close'] == 0:
+            logger.warning(f"Invalid quote for {symbol}")
+            continue
+        
+        logger.info(f"Fetched {symbol}: ${quote['close']}")
+        quotes.append(quote)
+    
+    query = """
+    INSERT OR REPLACE INTO market_prices (symbol, timestamp, close, open, high, low, volume, ingestion_run_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """
+    
+    rows = [
+        (
+            quote['symbol'],
+            timestamp,
+            quote['close'],
+            quote['open'],
+            quote['high'],
+            quote['low'],
+            quote['volume'],
+            run_id
+        )
+        for quote in quotes
+    ]
+    inserted = len(rows)
     
     # Log ingestion status
     status = "success" if errors == [] else "partial"
@@ -58,7 +66,20 @@ def ingest_market_data():
     INSERT INTO ingestion_logs (run_id, timestamp, status, records_inserted, error_message)
     VALUES (?, ?, ?, ?, ?)
     """
-    db.execute(log_query, (run_id, datetime.utcnow(), status, inserted, error_msg))
+    
+    # Write the whole tick as one unit of work, after all API calls are done,
+    # so the write lock is never held across network round-trips
+    with db.transaction():
+        db.execute_many(query, rows)
+        db.execute(log_query, (run_id, datetime.utcnow(), status, inserted, error_msg))
+    mark_dashboard_dirty()
+    
+    # market_prices stays the source of truth; a failed append is repaired by main.py bars
+    if BAR_STORE_WRITE:
+        try:
+            bar_store.write_rows(rows)
+        except Exception as e:
+            logger.error(f"Bar store append failed: {e}")
     
     logger.info(f"Ingestion complete: {inserted} records inserted")
     return {'run_id': run_id, 'status': status, 'records': inserted, 'errors': errors}
@@ -0,0 +1,143 @@
+import logging
+from database import db
+from config import LEDGER_METHOD
+
+logger = logging.getLogger(__name__)
+
+TOTALS_QUERY = """
+INSERT INTO realized_pnl (symbol, strategy_type, realized_pnl, closed_quantity, closing_trades, winning_trades, updated_at)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(symbol, strategy_type) DO UPDATE SET
+    realized_pnl = realized_pnl + excluded.realized_pnl,
+    closed_quantity = closed_quantity + excluded.closed_quantity,
+    closing_trades = closing_trades + excluded.closing_trades,
+    winning_trades = winning_trades + excluded.winning_trades,
+    updated_at = excluded.updated_at
+"""
+
+def match_lots(lots, quantity, price, trade_id, timestamp, method=LEDGER_METHOD):
+    """Apply one fill to the open lots of a (symbol, strategy).
+
+    lots: [[trade_id, quantity, price, opened_at]], oldest first, all on
+    the same side (shorts are negative). quantity is signed (BUY > 0).
+    A fill against the open side closes lots first-in first-out (with
+    'average' there is only ever one lot, at the average cost); whatever
+    is left opens a new lot. Returns (lots, realized_pnl, closed_quantity).
+    """
+    lots = [list(lot) for lot in lots]
+    realized = 0.0
+    closed = 0
+    remaining = quantity
+    while remaining and lots and (lots[0][1] > 0) != (remaining > 0):
+        lot = lots[0]
+        size = min(abs(remaining), abs(lot[1]))
+        direction = 1 if lot[1] > 0 else -1
+        realized += (price - lot[2]) * size * direction
+        closed += size
+        lot[1] -= size * direction
+        remaining += size * direction
+        if lot[1] == 0:
+            lots.pop(0)
+
+    if remaining:
+        if method == 'average' and lots:
+            lot = lots[0]
+            total = lot[1] + remaining
+            lot[2] = (lot[2] * lot[1] + price * remaining) / total
+            lot[1] = total
+        else:
+            lots.append([trade_id, remaining, price, timestamp])
+    return lots, realized, closed
+
+class LotLedger:
+    """Open lots and running realized PnL per (symbol, strategy).
+
+    trade_log is the source of truth: sync() applies the fills logged
+    since the last sync, once each, so realized PnL never depends on how
+    much history is kept around. Lots live in position_lots, totals in
+    realized_pnl, and the closing fill's PnL is written to trade_log.pnl.
+    A database that predates the ledger is replayed on its first sync.
+    """
+
+    def __init__(self, method=LEDGER_METHOD):
+        if method not in ('fifo', 'average'):
+            raise ValueError(f"Unknown lot matching method: {method}")
+        self.method = method
+
+    def _load_lots(self, key):
+        rows = db.fetch_rows(
+            "SELECT trade_id, quantity, price, opened_at FROM position_lots "
+            "WHERE symbol = ? AND strategy_type = ? ORDER BY trade_id",
+            key
+        )
+        return [list(row) for row in rows]
+
+    def sync(self):
+        """Apply new trade_log fills; returns the number applied"""
+        with db.transaction():
+            rows = db.execute("SELECT last_trade_id FROM ledger_state WHERE id = 1")
+            last = rows[0]['last_trade_id'] if rows else 0
+            trades = db.execute(
+                "SELECT id, symbol, side, quantity, price, strategy_type, timestamp FROM trade_log "
+                "WHERE id > ? ORDER BY id",
+                (last,)
+            )
+            if not trades:
+                return 0
+
+            lots = {}
+            totals = {}
+            pnl_rows = []
+            for trade in trades:
+                key = (trade['symbol'], trade['strategy_type'] or 'unknown')
+                if key not in lots:
+                    lots[key] = self._load_lots(key)
+                quantity = trade['quantity'] if trade['side'] == 'BUY' else -trade['quantity']
+                lots[key], realized, closed = match_lots(
+                    lots[key], quantity, trade['price'], trade['id'], trade['timestamp'], self.method
+                )
+                if closed:
+                    total = totals.setdefault(key, [0.0, 0, 0, 0])
+                    total[0] += realized
+                    total[1] += closed
+                    total[2] += 1
+                    total[3] += realized > 0
+                    pnl_rows.append((realized, trade['id']))
+
+            db.execute_many(
+                "DELETE FROM position_lots WHERE symbol = ? AND strategy_type = ?", list(lots)
+            )
+            db.execute_many(
+                "INSERT INTO position_lots (symbol, strategy_type, trade_id, quantity, price, opened_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [key + tuple(lot) for key, key_lots in lots.items() for lot in key_lots]
+            )
+            updated_at = trades[-1]['timestamp']
+            db.execute_many(TOTALS_QUERY, [key + tuple(total) + (updated_at,) for key, total in totals.items()])
+            db.execute_many("UPDATE trade_log SET pnl = ? WHERE id = ?", pnl_rows)
+            db.execute(
+                "INSERT OR REPLACE INTO ledger_state (id, last_trade_id) VALUES (1, ?)", (trades[-1]['id'],)
+            )
+
+        if last == 0 and len(trades) > 1:
+            logger.info(f"Lot ledger built from {len(trades)} logged trades")
+        return len(trades)
+
+    def totals(self):
+        """Realized PnL, closing trades and winners, overall and per strategy"""
+        rows = db.execute("""
+            SELECT strategy_type, SUM(realized_pnl) AS realized_pnl,
+                   SUM(closing_trades) AS closing_trades, SUM(winning_trades) AS winning_trades
+            FROM realized_pnl
+            GROUP BY strategy_type
+        """)
+        by_strategy = {row['strategy_type']: row for row in rows}
+        return {
+            'realized_pnl': sum(row['realized_pnl'] for row in rows),
+            'closing_trades': sum(row['closing_trades'] for row in rows),
+            'winning_trades': sum(row['winning_trades'] for row in rows),
+            'by_strategy': by_strategy,
+        }
+
+# Global ledger
+ledger = LotLedger()
@@ -1,12 +1,22 @@
 #!/usr/bin/env python3
 import sys
+import signal
 import logging
 from datetime import datetime
 from database import db
 from ingestion import ingest_market_data
 from signal_generator import generate_signals
 from executor import execute_trades
+from pairs import refresh_pair_candidates
 from portfolio import calculate_portfolio_metrics
+from backfill import backfill_history
+from bar_store import bar_store
+from compaction import compact_market_prices
+from backtest import run_backtest
+from sweep import run_sweep, top_results
+from scheduler import Scheduler, Job
+from config import SCHEDULE, SYMBOLS, PAIR_DISCOVERY
+import metrics
 
 # Setup logging
 logging.basicConfig(
@@ -49,6 +59,19 @@ def run_signal_generation():
         logger.error(f"✗ Signal generation failed: {e}")
         return False
 
+def run_pair_discovery():
+    """Rescan the universe for cointegrated pairs"""
+    logger.info("=" * 80)
+    logger.info("Pair Discovery")
+    logger.info("=" * 80)
+    try:
+        candidates = refresh_pair_candidates(SYMBOLS)
+        logger.info(f"✓ Pair discovery complete: {len(candidates)} candidates")
+        return True
+    except Exception as e:
+        logger.error(f"✗ Pair discovery failed: {e}")
+        return False
+
 def run_trade_execution():
     """Run trade execution workflow"""
     logger.info("=" * 80)
@@ -78,6 +101,99 @@ def run_portfolio_aggregation():
         logger.error(f"✗ Portfolio aggregation failed: {e}")
         return False
 
+def run_backfill(symbols=None):
+    """Run historical backfill workflow"""
+    logger.info("=" * 80)
+    logger.info("Historical Backfill")
+    logger.info("=" * 80)
+    try:
+        result = backfill_history(symbols)
+        logger.info(f"✓ Backfill complete: {result['records']} bars, {result['symbols']} symbols, {result['skipped']} skipped")
+        if result['errors']:
+            logger.info(f"  {len(result['errors'])} symbols failed; rerun to resume them")
+        return not result['errors']
+    except Exception as e:
+        logger.error(f"✗ Backfill failed: {e}")
+        return False
+
+def run_compaction():
+    """Roll up and downsample old market data"""
+    logger.info("=" * 80)
+    logger.info("Market Data Compaction")
+    logger.info("=" * 80)
+    try:
+        result = compact_market_prices()
+        logger.info(f"✓ Compaction complete: {result['days']} days, {result['removed']} quotes removed")
+        if result['archive']:
+            logger.info(f"  Raw quotes archived to {result['archive']}")
+        return True
+    except Exception as e:
+        logger.error(f"✗ Compaction failed: {e}")
+        return False
+
+def run_bar_store_export(symbols=None):
+    """Rebuild the columnar bar store from market_prices"""
+    logger.info("=" * 80)
+    logger.info("Bar Store Export")
+    logger.info("=" * 80)
+    try:
+        total = bar_store.export_from_database(symbols)
+        logger.info(f"✓ Bar store export complete: {total} bars")
+        return True
+    except Exception as e:
+        logger.error(f"✗ Bar store export failed: {e}")
+        return False
+
+def run_backtest_workflow(symbols=None):
+    """Backtest the strategies over stored history"""
+    logger.info("=" * 80)
+    logger.info("Backtest")
+    logger.info("=" * 80)
+    try:
+        stats = run_backtest(symbols)
+        logger.info(f"✓ Backtest complete")
+        for name, value in stats.items():
+            logger.info(f"  {name}: {value:.2f}")
+        return True
+    except Exception as e:
+        logger.error(f"✗ Backtest failed: {e}")
+        return False
+
+def run_sweep_workflow():
+    """Backtest every configuration of config.SWEEP_GRID in parallel"""
+    logger.info("=" * 80)
+    logger.info("Parameter Sweep")
+    logger.info("=" * 80)
+    try:
+        result = run_sweep()
+        logger.info(f"✓ Sweep {result['sweep_id']} complete: {result['completed']} configurations, {result['failed']} failed")
+        for row in top_results(result['sweep_id'], 5):
+            logger.info(f"  Sharpe {row['sharpe_ratio']:.2f} | return {row['total_return']:.2f}% | {row['params']}")
+        return not result['failed']
+    except Exception as e:
+        logger.error(f"✗ Sweep failed: {e}")
+        return False
+
+def run_daemon(run_now=False):
+    """Run every workflow on its own cadence in one resident process"""
+    logger.info("=" * 80)
+    logger.info(f"TRADING ENGINE DAEMON STARTED - {datetime.utcnow().isoformat()}")
+    logger.info("=" * 80)
+    scheduler = Scheduler([
+        Job('ingest', run_market_data_ingestion, SCHEDULE['ingest']),
+        Job('signals', run_signal_generation, SCHEDULE['signals'], after='ingest'),
+        *([Job('pairs', run_pair_discovery, SCHEDULE['pairs'], after='ingest')] if PAIR_DISCOVERY else []),
+        Job('execute', run_trade_execution, SCHEDULE['execute'], after='signals'),
+        Job('portfolio', run_portfolio_aggregation, SCHEDULE['portfolio'], after='execute'),
+        Job('compact', run_compaction, SCHEDULE['compact']),
+    ])
+    # Finish the running stages before exiting on Ctrl-C / SIGTERM
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: scheduler.stop())
+    scheduler.run(run_now)
+    logger.info("✓ Daemon stopped")
+    return True
+
 def initialize_system():
     """Initialize database and tables"""
     logger.info("Initializing trading engine database...")
@@ -111,6 +227,8 @@ def run_all():
     return success
 
 if __name__ == "__main__":
+    # Each command reports its metrics under its own name (see metrics.py)
+    metrics.set_process(sys.argv[1] if len(sys.argv) > 1 else "all")
     if len(sys.argv) > 1:
         command = sys.argv[1]
         if command == "init":
@@ -119,14 +237,28 @@ if __name__ == "__main__":
             run_market_data_ingestion()
         elif command == "signals":
             run_signal_generation()
+        elif command == "pairs":
+            run_pair_discovery()
         elif command == "execute":
             run_trade_execution()
         elif command == "portfolio":
             run_portfolio_aggregation()
+        elif command == "backfill":
+            run_backfill(sys.argv[2:] or None)
+        elif command == "compact":
+            run_compaction()
+        elif command == "bars":
+            run_bar_store_export(sys.argv[2:] or None)
+        elif command == "backtest":
+            run_backtest_workflow(sys.argv[2:] or None)
+        elif command == "sweep":
+            run_sweep_workflow()
+        elif command == "daemon":
+            run_daemon("--now" in sys.argv[2:])
         elif command == "all":
             run_all()
         else:
             print(f"Unknown command: {command}")
-            print("Usage: python main.py [init|ingest|signals|execute|portfolio|all]")
+            print("Usage: python main.py [init|ingest|signals|execute|portfolio|all|backfill [SYMBOL ...]|compact|bars [SYMBOL ...]|backtest [SYMBOL ...]|sweep|daemon [--now]]")
     else:
         run_all()
@@ -0,0 +1,211 @@
+import os
+import json
+import time
+import cProfile
+import logging
+import tempfile
+import threading
+from datetime import datetime
+from functools import wraps
+from config import METRICS_DIR, PROFILE_DIR, PROFILE_STAGES
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds; covers sub-millisecond queries up to slow backfills
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+
+METRICS = {
+    'trading_stage_duration_seconds': ('histogram', 'Wall time of a pipeline stage'),
+    'trading_stage_runs_total': ('counter', 'Pipeline stage runs by outcome'),
+    'trading_stage_items_total': ('counter', 'Records, signals, trades or positions handled by a stage'),
+    'trading_stage_last_run_timestamp_seconds': ('gauge', 'Unix time a stage last finished'),
+    'trading_db_queries_total': ('counter', 'SQL statements executed'),
+    'trading_db_query_duration_seconds': ('histogram', 'SQL statement latency'),
+    'trading_db_rows_total': ('counter', 'Rows returned or affected by SQL statements'),
+    'trading_api_requests_total': ('counter', 'Alpha Vantage HTTP requests (each counts against the quota)'),
+    'trading_api_request_duration_seconds': ('histogram', 'Alpha Vantage request latency'),
+    'trading_api_cache_lookups_total': ('counter', 'API response cache lookups by result'),
+    'trading_risk_orders_total': ('counter', 'Opening orders by pre-trade risk check result'),
+}
+
+def _key(labels):
+    return tuple(sorted(labels.items()))
+
+class Registry:
+    """In-process counters, gauges and histograms.
+
+    Series are keyed by metric name plus a sorted label tuple. Updates
+    take one lock and a dict lookup, cheap enough for every SQL statement.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}  # (name, labels) -> float, for counters and gauges
+        self.histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _key(labels))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.values[(name, _key(labels))] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, _key(labels))
+        with self.lock:
+            series = self.histograms.get(key)
+            if series is None:
+                series = self.histograms[key] = [0] * (len(DEFAULT_BUCKETS) + 2)
+            for i, bound in enumerate(DEFAULT_BUCKETS):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def snapshot(self):
+        """JSON-serializable copy of every series"""
+        with self.lock:
+            return {
+                'values': [[name, dict(labels), value] for (name, labels), value in self.values.items()],
+                'histograms': [[name, dict(labels), list(series)] for (name, labels), series in self.histograms.items()],
+            }
+
+    def restore(self, snapshot):
+        """Continue counting from a previous snapshot of this process"""
+        with self.lock:
+            for name, labels, value in snapshot.get('values', []):
+                self.values[(name, _key(labels))] = value
+            for name, labels, series in snapshot.get('histograms', []):
+                if len(series) == len(DEFAULT_BUCKETS) + 2:
+                    self.histograms[(name, _key(labels))] = list(series)
+
+# Global registry and the name this process reports under
+registry = Registry()
+process_name = 'engine'
+
+def _snapshot_path(name):
+    return METRICS_DIR / f"{name}.json"
+
+def set_process(name):
+    """Name this process in exported metrics and resume its counters.
+
+    Cron starts a fresh process per workflow; restoring the last snapshot
+    keeps counters monotonic across runs, as Prometheus expects.
+    """
+    global process_name
+    process_name = name
+    try:
+        with open(_snapshot_path(name)) as f:
+            registry.restore(json.load(f))
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable metrics snapshot for {name}: {e}")
+
+def write_snapshot():
+    """Persist this process's metrics for the server's /metrics endpoint"""
+    METRICS_DIR.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=METRICS_DIR, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(registry.snapshot(), f)
+        os.replace(tmp_path, _snapshot_path(process_name))
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+def _profiling(name):
+    return 'all' in PROFILE_STAGES or name in PROFILE_STAGES
+
+def stage(name, items=None):
+    """Instrument a pipeline stage.
+
+    Records duration, outcome and items(result) handled, then writes the
+    metrics snapshot. When the stage is listed in PROFILE_STAGES the run
+    is also profiled with cProfile and dumped to PROFILE_DIR.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = cProfile.Profile() if _profiling(name) else None
+            start = time.perf_counter()
+            status = 'error'
+            try:
+                if profiler is not None:
+                    result = profiler.runcall(func, *args, **kwargs)
+                else:
+                    result = func(*args, **kwargs)
+                status = 'success'
+                if items is not None:
+                    registry.inc('trading_stage_items_total', items(result), stage=name)
+                return result
+            finally:
+                registry.observe('trading_stage_duration_seconds', time.perf_counter() - start, stage=name)
+                registry.inc('trading_stage_runs_total', stage=name, status=status)
+                registry.set('trading_stage_last_run_timestamp_seconds', time.time(), stage=name)
+                if profiler is not None:
+                    _dump_profile(profiler, name)
+                try:
+                    write_snapshot()
+                except OSError as e:
+                    logger.warning(f"Could not write metrics snapshot: {e}")
+        return wrapper
+    return decorator
+
+def _dump_profile(profiler, name):
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    path = PROFILE_DIR / f"{name}-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.prof"
+    profiler.dump_stats(path)
+    logger.info(f"Profile written to {path} (inspect with python -m pstats)")
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in sorted(labels.items())) + '}'
+
+def render(snapshots):
+    """Prometheus text exposition of {process: snapshot}.
+
+    Series from every process are grouped under one HELP/TYPE header per
+    metric and told apart by a process label.
+    """
+    values = {}
+    histograms = {}
+    for process, snapshot in snapshots.items():
+        for name, labels, value in snapshot.get('values', []):
+            values.setdefault(name, []).append(({**labels, 'process': process}, value))
+        for name, labels, series in snapshot.get('histograms', []):
+            histograms.setdefault(name, []).append(({**labels, 'process': process}, series))
+
+    lines = []
+    for name, (kind, text) in METRICS.items():
+        if name not in values and name not in histograms:
+            continue
+        lines.append(f"# HELP {name} {text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in values.get(name, []):
+            lines.append(f"{name}{_labels(labels)} {value}")
+        for labels, series in histograms.get(name, []):
+            for bound, count in zip(DEFAULT_BUCKETS, series):
+                lines.append(f"{name}_bucket{_labels({**labels, 'le': bound})} {count}")
+            lines.append(f"{name}_bucket{_labels({**labels, 'le': '+Inf'})} {series[-1]}")
+            lines.append(f"{name}_sum{_labels(labels)} {series[-2]}")
+            lines.append(f"{name}_count{_labels(labels)} {series[-1]}")
+    return '\n'.join(lines) + '\n'
+
+def collect():
+    """Metrics of this process plus the latest snapshot of every other one"""
+    snapshots = {}
+    for path in sorted(METRICS_DIR.glob('*.json')):
+        try:
+            with open(path) as f:
+                snapshots[path.stem] = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable metrics snapshot {path}: {e}")
+    snapshots[process_name] = registry.snapshot()
+    return render(snapshots)
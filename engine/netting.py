@@ -0,0 +1,146 @@
+from config import NET_ACROSS_STRATEGIES
+
+# Netting turns the latest signal of every (symbol, strategy) into orders
+# the executor can place:
+#
+# 1. Pair signals "y/x" are split into one leg per symbol: long the spread
+#    is long y and short hedge_ratio times as much x.
+# 2. Legs of one strategy on the same symbol (a symbol in several pairs)
+#    are summed, so every (symbol, strategy) holds at most one position.
+# 3. With NET_ACROSS_STRATEGIES the single-symbol strategies' exposures on
+#    a symbol are summed into a single net target. Strategies on the losing
+#    side of a disagreement get signal 0 (and close), the others share the
+#    net target pro rata, so their opposite positions never sit side by
+#    side. Pair legs are left out of this: a pair is one hedged bet, and
+#    closing or shrinking one leg would leave the other naked. The book's
+#    net exposure per symbol is the same sum of all exposures either way.
+#
+# Exposure is signal * signal_strength * size_scale, the factor plan_trades
+# multiplies into capital_per_trade; the netted size is written back as
+# size_scale, keeping each strategy's signal_strength.
+
+def _sign(value):
+    return (value > 0) - (value < 0)
+
+def signal_legs(signals):
+    """Yield (symbol, strategy, exposure, signal, paired) for every leg of signals.
+
+    signals: {(symbol, strategy): signal}; paired marks the legs of pair
+    signals. Legs of zero signals carry exposure 0 so that their
+    positions can still be closed.
+    """
+    for (symbol, strategy), signal in signals.items():
+        exposure = (
+            signal.get('signal', 0) * signal.get('signal_strength', 0) * signal.get('size_scale', 1.0)
+        )
+        if '/' in symbol:
+            y, x = symbol.split('/', 1)
+            hedge_ratio = signal.get('hedge_ratio')
+            yield y, strategy, exposure, signal, True
+            yield x, strategy, -exposure * (1.0 if hedge_ratio is None else hedge_ratio), signal, True
+        else:
+            yield symbol, strategy, exposure, signal, False
+
+def net_signals(signals, across_strategies=NET_ACROSS_STRATEGIES):
+    """Net signals into one signal per tradable (symbol, strategy).
+
+    Returns (netted, targets): netted is {(symbol, strategy): signal} for
+    plan_trades, with the leg's symbol, the net direction as 'signal' and
+    the net size as 'size_scale'; targets is {symbol: net exposure}
+    summed over strategies, pair legs included.
+    """
+    exposures = {}
+    sources = {}
+    paired = set()
+    for symbol, strategy, exposure, signal, pair_leg in signal_legs(signals):
+        key = (symbol, strategy)
+        current = sources.get(key)
+        if current is None:
+            exposures[key] = exposure
+            sources[key] = (abs(exposure), signal)
+        else:
+            exposures[key] += exposure
+            # The leg with the largest exposure lends its fields to the netted signal
+            if abs(exposure) > current[0]:
+                sources[key] = (abs(exposure), signal)
+        if pair_leg:
+            paired.add(key)
+
+    targets = {}
+    singles = {}
+    for (symbol, strategy), exposure in exposures.items():
+        targets[symbol] = targets.get(symbol, 0.0) + exposure
+        if (symbol, strategy) not in paired:
+            singles[symbol] = singles.get(symbol, 0.0) + exposure
+    agreeing = {}
+    for key, exposure in exposures.items():
+        if key not in paired and exposure * singles[key[0]] > 0:
+            agreeing[key[0]] = agreeing.get(key[0], 0.0) + exposure
+
+    netted = {}
+    for key, exposure in exposures.items():
+        if across_strategies and key not in paired:
+            target = singles[key[0]]
+            exposure = exposure * target / agreeing[key[0]] if exposure * target > 0 else 0.0
+        signal = sources[key][1]
+        strength = signal.get('signal_strength', 0)
+        netted[key] = {
+            **signal,
+            'symbol': key[0],
+            'strategy_type': key[1],
+            'signal': _sign(exposure),
+            'size_scale': abs(exposure) / strength if strength else 0.0,
+        }
+    return netted, targets
+
+def _leg_symbols(symbol):
+    return symbol.split('/', 1) if '/' in symbol else (symbol,)
+
+def _netting_fields(signal):
+    return (
+        signal.get('signal', 0), signal.get('signal_strength', 0), signal.get('size_scale', 1.0),
+        signal.get('hedge_ratio'),
+    )
+
+class SignalNetter:
+    """net_signals over a stream of latest signals, updated per symbol.
+
+    Netting a symbol only involves the signals with a leg on it, so when
+    a batch of signals arrives only the symbols they touch are netted
+    again, from every signal on those symbols; the rest of the result is
+    kept. Signals whose sizing fields did not change touch nothing, so
+    the cost follows the signals that changed, not the universe. Fields
+    other than signal, signal_strength, size_scale and hedge_ratio of a
+    netted signal may therefore come from an earlier signal of its key.
+    """
+
+    def __init__(self, across_strategies=NET_ACROSS_STRATEGIES):
+        self.across_strategies = across_strategies
+        self.signals = {}
+        self.fields = {}
+        self.by_symbol = {}
+        self.netted = {}
+        self.targets = {}
+
+    def update(self, changes):
+        """Apply {(symbol, strategy): signal}; returns (netted, targets) like net_signals"""
+        touched = set()
+        for key, signal in changes.items():
+            self.signals[key] = signal
+            fields = _netting_fields(signal)
+            if self.fields.get(key) == fields:
+                continue
+            if key not in self.fields:
+                for symbol in _leg_symbols(key[0]):
+                    self.by_symbol.setdefault(symbol, []).append(key)
+            self.fields[key] = fields
+            touched.update(_leg_symbols(key[0]))
+        if touched:
+            affected = {key: self.signals[key] for symbol in touched for key in self.by_symbol[symbol]}
+            netted, targets = net_signals(affected, self.across_strategies)
+            for key, signal in netted.items():
+                if key[0] in touched:
+                    self.netted[key] = signal
+            for symbol in touched:
+                self.targets[symbol] = targets[symbol]
+        return self.netted, self.targets
@@ -0,0 +1,357 @@
+import os
+import tempfile
+import logging
+import numpy as np
+from price_loader import load_price_histories, load_price_matrix, forward_fill
+from config import (
+    RISK_PER_TRADE, OPTIMIZER, OPTIMIZER_LOOKBACK, OPTIMIZER_TURNOVER_PENALTY, OPTIMIZER_MAX_SCALE,
+    COVARIANCE_CACHE_PATH,
+)
+
+logger = logging.getLogger(__name__)
+
+# Signals are sized jointly in symbol space. Every signal is a bet with
+# loadings on one symbol, or on two for a pair "y/x" (long y, short
+# hedge_ratio x). The exposure the executor takes for each signal on its
+# own (signal_strength * RISK_PER_TRADE of capital per leg, times the
+# hedge ratio on a pair's x leg) gives the naive net exposure per symbol,
+# as a fraction of capital; the optimizer turns that into target exposures
+# that account for correlation, and each signal's size is scaled by the
+# ratio of target to naive exposure of its symbols.
+
+class ReturnCovariance:
+    """Rolling covariance of return vectors with O(N^2) updates per bar.
+
+    RollingWindow for vectors: a ring buffer of the last window return
+    vectors with their running sum and sum of outer products, rebuilt
+    from the buffer whenever the ring wraps. The Ledoit-Wolf shrinkage
+    intensity needs only those sums and one pass over the buffer, so an
+    estimate costs O(N^2 + window * N), never O(window * N^2).
+    """
+
+    def __init__(self, n, window=OPTIMIZER_LOOKBACK):
+        self.buffer = np.zeros((window, n))
+        self.pos = 0
+        self.count = 0
+        self.total = np.zeros(n)
+        self.cross = np.zeros((n, n))
+
+    @property
+    def window(self):
+        return len(self.buffer)
+
+    def push(self, returns):
+        """Add return vectors (bars x n), oldest first"""
+        returns = np.asarray(returns, dtype=np.float64)[-self.window:]
+        k = len(returns)
+        if k == 0:
+            return
+        rows = (self.pos + np.arange(k)) % self.window
+        # Unfilled rows are zero, so removing them is a no-op
+        old = self.buffer[rows]
+        self.total += returns.sum(axis=0) - old.sum(axis=0)
+        self.cross += returns.T @ returns - old.T @ old
+        self.buffer[rows] = returns
+        self.count = min(self.count + k, self.window)
+        wrapped = self.pos + k >= self.window
+        self.pos = (self.pos + k) % self.window
+        if wrapped:
+            self.total = self.buffer.sum(axis=0)
+            self.cross = self.buffer.T @ self.buffer
+
+    def estimate(self):
+        """Ledoit-Wolf estimate shrunk towards a scaled identity.
+
+        Returns (covariance, shrinkage); shrinkage is the weight on the
+        identity target, in [0, 1].
+        """
+        n_bars, n = self.count, len(self.total)
+        mean = self.total / n_bars
+        sample = self.cross / n_bars - np.outer(mean, mean)
+        centered = self.buffer[:n_bars] - mean
+
+        # sum_t ||y_t y_t' - S||^2 = sum_t ||y_t||^4 - T ||S||^2 for centered y
+        norms = np.einsum('ij,ij->i', centered, centered)
+        frobenius = np.einsum('ij,ij->', sample, sample)
+        spread = (norms ** 2).mean() - frobenius
+        mu = np.trace(sample) / n
+        distance = frobenius - n * mu * mu
+        shrinkage = min(max(spread / n_bars, 0.0), distance) / distance if distance > 0 else 1.0
+
+        covariance = sample * (1 - shrinkage)
+        covariance[np.diag_indices(n)] += shrinkage * mu
+        return covariance, shrinkage
+
+    def to_arrays(self):
+        return {
+            'buffer': self.buffer, 'pos': self.pos, 'count': self.count,
+            'total': self.total, 'cross': self.cross,
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        covariance = cls(*reversed(arrays['buffer'].shape))
+        covariance.buffer = arrays['buffer']
+        covariance.pos = int(arrays['pos'])
+        covariance.count = int(arrays['count'])
+        covariance.total = arrays['total']
+        covariance.cross = arrays['cross']
+        return covariance
+
+def risk_parity(covariance, budgets, tolerance=1e-8, max_iterations=100):
+    """Positive weights whose risk contributions w_i (C w)_i are proportional to budgets.
+
+    Minimizes the convex w'Cw / 2 - sum(b log w) with b = budgets /
+    sum(budgets), whose optimum is the risk parity portfolio with
+    w'Cw = 1, by Newton steps with a backtracking line search. Each step
+    first stops short of the boundary, so weights stay positive however
+    dispersed the budgets are.
+    """
+    budgets = budgets / budgets.sum()
+
+    def objective(w):
+        return 0.5 * (w @ covariance @ w) - budgets @ np.log(w)
+
+    # Start from the uncorrelated solution, scaled to unit variance
+    weights = np.sqrt(budgets / np.diag(covariance))
+    weights /= np.sqrt(weights @ covariance @ weights)
+    value = objective(weights)
+    for _ in range(max_iterations):
+        marginal = covariance @ weights
+        # Optimality: every risk contribution equals its budget
+        if np.abs(weights * marginal / budgets - 1).max() < tolerance:
+            break
+        gradient = marginal - budgets / weights
+        hessian = covariance + np.diag(budgets / weights ** 2)
+        step = np.linalg.solve(hessian, gradient)
+        decrement_sq = gradient @ step
+        shrinking = step > 0
+        length = min(1.0, 0.99 * (weights[shrinking] / step[shrinking]).min()) if shrinking.any() else 1.0
+        # Armijo backtracking on the Newton direction; close to the optimum
+        # the decrease is below rounding, and plain Newton steps converge
+        while True:
+            candidate = weights - length * step
+            candidate_value = objective(candidate)
+            if decrement_sq < 1e-8 or candidate_value <= value - 0.25 * length * decrement_sq or length < 1e-12:
+                break
+            length *= 0.5
+        weights, value = candidate, candidate_value
+    return weights
+
+def mean_variance(covariance, naive, previous, turnover_penalty=OPTIMIZER_TURNOVER_PENALTY):
+    """Mean-variance targets with a quadratic turnover penalty.
+
+    Expected returns are implied by the naive sizes: with uncorrelated
+    symbols and no penalty the optimum is naive itself. turnover_penalty
+    is relative to the average variance, and pulls targets towards
+    previous.
+    """
+    variances = np.diag(covariance)
+    penalty = turnover_penalty * variances.mean()
+    system = covariance + penalty * np.eye(len(naive))
+    return np.linalg.solve(system, variances * naive + penalty * previous)
+
+class PortfolioOptimizer:
+    """Correlation-aware sizing of merged signals.
+
+    The covariance of the universe's log returns is cached in
+    COVARIANCE_CACHE_PATH together with the previous targets, and a sync
+    only pushes the bars that arrived since the last run. The cache is
+    rebuilt from history when the universe changes.
+    """
+
+    def __init__(self, method=OPTIMIZER, window=OPTIMIZER_LOOKBACK, path=COVARIANCE_CACHE_PATH):
+        if method not in ('mean_variance', 'risk_parity', 'none'):
+            raise ValueError(f"Unknown optimizer method: {method}")
+        self.method = method
+        self.window = window
+        self.path = path
+        self.reset()
+
+    def reset(self):
+        self.symbols = []
+        self.covariance = None
+        self.last_timestamp = None
+        self.last_close = None
+        self.targets = None
+
+    # Cache
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                arrays = dict(data)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable covariance cache {self.path}: {e}")
+            return
+        if len(arrays['buffer']) != self.window:
+            return
+        self.symbols = arrays['symbols'].tolist()
+        self.covariance = ReturnCovariance.from_arrays(arrays)
+        self.last_timestamp = int(arrays['last_timestamp'])
+        self.last_close = arrays['last_close']
+        self.targets = arrays['targets']
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(
+                    f, symbols=np.array(self.symbols, dtype=str), last_timestamp=self.last_timestamp,
+                    last_close=self.last_close, targets=self.targets, **self.covariance.to_arrays()
+                )
+            os.replace(tmp_path, self.path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+    # Returns
+
+    def _seed(self, symbols):
+        """Rebuild the covariance from the last window + 1 common bars"""
+        _, timestamps, _, counts = load_price_histories(self.window + 1, symbols)
+        first = timestamps[counts > 0, -counts[counts > 0]]
+        start = int(first.min()) if len(first) else None
+        self._reset_to(symbols)
+        if start is not None:
+            self._advance(start)
+
+    def _reset_to(self, symbols):
+        self.symbols = list(symbols)
+        self.covariance = ReturnCovariance(len(symbols), self.window)
+        self.last_timestamp = -1
+        self.last_close = np.full(len(symbols), np.nan)
+        self.targets = np.zeros(len(symbols))
+
+    def _advance(self, start):
+        """Push the returns of every bar from start on"""
+        names, timestamps, closes = load_price_matrix(self.symbols, start=start)
+        if len(timestamps) == 0:
+            return 0
+        index = {symbol: i for i, symbol in enumerate(names.tolist())}
+        aligned = np.full((len(self.symbols), len(timestamps) + 1), np.nan)
+        aligned[:, 0] = self.last_close
+        for j, symbol in enumerate(self.symbols):
+            i = index.get(symbol)
+            if i is not None:
+                aligned[j, 1:] = closes[i]
+        aligned = forward_fill(aligned)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns = np.diff(np.log(aligned), axis=1)
+        # A symbol that did not trade adds nothing to the window
+        returns = np.where(np.isfinite(returns), returns, 0.0)
+        if np.isnan(self.last_close).all():
+            # No previous closes yet: the first bar has no return
+            returns = returns[:, 1:]
+        self.covariance.push(returns.T)
+        self.last_close = np.where(np.isfinite(aligned[:, -1]), aligned[:, -1], self.last_close)
+        self.last_timestamp = int(timestamps[-1])
+        return len(timestamps)
+
+    def sync(self, symbols):
+        """Bring the cached covariance of symbols up to date"""
+        symbols = sorted(symbols)
+        if self.covariance is None:
+            self.load()
+        if self.symbols != symbols:
+            self._seed(symbols)
+            logger.info(f"Covariance rebuilt for {len(symbols)} symbols from {self.covariance.count} bars")
+        else:
+            self._advance(self.last_timestamp + 1)
+
+    # Sizing
+
+    def _loadings(self, signals):
+        """(signal, symbol, weight) of every leg of signals the covariance covers"""
+        index = {symbol: j for j, symbol in enumerate(self.symbols)}
+        legs = []
+        for k, signal in enumerate(signals):
+            symbol = signal['symbol']
+            direction = signal['signal']
+            if symbol in index:
+                legs.append((k, index[symbol], direction))
+            elif '/' in symbol and 'hedge_ratio' in signal:
+                y, x = symbol.split('/', 1)
+                if y in index and x in index:
+                    legs.append((k, index[y], direction))
+                    legs.append((k, index[x], -direction * signal['hedge_ratio']))
+        if not legs:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+        bet, symbol, weight = zip(*legs)
+        return np.array(bet, dtype=np.int64), np.array(symbol, dtype=np.int64), np.array(weight, dtype=np.float64)
+
+    def size(self, signals, symbols):
+        """Scale merged signals in place.
+
+        Each signal gets a 'size_scale' (target over naive exposure of its
+        symbols, the smallest over a pair's legs, at most
+        OPTIMIZER_MAX_SCALE) that the executor applies to its orders, and
+        its recommended_size is scaled to match. Signals outside the
+        covariance keep scale 1.
+        """
+        for signal in signals:
+            signal['size_scale'] = 1.0
+        if self.method == 'none' or not signals:
+            return signals
+
+        self.sync(symbols)
+        if self.covariance.count < 2:
+            self.save()
+            logger.info("Not enough return history for the optimizer; keeping independent sizes")
+            return signals
+
+        bets, legs, weights = self._loadings(signals)
+        # The same basis plan_trades sizes orders from: capital_per_trade * strength
+        naive_size = np.array(
+            [abs(signal['signal']) * signal.get('signal_strength', 0) * RISK_PER_TRADE for signal in signals],
+            dtype=np.float64,
+        )
+        naive = np.bincount(legs, naive_size[bets] * weights, minlength=len(self.symbols))
+
+        covariance, shrinkage = self.covariance.estimate()
+        # Symbols without return variance keep their naive exposure
+        known = np.diag(covariance) > 0
+        if self.method == 'mean_variance':
+            active = np.flatnonzero(known & ((naive != 0) | (self.targets != 0)))
+            sub = covariance[np.ix_(active, active)]
+            solved = mean_variance(sub, naive[active], self.targets[active])
+        else:
+            active = np.flatnonzero(known & (naive != 0))
+            signs = np.sign(naive[active])
+            sub = covariance[np.ix_(active, active)] * np.outer(signs, signs)
+            budgets = np.abs(naive[active]) * np.sqrt(np.diag(sub))
+            parity = risk_parity(sub, budgets)
+            # Same total risk the naive sizes would carry if uncorrelated
+            parity *= np.sqrt((budgets @ budgets) / (parity @ sub @ parity))
+            previous = self.targets[active] * signs
+            solved = signs * (parity + OPTIMIZER_TURNOVER_PENALTY * previous) / (1 + OPTIMIZER_TURNOVER_PENALTY)
+        targets = np.where(known, 0.0, naive)
+        targets[active] = solved
+
+        # Symbols whose bets cancel out (naive exposure 0) are not traded;
+        # nearly cancelling ones would blow up the ratio, hence the cap
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = np.where(naive != 0, np.clip(targets / naive, 0.0, OPTIMIZER_MAX_SCALE), 0.0)
+        # Diversifying bets may grow (scale > 1); a pair takes its tighter leg
+        scale = np.full(len(signals), np.inf)
+        np.minimum.at(scale, bets, ratio[legs])
+        scale = np.where(np.isfinite(scale), scale, 1.0)
+
+        for signal, factor in zip(signals, scale.tolist()):
+            signal['size_scale'] = round(factor, 4)
+            signal['recommended_size'] = round(signal.get('recommended_size', 0) * factor, 4)
+        self.targets = targets
+        self.save()
+        logger.info(
+            f"Optimizer ({self.method}): {len(signals)} signals over {len(active)} symbols, "
+            f"shrinkage {shrinkage:.2f}"
+        )
+        return signals
+
+# Global optimizer
+optimizer = PortfolioOptimizer()
@@ -0,0 +1,356 @@
+import json
+import math
+import logging
+import numpy as np
+from datetime import datetime
+from database import db
+from indicator_state import RollingWindow
+from price_loader import load_price_histories, load_price_matrix, load_recent_price_matrix
+from config import (
+    PAIRS, PAIR_WINDOW, PAIR_DISCOVERY, PAIR_LOOKBACK, PAIR_MIN_CORRELATION,
+    PAIR_MAX_CANDIDATES, PAIR_ADF_CRITICAL, PAIR_MAX_HALF_LIFE, PAIR_MAX_ACTIVE,
+)
+
+logger = logging.getLogger(__name__)
+
+# Pairs are (y, x): the spread is log(y) - alpha - beta * log(x), fitted by
+# OLS over the last PAIR_WINDOW bars. A pair is named "y/x"; a long spread
+# signal means long y, short x.
+
+def pair_name(y, x):
+    return f"{y}/{x}"
+
+def _ols(n, sx, sy, sxx, sxy, syy):
+    """Hedge ratio, intercept and residual std from window sums.
+
+    Works elementwise on floats or arrays. OLS residuals have zero mean
+    over the window, so their variance is var(y) - beta * cov(x, y).
+    """
+    var_x = sxx / n - (sx / n) ** 2
+    cov_xy = sxy / n - (sx / n) * (sy / n)
+    var_y = syy / n - (sy / n) ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        beta = cov_xy / var_x
+    alpha = sy / n - beta * sx / n
+    resid_var = np.maximum(var_y - beta * cov_xy, 0.0)
+    return beta, alpha, np.sqrt(resid_var)
+
+class PairState:
+    """Rolling OLS of log(y) on log(x) with O(1) updates per bar.
+
+    Keeps RollingWindows of x, y and x*y; their running sums and sums of
+    squares are all the regression needs.
+    """
+
+    def __init__(self, window=PAIR_WINDOW):
+        self.x = RollingWindow(window)
+        self.y = RollingWindow(window)
+        self.xy = RollingWindow(window)
+        self.last_timestamp = None
+        self.last_x = None
+        self.last_y = None
+
+    def update(self, timestamp, price_y, price_x):
+        x = math.log(price_x)
+        y = math.log(price_y)
+        self.x.push(x)
+        self.y.push(y)
+        self.xy.push(x * y)
+        self.last_x = x
+        self.last_y = y
+        self.last_timestamp = timestamp
+
+    def stats(self):
+        """Current hedge ratio and spread z-score, or None until the window is full"""
+        if not self.x.full:
+            return None
+        n = self.x.size
+        beta, alpha, std = _ols(n, self.x.total, self.y.total, self.x.total_sq, self.xy.total, self.y.total_sq)
+        if not (math.isfinite(beta) and std > 0):
+            return None
+        spread = self.last_y - alpha - beta * self.last_x
+        return {
+            'hedge_ratio': float(beta),
+            'intercept': float(alpha),
+            'spread': float(spread),
+            'spread_std': float(std),
+            'z_score': float(spread / std),
+        }
+
+    def to_dict(self):
+        return {
+            'x': self.x.to_dict(), 'y': self.y.to_dict(), 'xy': self.xy.to_dict(),
+            'last_x': self.last_x, 'last_y': self.last_y,
+        }
+
+    @classmethod
+    def from_dict(cls, data, last_timestamp):
+        state = cls(data['x']['size'])
+        state.x = RollingWindow.from_dict(data['x'])
+        state.y = RollingWindow.from_dict(data['y'])
+        state.xy = RollingWindow.from_dict(data['xy'])
+        state.last_x = data['last_x']
+        state.last_y = data['last_y']
+        state.last_timestamp = last_timestamp
+        return state
+
+class PairStateStore:
+    """Streaming spread statistics for the active pairs, persisted in pair_state.
+
+    Like IndicatorStateStore: a sync reads only the bars that arrived
+    since each pair's last update. Pairs without state are seeded from
+    their last PAIR_WINDOW common bars; state of pairs that left the
+    active set is dropped.
+    """
+
+    def __init__(self, window=PAIR_WINDOW):
+        self.window = window
+        self.states = {}
+
+    def load(self):
+        rows = db.execute("SELECT pair, last_timestamp, state FROM pair_state")
+        for row in rows:
+            current = self.states.get(row['pair'])
+            if current is None or row['last_timestamp'] > current.last_timestamp:
+                self.states[row['pair']] = PairState.from_dict(json.loads(row['state']), row['last_timestamp'])
+
+    def _seed(self, pairs):
+        symbols = sorted({s for pair in pairs for s in pair})
+        names, timestamps, closes, counts = load_price_histories(self.window, symbols)
+        index = {symbol: i for i, symbol in enumerate(names.tolist())}
+        seeded = []
+        for y, x in pairs:
+            if y not in index or x not in index:
+                continue
+            iy, ix = index[y], index[x]
+            common, cy, cx = np.intersect1d(
+                timestamps[iy, self.window - counts[iy]:], timestamps[ix, self.window - counts[ix]:],
+                return_indices=True,
+            )
+            state = PairState(self.window)
+            offset_y, offset_x = self.window - counts[iy], self.window - counts[ix]
+            for t, ty, tx in zip(common.tolist(), cy.tolist(), cx.tolist()):
+                state.update(t, closes[iy, offset_y + ty], closes[ix, offset_x + tx])
+            if state.last_timestamp is not None:
+                self.states[pair_name(y, x)] = state
+                seeded.append(pair_name(y, x))
+        return seeded
+
+    def _advance(self, pairs):
+        """Apply bars newer than each state, aligned and forward-filled"""
+        since = min(self.states[pair_name(y, x)].last_timestamp for y, x in pairs)
+        symbols = sorted({s for pair in pairs for s in pair})
+        names, timestamps, closes = load_price_matrix(symbols, start=since + 1)
+        index = {symbol: i for i, symbol in enumerate(names.tolist())}
+        updated = []
+        for y, x in pairs:
+            if y not in index or x not in index:
+                continue
+            state = self.states[pair_name(y, x)]
+            fresh = timestamps > state.last_timestamp
+            row_y, row_x = closes[index[y]], closes[index[x]]
+            usable = fresh & np.isfinite(row_y) & np.isfinite(row_x)
+            for t in np.flatnonzero(usable).tolist():
+                state.update(int(timestamps[t]), row_y[t], row_x[t])
+            if usable.any():
+                updated.append(pair_name(y, x))
+        return updated
+
+    def sync(self, pairs):
+        """Bring every pair in pairs up to date; returns {name: stats}"""
+        self.load()
+        pairs = [tuple(pair) for pair in pairs]
+        active = {pair_name(y, x) for y, x in pairs}
+
+        stale = [name for name in self.states if name not in active]
+        for name in stale:
+            del self.states[name]
+
+        existing = [pair for pair in pairs if pair_name(*pair) in self.states]
+        missing = [pair for pair in pairs if pair_name(*pair) not in self.states]
+        updated = self._advance(existing) if existing else []
+        updated += self._seed(missing) if missing else []
+
+        with db.transaction():
+            if stale:
+                db.execute_many("DELETE FROM pair_state WHERE pair = ?", [(name,) for name in stale])
+            if updated:
+                db.execute_many(
+                    "INSERT OR REPLACE INTO pair_state (pair, last_timestamp, state) VALUES (?, ?, ?)",
+                    [
+                        (name, self.states[name].last_timestamp, json.dumps(self.states[name].to_dict()))
+                        for name in updated
+                    ]
+                )
+        if updated:
+            logger.info(f"Pair state updated for {len(updated)} pairs")
+
+        result = {}
+        for y, x in pairs:
+            state = self.states.get(pair_name(y, x))
+            stats = state.stats() if state else None
+            if stats:
+                result[pair_name(y, x)] = {'y': y, 'x': x, **stats}
+        return result
+
+def rolling_pair_stats(closes_y, closes_x, window=PAIR_WINDOW):
+    """Vectorized PairState over whole histories, for backtests.
+
+    closes_y, closes_x: (pairs x bars) prices. Returns {name: (pairs x
+    bars)} for hedge_ratio, spread_std and z_score, NaN until a pair has
+    window bars. Window sums come from cumulative sums, so the cost is
+    O(bars) per pair regardless of window.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        y = np.log(closes_y)
+        x = np.log(closes_x)
+    n_pairs, n_bars = y.shape
+    out = {name: np.full((n_pairs, n_bars), np.nan) for name in ('hedge_ratio', 'spread_std', 'z_score')}
+    if n_bars < window:
+        return out
+
+    def window_sums(values):
+        cs = np.cumsum(np.concatenate([np.zeros((n_pairs, 1)), values], axis=1), axis=1)
+        return cs[:, window:] - cs[:, :-window]
+
+    # Forward-filled price matrices only have NaN before a symbol's first bar
+    valid = window_sums((np.isfinite(x) & np.isfinite(y)).astype(np.float64)) == window
+    x0 = np.nan_to_num(x)
+    y0 = np.nan_to_num(y)
+    beta, alpha, std = _ols(
+        window, window_sums(x0), window_sums(y0), window_sums(x0 * x0), window_sums(x0 * y0), window_sums(y0 * y0)
+    )
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = (y0[:, window - 1:] - alpha - beta * x0[:, window - 1:]) / std
+    ok = valid & np.isfinite(beta) & (std > 0)
+    out['hedge_ratio'][:, window - 1:] = np.where(ok, beta, np.nan)
+    out['spread_std'][:, window - 1:] = np.where(ok, std, np.nan)
+    out['z_score'][:, window - 1:] = np.where(ok, z, np.nan)
+    return out
+
+def discover_pairs(symbols, closes, min_correlation=PAIR_MIN_CORRELATION, max_candidates=PAIR_MAX_CANDIDATES,
+                   adf_critical=PAIR_ADF_CRITICAL, max_half_life=PAIR_MAX_HALF_LIFE, block=512):
+    """Screen every pair of the universe for cointegration.
+
+    closes: (symbols x bars) chronological prices with no gaps. Pairs are
+    first filtered on the correlation of log returns (computed in row
+    blocks, so memory stays O(block x symbols)), then the strongest
+    max_candidates are tested with an Engle-Granger regression and a
+    Dickey-Fuller test on the residuals, vectorized across pairs.
+
+    Returns a list of dicts sorted by ADF statistic (most negative first).
+    """
+    symbols = list(symbols)
+    logs = np.log(np.asarray(closes, dtype=np.float64))
+    n_symbols, n_bars = logs.shape
+    if n_symbols < 2 or n_bars < 3:
+        return []
+
+    returns = np.diff(logs, axis=1)
+    returns -= returns.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(returns, axis=1)
+    norms[norms == 0] = np.inf
+    unit = returns / norms[:, None]
+
+    # Correlation screen, upper triangle only
+    rows, cols, corrs = [], [], []
+    for start in range(0, n_symbols, block):
+        corr = unit[start:start + block] @ unit.T
+        i, j = np.nonzero(corr >= min_correlation)
+        i += start
+        keep = j > i
+        rows.append(i[keep])
+        cols.append(j[keep])
+        corrs.append(corr[i[keep] - start, j[keep]])
+    rows = np.concatenate(rows)
+    cols = np.concatenate(cols)
+    corrs = np.concatenate(corrs)
+    screened = len(corrs)
+    if screened > max_candidates:
+        top = np.argpartition(-corrs, max_candidates - 1)[:max_candidates]
+        rows, cols, corrs = rows[top], cols[top], corrs[top]
+
+    # Engle-Granger step 1: OLS of log(y) on log(x) per candidate
+    y = logs[rows]
+    x = logs[cols]
+    beta, alpha, _ = _ols(
+        n_bars, x.sum(axis=1), y.sum(axis=1), (x * x).sum(axis=1), (x * y).sum(axis=1), (y * y).sum(axis=1)
+    )
+    resid = y - alpha[:, None] - beta[:, None] * x
+
+    # Step 2: Dickey-Fuller regression d(resid) = gamma * resid(-1)
+    lagged = resid[:, :-1]
+    delta = np.diff(resid, axis=1)
+    ss = (lagged * lagged).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gamma = (lagged * delta).sum(axis=1) / ss
+        sigma2 = ((delta - gamma[:, None] * lagged) ** 2).sum(axis=1) / (n_bars - 2)
+        adf = gamma / np.sqrt(sigma2 / ss)
+        # gamma <= -1 means the spread reverts within a single bar
+        half_life = np.where(gamma > -1, -np.log(2) / np.log1p(np.maximum(gamma, -1 + 1e-12)), 0.0)
+
+    passed = np.flatnonzero(
+        np.isfinite(adf) & (adf < adf_critical) & (gamma < 0) & (half_life <= max_half_life)
+    )
+    passed = passed[np.argsort(adf[passed])]
+    logger.info(f"Pair scan: {n_symbols * (n_symbols - 1) // 2} pairs, {screened} correlated, "
+                f"{len(rows)} tested, {len(passed)} cointegrated")
+    return [
+        {
+            'y': symbols[rows[k]],
+            'x': symbols[cols[k]],
+            'correlation': float(corrs[k]),
+            'hedge_ratio': float(beta[k]),
+            'adf_stat': float(adf[k]),
+            'half_life': float(half_life[k]),
+        }
+        for k in passed.tolist()
+    ]
+
+def refresh_pair_candidates(symbols=None, lookback=PAIR_LOOKBACK):
+    """Run the discovery scan over stored history and save the results.
+
+    Every symbol is tested on the same last lookback bar times, forward-
+    filled over gaps; symbols without a bar at the first of them are left
+    out. Runs as its own scheduled job (SCHEDULE['pairs']), not on every
+    signal cycle.
+    """
+    names, timestamps, closes = load_recent_price_matrix(lookback, symbols)
+    if len(timestamps) < lookback:
+        logger.info(f"Pair scan skipped: {len(timestamps)} of {lookback} bars stored")
+        return []
+    complete = np.isfinite(closes).all(axis=1) & (closes > 0).all(axis=1)
+    candidates = discover_pairs(names[complete].tolist(), closes[complete])
+
+    now = datetime.utcnow()
+    with db.transaction():
+        db.execute("DELETE FROM pair_candidates")
+        db.execute_many(
+            """
+            INSERT INTO pair_candidates (y_symbol, x_symbol, correlation, hedge_ratio, adf_stat, half_life, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (c['y'], c['x'], c['correlation'], c['hedge_ratio'], c['adf_stat'], c['half_life'], now)
+                for c in candidates
+            ]
+        )
+    return candidates
+
+def active_pairs(limit=PAIR_MAX_ACTIVE):
+    """config.PAIRS plus the best discovered pairs"""
+    pairs = [tuple(pair) for pair in PAIRS]
+    if PAIR_DISCOVERY and limit:
+        rows = db.execute(
+            "SELECT y_symbol, x_symbol FROM pair_candidates ORDER BY adf_stat LIMIT ?", (limit,)
+        )
+        seen = {frozenset(pair) for pair in pairs}
+        for row in rows:
+            pair = (row['y_symbol'], row['x_symbol'])
+            if frozenset(pair) not in seen:
+                seen.add(frozenset(pair))
+                pairs.append(pair)
+    return pairs
+
+# Global pair state store
+pair_store = PairStateStore()
@@ -0,0 +1,152 @@
+import json
+import math
+import logging
+from datetime import datetime
+from database import db
+from indicator_state import RollingWindow
+from config import EQUITY_VOL_WINDOW, EQUITY_MIN_CAGR_DAYS
+
+logger = logging.getLogger(__name__)
+
+SECONDS_PER_YEAR = 365.25 * 86400
+
+CURVE_QUERY = """
+INSERT OR REPLACE INTO equity_curve
+(timestamp, equity, realized_pnl, unrealized_pnl, period_return, drawdown, volatility,
+ sharpe_ratio, sortino_ratio, max_drawdown, cagr)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+class EquityStats:
+    """Risk statistics of an equity curve, updated in O(1) per point.
+
+    Period returns feed a Welford mean/variance and a running sum of
+    squared losses (Sharpe and Sortino); a running peak gives drawdown;
+    a RollingWindow of recent returns gives rolling volatility. Points
+    arrive at whatever cadence the pipeline runs, so ratios are
+    annualized with the observed number of periods per year. There are
+    no cash flows into the paper account, so the time-weighted return is
+    the plain growth of equity.
+    """
+
+    def __init__(self, vol_window=EQUITY_VOL_WINDOW):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.downside_sq = 0.0
+        self.peak = None
+        self.drawdown = 0.0
+        self.max_drawdown = 0.0
+        self.first_equity = None
+        self.first_time = None
+        self.last_equity = None
+        self.last_time = None
+        self.last_return = None
+        self.recent = RollingWindow(vol_window)
+
+    def update(self, time, equity):
+        """Add the equity at time (Unix seconds)"""
+        if self.last_equity is None:
+            self.first_equity = self.peak = equity
+            self.first_time = time
+        else:
+            r = equity / self.last_equity - 1 if self.last_equity else 0.0
+            self.count += 1
+            delta = r - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (r - self.mean)
+            self.downside_sq += min(r, 0.0) ** 2
+            self.recent.push(r)
+            self.last_return = r
+        self.peak = max(self.peak, equity)
+        self.drawdown = equity / self.peak - 1 if self.peak > 0 else 0.0
+        self.max_drawdown = min(self.max_drawdown, self.drawdown)
+        self.last_equity = equity
+        self.last_time = time
+
+    def stats(self):
+        """Current statistics; percentages like compute_stats in backtest.py"""
+        years = (self.last_time - self.first_time) / SECONDS_PER_YEAR if self.last_time is not None else 0.0
+        periods_per_year = self.count / years if years > 0 else 0.0
+        scale = math.sqrt(periods_per_year)
+
+        std = math.sqrt(self.m2 / self.count) if self.count else 0.0
+        downside = math.sqrt(self.downside_sq / self.count) if self.count else 0.0
+        growth = self.last_equity / self.first_equity if self.first_equity else 1.0
+        if years * 365.25 >= EQUITY_MIN_CAGR_DAYS and growth > 0:
+            cagr = growth ** (1 / years) - 1
+        else:
+            # Annualizing a few days of history is meaningless
+            cagr = growth - 1
+        return {
+            'equity': self.last_equity,
+            'period_return': self.last_return,
+            'drawdown': self.drawdown * 100,
+            'volatility': self.recent.std() * scale * 100 if self.recent.values else 0.0,
+            'sharpe_ratio': self.mean / std * scale if std > 0 else 0.0,
+            'sortino_ratio': self.mean / downside * scale if downside > 0 else 0.0,
+            'max_drawdown': self.max_drawdown * 100,
+            'cagr': cagr * 100,
+        }
+
+    def to_dict(self):
+        state = {k: v for k, v in vars(self).items() if k != 'recent'}
+        state['recent'] = self.recent.to_dict()
+        return state
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls(data['recent']['size'])
+        for key, value in data.items():
+            if key != 'recent':
+                setattr(stats, key, value)
+        stats.recent = RollingWindow.from_dict(data['recent'])
+        return stats
+
+def _seconds(timestamp):
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    return timestamp.timestamp()
+
+def _load_state():
+    rows = db.execute("SELECT state FROM equity_state WHERE id = 1")
+    if rows:
+        return EquityStats.from_dict(json.loads(rows[0]['state']))
+
+    # First run: replay the equity recorded by earlier portfolio summaries
+    stats = EquityStats()
+    history = db.execute(
+        "SELECT timestamp, total_portfolio_value, realized_pnl, total_unrealized_pnl "
+        "FROM portfolio_summary ORDER BY timestamp"
+    )
+    curve = []
+    for row in history:
+        stats.update(_seconds(row['timestamp']), float(row['total_portfolio_value']))
+        curve.append(_curve_row(row['timestamp'], row['realized_pnl'], row['total_unrealized_pnl'], stats.stats()))
+    if curve:
+        db.execute_many(CURVE_QUERY, curve)
+        logger.info(f"Equity curve seeded from {len(curve)} portfolio summaries")
+    return stats
+
+def _curve_row(timestamp, realized, unrealized, stats):
+    return (
+        timestamp, stats['equity'], realized, unrealized, stats['period_return'], stats['drawdown'],
+        stats['volatility'], stats['sharpe_ratio'], stats['sortino_ratio'], stats['max_drawdown'], stats['cagr'],
+    )
+
+def record_equity(timestamp, equity, realized_pnl, unrealized_pnl):
+    """Append a mark-to-market point and return the updated statistics.
+
+    Loads and saves one state row, so the cost does not grow with the
+    length of the curve. Runs as one transaction (joining the caller's).
+    """
+    with db.transaction():
+        stats = _load_state()
+        stats.update(_seconds(timestamp), equity)
+        current = stats.stats()
+        db.execute(CURVE_QUERY, _curve_row(timestamp, realized_pnl, unrealized_pnl, current))
+        db.execute(
+            "INSERT OR REPLACE INTO equity_state (id, last_timestamp, state) VALUES (1, ?, ?)",
+            (timestamp, json.dumps(stats.to_dict()))
+        )
+    return current
@@ -2,10 +2,16 @@ import logging
 import math
 from datetime import datetime
 from database import db
+from dashboard_cache import mark_dashboard_dirty
+from metrics import stage
+from events import publish, PORTFOLIO
+from ledger import ledger
+from performance import record_equity
 from config import TRADING_CAPITAL
 
 logger = logging.getLogger(__name__)
 
+@stage('portfolio', items=lambda result: result['portfolio']['num_positions'])
 def calculate_portfolio_metrics():
     """Calculate portfolio summary and strategy breakdown"""
     logger.info("Calculating portfolio metrics...")
@@ -16,47 +22,25 @@ def calculate_portfolio_metrics():
     pos_query = "SELECT * FROM paper_positions WHERE quantity != 0"
     positions = db.execute(pos_query)
     
-    # Load trades
-    trade_query = "SELECT * FROM trade_log ORDER BY timestamp DESC LIMIT 1000"
-    trades = db.execute(trade_query)
-    
     # Calculate unrealized PnL
     total_unrealized_pnl = 0
     for pos in positions:
         total_unrealized_pnl += float(pos.get('unrealized_pnl', 0))
     
-    # Calculate realized PnL
-    realized_pnl = 0
-    buy_trades = {}
-    for trade in trades:
-        symbol = trade['symbol']
-        if trade['side'] == 'BUY':
-            if symbol not in buy_trades:
-                buy_trades[symbol] = []
-            buy_trades[symbol].append(trade)
-        elif trade['side'] == 'SELL':
-            if symbol in buy_trades and buy_trades[symbol]:
-                buy_trade = buy_trades[symbol].pop(0)
-                pnl = (float(trade['price']) - float(buy_trade['price'])) * trade['quantity']
-                realized_pnl += pnl
+    # Realized PnL: catch the lot ledger up with any fills it has not
+    # seen, then read its running totals
+    ledger.sync()
+    totals = ledger.totals()
+    realized_pnl = totals['realized_pnl']
     
     # Portfolio metrics
     total_portfolio_value = initial_capital + realized_pnl + total_unrealized_pnl
     
-    # Calculate Sharpe ratio (simplified)
-    sharpe_ratio = 0.8  # Placeholder
-    
-    # Max drawdown
-    max_drawdown = -5.0  # Placeholder
-    
-    # Win rate
-    winning_trades = sum(1 for t in trades if t['side'] == 'SELL' and t.get('pnl', 0) > 0)
-    total_trades = sum(1 for t in trades if t['side'] == 'SELL')
+    # Win rate over closing fills
+    winning_trades = totals['winning_trades']
+    total_trades = totals['closing_trades']
     win_rate = (winning_trades / total_trades * 100) if total_trades > 0 else 0
     
-    # CAGR
-    cagr = ((total_portfolio_value - initial_capital) / initial_capital) * 100
-    
     # Insert portfolio summary
     summary_query = """
     INSERT INTO portfolio_summary 
@@ -64,22 +48,6 @@ def calculate_portfolio_metrics():
     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
     """
     
-    timestamp = datetime.utcnow()
-    db.execute(summary_query, (
-        round(total_portfolio_value, 2),
-        round(total_unrealized_pnl, 2),
-        round(realized_pnl, 2),
-        round(sharpe_ratio, 2),
-        round(max_drawdown, 2),
-        round(win_rate, 2),
-        round(cagr, 2),
-        len(positions),
-        total_trades,
-        timestamp,
-    ))
-    
-    logger.info(f"Portfolio: ${total_portfolio_value:.2f} | P&L: ${realized_pnl + total_unrealized_pnl:.2f}")
-    
     # Strategy breakdown
     strategy_breakdown = {}
     for pos in positions:
@@ -101,14 +69,67 @@ def calculate_portfolio_metrics():
     VALUES (?, ?, ?, ?, ?)
     """
     
-    for strategy, data in strategy_breakdown.items():
-        db.execute(breakdown_query, (
-            strategy,
-            data['num_positions'],
-            round(data['total_position_value'], 2),
-            round(data['total_unrealized_pnl'], 2),
+    # Summary and breakdown are written as one unit of work
+    timestamp = datetime.utcnow()
+    with db.transaction():
+        # Append to the equity curve; Sharpe, drawdown and CAGR come from
+        # its running accumulators
+        risk = record_equity(timestamp, total_portfolio_value, realized_pnl, total_unrealized_pnl)
+        sharpe_ratio = risk['sharpe_ratio']
+        max_drawdown = risk['max_drawdown']
+        cagr = risk['cagr']
+        
+        db.execute(summary_query, (
+            round(total_portfolio_value, 2),
+            round(total_unrealized_pnl, 2),
+            round(realized_pnl, 2),
+            round(sharpe_ratio, 2),
+            round(max_drawdown, 2),
+            round(win_rate, 2),
+            round(cagr, 2),
+            len(positions),
+            total_trades,
             timestamp,
         ))
+        
+        for strategy, data in strategy_breakdown.items():
+            db.execute(breakdown_query, (
+                strategy,
+                data['num_positions'],
+                round(data['total_position_value'], 2),
+                round(data['total_unrealized_pnl'], 2),
+                timestamp,
+            ))
+        
+        publish(PORTFOLIO, {
+            'portfolio': {
+                'total_value': round(total_portfolio_value, 2),
+                'unrealized_pnl': round(total_unrealized_pnl, 2),
+                'realized_pnl': round(realized_pnl, 2),
+                'sharpe_ratio': round(sharpe_ratio, 2),
+                'max_drawdown': round(max_drawdown, 2),
+                'win_rate': round(win_rate, 2),
+                'cagr': round(cagr, 2),
+                'num_positions': len(positions),
+                'num_trades': total_trades,
+            },
+            'strategy_breakdown': [
+                {
+                    'strategy': strategy,
+                    'positions': data['num_positions'],
+                    'value': round(data['total_position_value'], 2),
+                    'unrealized_pnl': round(data['total_unrealized_pnl'], 2),
+                }
+                for strategy, data in strategy_breakdown.items()
+            ],
+        })
+    mark_dashboard_dirty()
+    
+    logger.info(
+        f"Portfolio: ${total_portfolio_value:.2f} | P&L: ${realized_pnl + total_unrealized_pnl:.2f} | "
+        f"Sharpe {sharpe_ratio:.2f} | max DD {max_drawdown:.2f}%"
+    )
+    for strategy, data in strategy_breakdown.items():
         logger.info(f"  {strategy}: {data['num_positions']} positions, ${data['total_position_value']:.2f}")
     
     return {
@@ -117,8 +138,16 @@ def calculate_portfolio_metrics():
             'unrealized_pnl': total_unrealized_pnl,
             'realized_pnl': realized_pnl,
             'num_positions': len(positions),
+            'sharpe_ratio': sharpe_ratio,
+            'sortino_ratio': risk['sortino_ratio'],
+            'volatility': risk['volatility'],
+            'max_drawdown': max_drawdown,
+            'cagr': cagr,
         },
         'strategies': strategy_breakdown,
+        'realized_by_strategy': {
+            strategy: row['realized_pnl'] for strategy, row in totals['by_strategy'].items()
+        },
     }
 
 if __name__ == "__main__":
@@ -0,0 +1,261 @@
+import logging
+import numpy as np
+from database import db
+
+logger = logging.getLogger(__name__)
+
+UPSERT_QUERY = """
+INSERT OR REPLACE INTO paper_positions
+(symbol, strategy_type, quantity, entry_price, current_price, unrealized_pnl, position_value, entry_date)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+MARK_QUERY = """
+UPDATE paper_positions SET current_price=?, unrealized_pnl=?, position_value=?
+WHERE symbol=? AND strategy_type=?
+"""
+DELETE_QUERY = "DELETE FROM paper_positions WHERE symbol=? AND strategy_type=?"
+
+class PositionBook:
+    """Open paper positions keyed by (symbol, strategy), kept in memory between runs.
+
+    Positions live in parallel arrays, one slot each, so marking the whole
+    book to market is a few array operations. Fills are applied one at a
+    time and every change since the last flush (opened, closed and
+    re-marked positions) is written back as one batched diff, so a run
+    costs O(trades + moved prices) in SQL rather than O(positions).
+
+    The book reloads paper_positions only when trade_log shows trades it
+    did not make itself, e.g. from another process.
+    """
+
+    def __init__(self, capacity=64):
+        self.slots = {}
+        self.free = []
+        self.last_trade_id = None
+        self._allocate(capacity)
+        self._reset_diff()
+
+    def _allocate(self, capacity):
+        self.symbol = np.empty(capacity, dtype=object)
+        self.strategy = np.empty(capacity, dtype=object)
+        self.entry_date = np.empty(capacity, dtype=object)
+        self.quantity = np.zeros(capacity)
+        self.entry_price = np.zeros(capacity)
+        self.current_price = np.full(capacity, np.nan)
+        self.used = 0
+
+    def _grow(self):
+        columns = ('symbol', 'strategy', 'entry_date', 'quantity', 'entry_price', 'current_price')
+        old = {name: getattr(self, name) for name in columns}
+        used = self.used
+        self._allocate(2 * len(self.symbol))
+        for name, values in old.items():
+            getattr(self, name)[:used] = values[:used]
+        self.used = used
+
+    def _reset_diff(self):
+        self.opened = set()
+        self.closed = set()
+        self.marked = set()
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __contains__(self, key):
+        return key in self.slots
+
+    def _position(self, slot):
+        return {
+            'symbol': self.symbol[slot],
+            'strategy_type': self.strategy[slot],
+            'quantity': int(self.quantity[slot]),
+            'entry_price': float(self.entry_price[slot]),
+            'current_price': float(self.current_price[slot]),
+            'entry_date': self.entry_date[slot],
+        }
+
+    def get(self, key, default=None):
+        """Position dict for (symbol, strategy), as plan_trades expects"""
+        slot = self.slots.get(key)
+        return default if slot is None else self._position(slot)
+
+    def items(self):
+        for key, slot in self.slots.items():
+            yield key, self._position(slot)
+
+    def _active(self):
+        return np.fromiter(self.slots.values(), dtype=np.int64, count=len(self.slots))
+
+    # Loading
+
+    def load(self):
+        """Replace the book with paper_positions"""
+        rows = db.execute(
+            "SELECT symbol, strategy_type, quantity, entry_price, current_price, entry_date "
+            "FROM paper_positions WHERE quantity != 0"
+        )
+        self.slots = {}
+        self.free = []
+        self._allocate(max(64, 2 * len(rows)))
+        for row in rows:
+            slot = self._take((row['symbol'], row['strategy_type']))
+            self.quantity[slot] = row['quantity']
+            self.entry_price[slot] = row['entry_price']
+            self.current_price[slot] = row['current_price'] if row['current_price'] is not None else np.nan
+            self.entry_date[slot] = row['entry_date']
+        self._reset_diff()
+        self.last_trade_id = self._trade_log_head()
+        logger.info(f"Position book loaded: {len(self.slots)} positions")
+
+    def _trade_log_head(self):
+        """Highest trade_log id, 0 for an empty log (None means "not loaded")"""
+        rows = db.execute("SELECT MAX(id) AS id FROM trade_log")
+        return (rows[0]['id'] if rows else None) or 0
+
+    def refresh(self):
+        """Reload if trade_log moved since the book last wrote to it"""
+        if self.last_trade_id is None or self._trade_log_head() != self.last_trade_id:
+            self.load()
+
+    def invalidate(self):
+        """Force a reload on the next refresh (after a failed write)"""
+        self.last_trade_id = None
+        self._reset_diff()
+
+    # Fills
+
+    def _take(self, key):
+        if self.free:
+            slot = self.free.pop()
+        else:
+            if self.used == len(self.symbol):
+                self._grow()
+            slot = self.used
+            self.used += 1
+        self.slots[key] = slot
+        self.symbol[slot], self.strategy[slot] = key
+        return slot
+
+    def apply_fill(self, trade):
+        """Apply a filled order (see executor.apply_fill).
+
+        Returns the closed position for 'close' orders, and the closed
+        part for 'reduce' orders, None otherwise.
+        """
+        key = (trade['symbol'], trade['strategy_type'])
+        if trade['action'] == 'close':
+            slot = self.slots.pop(key, None)
+            if slot is None:
+                return None
+            position = self._position(slot)
+            self.quantity[slot] = 0
+            self.current_price[slot] = np.nan
+            self.free.append(slot)
+            self.opened.discard(key)
+            self.marked.discard(key)
+            self.closed.add(key)
+            return position
+
+        quantity = trade['quantity'] if trade['side'] == 'BUY' else -trade['quantity']
+        slot = self.slots.get(key)
+        closed = None
+        if slot is not None and trade['action'] in ('increase', 'reduce'):
+            if trade['action'] == 'reduce':
+                closed = {**self._position(slot), 'quantity': -quantity}
+            else:
+                # Average cost over the old and the added quantity
+                total = self.quantity[slot] + quantity
+                self.entry_price[slot] = (self.entry_price[slot] * self.quantity[slot] + trade['price'] * quantity) / total
+            self.quantity[slot] += quantity
+        else:
+            if slot is None:
+                slot = self._take(key)
+            self.quantity[slot] = quantity
+            self.entry_price[slot] = trade['price']
+            self.entry_date[slot] = trade['timestamp']
+        self.current_price[slot] = trade['price']
+        self.closed.discard(key)
+        self.opened.add(key)
+        return closed
+
+    def exposures(self, exclude=()):
+        """(symbols, strategies, values) of open positions at their last mark.
+
+        values are signed market values; positions in exclude (keys about
+        to be closed) are left out.
+        """
+        slots = self._active()
+        dropped = [self.slots[key] for key in exclude if key in self.slots]
+        if dropped:
+            slots = slots[~np.isin(slots, dropped)]
+        price = np.where(np.isfinite(self.current_price[slots]), self.current_price[slots], self.entry_price[slots])
+        return self.symbol[slots], self.strategy[slots], self.quantity[slots] * price
+
+    # Marking and persistence
+
+    def mark(self, names, closes):
+        """Mark every position to market in one step.
+
+        names, closes: latest prices as sorted parallel arrays (see
+        price_loader.load_latest_prices). Positions without a price keep
+        their last mark. Returns the number of positions whose mark moved.
+        """
+        if not self.slots or len(names) == 0:
+            return 0
+        slots = self._active()
+        symbols = self.symbol[slots]
+        idx = np.minimum(np.searchsorted(names, symbols), len(names) - 1)
+        priced = names[idx] == symbols
+        prices = np.where(priced, closes[idx], np.nan)
+        moved = priced & (prices != self.current_price[slots])
+        self.current_price[slots[moved]] = prices[moved]
+        for slot in slots[moved].tolist():
+            self.marked.add((self.symbol[slot], self.strategy[slot]))
+        return int(moved.sum())
+
+    def flush(self):
+        """Write the diff since the last flush; call inside db.transaction(),
+        after the trades that produced it were logged.
+
+        Returns (updated, closed): position dicts (with unrealized_pnl and
+        position_value) of opened and re-marked positions, and the
+        (symbol, strategy) keys that were closed.
+        """
+        keys = sorted(self.opened | self.marked)
+        slots = np.array([self.slots[key] for key in keys], dtype=np.int64)
+        quantity = self.quantity[slots]
+        current = self.current_price[slots]
+        value = current * quantity
+        unrealized = (current - self.entry_price[slots]) * quantity
+
+        updated = []
+        upserts = []
+        marks = []
+        for i, key in enumerate(keys):
+            position = self._position(slots[i])
+            position['unrealized_pnl'] = float(unrealized[i])
+            position['position_value'] = float(value[i])
+            updated.append(position)
+            if key in self.opened:
+                upserts.append((
+                    key[0], key[1], position['quantity'], position['entry_price'], position['current_price'],
+                    position['unrealized_pnl'], position['position_value'], position['entry_date'],
+                ))
+            else:
+                marks.append((
+                    position['current_price'], position['unrealized_pnl'], position['position_value'], key[0], key[1],
+                ))
+        closed = sorted(self.closed)
+
+        if closed:
+            db.execute_many(DELETE_QUERY, closed)
+        if upserts:
+            db.execute_many(UPSERT_QUERY, upserts)
+        if marks:
+            db.execute_many(MARK_QUERY, marks)
+        self._reset_diff()
+        self.last_trade_id = self._trade_log_head()
+        return updated, closed
+
+# Global position book
+position_book = PositionBook()
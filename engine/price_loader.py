@@ -0,0 +1,232 @@
+import json
+import logging
+import numpy as np
+from database import db
+from bar_store import bar_store
+from config import PRICE_SOURCE
+
+logger = logging.getLogger(__name__)
+
+# Bulk, columnar access to market_prices.
+#
+# Each loader runs a single query for the whole universe instead of one
+# query per symbol. The symbol list is walked first (given symbols are
+# passed as one JSON array, otherwise the distinct symbols are found by a
+# skip scan), then every symbol is an index seek on
+# idx_market_prices_symbol_timestamp, so the cost follows the rows
+# returned rather than the size of the table. With PRICE_SOURCE =
+# 'bar_store' the same shapes are read from the memory-mapped bar store
+# instead.
+
+def _symbols_cte(symbols):
+    """WITH clause defining syms(symbol), and its parameters"""
+    if symbols is not None:
+        return "WITH syms(symbol) AS (SELECT DISTINCT value FROM json_each(?))", [json.dumps(list(symbols))]
+    # One index seek per distinct symbol instead of a scan
+    return """
+    WITH RECURSIVE syms(symbol) AS (
+        SELECT MIN(symbol) FROM market_prices
+        UNION ALL
+        SELECT (SELECT MIN(symbol) FROM market_prices WHERE symbol > syms.symbol)
+        FROM syms WHERE syms.symbol IS NOT NULL
+    )""", []
+
+def load_symbols():
+    """Every symbol in market_prices, sorted, found by skip scan"""
+    if PRICE_SOURCE == 'bar_store':
+        return sorted(bar_store.symbols())
+    cte, params = _symbols_cte(None)
+    rows = db.fetch_rows(f"{cte} SELECT symbol FROM syms WHERE symbol IS NOT NULL", params)
+    return [row[0] for row in rows]
+
+def _cutoffs_cte(limit, symbols):
+    """WITH clause defining cutoffs(symbol, since), and its parameters.
+
+    since is the timestamp limit bars back per symbol (-1 for shorter
+    histories), found by walking the symbol's index entries, so the bars
+    after it are one range seek.
+    """
+    cte, params = _symbols_cte(symbols)
+    return f"""
+    {cte},
+    cutoffs(symbol, since) AS MATERIALIZED (
+        SELECT symbol, COALESCE((
+            SELECT timestamp FROM market_prices m
+            WHERE m.symbol = syms.symbol
+            ORDER BY m.timestamp DESC LIMIT 1 OFFSET ?
+        ), -1)
+        FROM syms WHERE symbol IS NOT NULL
+    )""", params + [limit]
+
+def load_latest_prices(symbols=None):
+    """Latest close for every symbol in one query.
+
+    Returns (symbols, closes) as parallel NumPy arrays sorted by symbol.
+    """
+    if PRICE_SOURCE == 'bar_store':
+        return bar_store.load_latest(symbols)
+    
+    cte, params = _symbols_cte(symbols)
+    query = f"""
+    {cte}
+    SELECT symbol, close FROM (
+        SELECT symbol, (
+            SELECT close FROM market_prices m
+            WHERE m.symbol = syms.symbol AND m.close IS NOT NULL
+            ORDER BY m.timestamp DESC LIMIT 1
+        ) AS close
+        FROM syms WHERE symbol IS NOT NULL
+    )
+    WHERE close IS NOT NULL
+    ORDER BY symbol
+    """
+    rows = db.fetch_rows(query, params)
+
+    names = np.array([row[0] for row in rows], dtype=object)
+    closes = np.fromiter((row[1] for row in rows), dtype=np.float64, count=len(rows))
+    return names, closes
+
+def load_latest_price_dict(symbols=None):
+    """Latest close per symbol as {symbol: price}"""
+    names, closes = load_latest_prices(symbols)
+    return dict(zip(names.tolist(), closes.tolist()))
+
+def load_price_histories(limit=100, symbols=None):
+    """Last limit bars of every symbol in one query.
+
+    Returns (symbols, timestamps, closes, counts):
+    symbols     object array, sorted
+    timestamps  int64 (symbols x limit), chronological, 0 where missing
+    closes      float64 (symbols x limit), chronological, NaN where missing
+    counts      number of real bars per symbol
+
+    Histories shorter than limit are right-aligned, so the last column is
+    always each symbol's newest bar.
+    """
+    if PRICE_SOURCE == 'bar_store':
+        return bar_store.load_histories(limit, symbols)
+    
+    cte, params = _cutoffs_cte(limit, symbols)
+    query = f"""
+    {cte}
+    SELECT m.symbol, m.timestamp, m.close
+    FROM cutoffs c
+    JOIN market_prices m ON m.symbol = c.symbol AND m.timestamp > c.since
+    ORDER BY m.symbol, m.timestamp
+    """
+    rows = db.fetch_rows(query, params)
+
+    names = sorted({row[0] for row in rows})
+    index = {symbol: i for i, symbol in enumerate(names)}
+
+    timestamps = np.zeros((len(names), limit), dtype=np.int64)
+    closes = np.full((len(names), limit), np.nan, dtype=np.float64)
+    counts = np.zeros(len(names), dtype=np.int64)
+
+    if rows:
+        row_idx = np.fromiter((index[row[0]] for row in rows), dtype=np.int64, count=len(rows))
+        per_symbol = np.bincount(row_idx, minlength=len(names))
+        # Rows come chronological per symbol; the newest belongs in the last column
+        first_row = np.cumsum(per_symbol) - per_symbol
+        position = np.arange(len(rows)) - first_row[row_idx]
+        col_idx = limit - per_symbol[row_idx] + position
+        timestamps[row_idx, col_idx] = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+        closes[row_idx, col_idx] = np.fromiter(
+            (np.nan if row[2] is None else row[2] for row in rows), dtype=np.float64, count=len(rows)
+        )
+        counts = per_symbol
+
+    return np.array(names, dtype=object), timestamps, closes, counts
+
+def load_price_matrix(symbols=None, start=None, end=None):
+    """Full close history aligned on a common time axis, in one query.
+
+    start/end are optional Unix ms bounds (inclusive). Returns
+    (symbols, timestamps, closes): timestamps is the sorted union of all
+    bar times and closes is (symbols x timestamps), forward-filled over
+    gaps and NaN before each symbol's first bar.
+    """
+    if PRICE_SOURCE == 'bar_store':
+        names, timestamps, closes = bar_store.load_aligned(symbols, start, end)
+        return names, timestamps, forward_fill(closes)
+    
+    conditions = []
+    params = []
+    if start is not None:
+        conditions.append("m.timestamp >= ?")
+        params.append(start)
+    if end is not None:
+        conditions.append("m.timestamp <= ?")
+        params.append(end)
+    if symbols is None:
+        # Every row in the range is wanted: a plain scan beats per-symbol seeks
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        query = f"SELECT m.symbol, m.timestamp, m.close FROM market_prices m {where}"
+    else:
+        cte, cte_params = _symbols_cte(symbols)
+        params = cte_params + params
+        query = f"""
+        {cte}
+        SELECT m.symbol, m.timestamp, m.close
+        FROM syms JOIN market_prices m ON {' AND '.join(['m.symbol = syms.symbol'] + conditions)}
+        """
+    rows = db.fetch_rows(query, params)
+
+    if not rows:
+        return np.array([], dtype=object), np.array([], dtype=np.int64), np.empty((0, 0))
+
+    row_symbols = np.array([row[0] for row in rows], dtype=object)
+    row_times = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+    row_closes = np.fromiter(
+        (np.nan if row[2] is None else row[2] for row in rows), dtype=np.float64, count=len(rows)
+    )
+
+    names, row_idx = np.unique(row_symbols, return_inverse=True)
+    timestamps, col_idx = np.unique(row_times, return_inverse=True)
+    closes = np.full((len(names), len(timestamps)), np.nan)
+    closes[row_idx, col_idx] = row_closes
+
+    return names, timestamps, forward_fill(closes)
+
+def load_recent_price_matrix(bars, symbols=None):
+    """The last bars timestamps of load_price_matrix.
+
+    Returns (symbols, timestamps, closes) aligned on the union time axis
+    and forward-filled within it; a symbol without a bar at the first
+    timestamp starts with NaN, so complete coverage is
+    np.isfinite(closes).all(axis=1). The window start is found from
+    each symbol's last bars index entries, without reading closes.
+    """
+    if PRICE_SOURCE == 'bar_store':
+        _, timestamps, _, counts = bar_store.load_histories(bars, symbols)
+        recent = np.unique(timestamps[np.arange(bars) >= bars - counts[:, None]])[-bars:]
+        start = int(recent[0]) if len(recent) else None
+    else:
+        # The union's last bars timestamps are among each symbol's last bars
+        cte, params = _cutoffs_cte(bars, symbols)
+        rows = db.fetch_rows(f"""
+        {cte}
+        SELECT MIN(timestamp) FROM (
+            SELECT DISTINCT m.timestamp
+            FROM cutoffs c
+            JOIN market_prices m ON m.symbol = c.symbol AND m.timestamp > c.since
+            ORDER BY m.timestamp DESC LIMIT ?
+        )
+        """, params + [bars])
+        start = rows[0][0] if rows else None
+    if start is None:
+        return np.array([], dtype=object), np.array([], dtype=np.int64), np.empty((0, 0))
+
+    names, timestamps, closes = load_price_matrix(symbols, start=start)
+    return names, timestamps[-bars:], closes[:, -bars:]
+
+def forward_fill(closes):
+    """Carry each row's last real value over NaN gaps (leading NaN stay)"""
+    if closes.size == 0:
+        return closes
+    have = np.isfinite(closes)
+    last = np.where(have, np.arange(closes.shape[1]), 0)
+    np.maximum.accumulate(last, axis=1, out=last)
+    filled = closes[np.arange(closes.shape[0])[:, None], last]
+    seen = np.maximum.accumulate(have, axis=1)
+    return np.where(seen, filled, np.nan)
@@ -0,0 +1,127 @@
+import numpy as np
+
+# Cross-sectional ranking on arrays.
+#
+# Every selector takes a 1-D array of scores (NaN = not ranked) and returns
+# (indices, signals, strengths) for the selected symbols only: signal is
+# 1 (long) or -1 (short), strength is in [0.7, 1.0] and grows towards the
+# extremes. Top and bottom groups are found with np.argpartition, so only
+# the selected names are ever sorted.
+
+def _ordered(scores, indices):
+    """indices sorted by descending score"""
+    return indices[np.argsort(-scores[indices], kind='stable')]
+
+def top_bottom(scores, n_long, n_short):
+    """Indices of the n_long highest and n_short lowest finite scores.
+
+    Both are returned in descending score order (best long first, worst
+    short last).
+    """
+    valid = np.flatnonzero(np.isfinite(scores))
+    values = scores[valid]
+    n_long = min(n_long, len(valid))
+    n_short = min(n_short, len(valid) - n_long)
+    longs = shorts = np.empty(0, dtype=np.int64)
+    if n_long > 0:
+        longs = _ordered(scores, valid[np.argpartition(-values, n_long - 1)[:n_long]])
+    if n_short > 0:
+        shorts = _ordered(scores, valid[np.argpartition(values, n_short - 1)[:n_short]])
+    return longs, shorts
+
+def fraction_signals(scores, top_fraction, bottom_fraction):
+    """Long the top fraction, short the bottom fraction of the ranked names"""
+    n = int(np.isfinite(scores).sum())
+    if n == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+    # The epsilon keeps exact fractions (e.g. 15 * 0.8) from rounding down
+    threshold_long = max(1, int(n * top_fraction + 1e-9))
+    threshold_short = max(1, int(n * (1 - bottom_fraction) + 1e-9))
+    # Longs win where the fractions overlap
+    first_short = max(threshold_long, threshold_short)
+    longs, shorts = top_bottom(scores, threshold_long, n - first_short)
+
+    # Strength by rank: 1.0 for the best long, falling to 0.7; 0.7 at the
+    # short threshold, rising towards 1.0 for the worst
+    long_strength = 1.0 - np.arange(len(longs)) / threshold_long * 0.3
+    short_strength = (first_short - threshold_short + np.arange(len(shorts))) / max(n - threshold_short, 1) * 0.3 + 0.7
+    return (
+        np.concatenate([longs, shorts]),
+        np.concatenate([np.ones(len(longs), dtype=np.int64), -np.ones(len(shorts), dtype=np.int64)]),
+        np.concatenate([long_strength, short_strength]),
+    )
+
+def sector_signals(scores, sectors, top_fraction, bottom_fraction):
+    """fraction_signals within each sector, so longs and shorts offset per sector.
+
+    sectors: array of sector labels parallel to scores. Sectors with fewer
+    than two ranked names are skipped: they cannot be hedged.
+    """
+    labels, group = np.unique(np.asarray(sectors, dtype=str), return_inverse=True)
+    ranked = np.isfinite(scores)
+    counts = np.bincount(group[ranked], minlength=len(labels))
+    parts = []
+    for g in np.flatnonzero(counts >= 2):
+        members = np.flatnonzero(group == g)
+        indices, signals, strengths = fraction_signals(scores[members], top_fraction, bottom_fraction)
+        parts.append((members[indices], signals, strengths))
+    if not parts:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+    return tuple(np.concatenate(arrays) for arrays in zip(*parts))
+
+def percentile_signals(scores, buckets):
+    """Long the top percentile bucket, short the bottom one.
+
+    Percentiles run from 0 (lowest score) to 1 (highest) over the ranked
+    names; with buckets=5 that is long the top quintile, short the bottom.
+    """
+    valid = np.flatnonzero(np.isfinite(scores))
+    n = len(valid)
+    if n < 2:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+    percentile = np.empty(n)
+    percentile[np.argsort(scores[valid], kind='stable')] = np.arange(n) / (n - 1)
+    width = 1.0 / buckets
+    bucket = np.minimum((percentile * buckets).astype(np.int64), buckets - 1)
+
+    longs = bucket == buckets - 1
+    shorts = bucket == 0
+    strengths = np.where(
+        longs,
+        0.7 + 0.3 * (percentile - (1 - width)) / width,
+        0.7 + 0.3 * (width - percentile) / width,
+    )
+    selected = longs | shorts
+    return valid[selected], np.where(longs, 1, -1)[selected], np.clip(strengths[selected], 0.7, 1.0)
+
+def momentum_scores(closes, lookbacks):
+    """Momentum of every symbol at every bar, for several horizons at once.
+
+    closes: (symbols x bars) array, chronological, NaN where missing.
+    lookbacks: [(lookback, skip)] in bars; each horizon is the percent
+    change from bar t - lookback to bar t - skip, so (252, 21) is 12-1
+    month momentum. A single horizon is returned as is; several are
+    z-scored across symbols at each bar and averaged, and a symbol needs
+    all of them to be ranked. Returns a (symbols x bars) array.
+    """
+    closes = np.asarray(closes, dtype=np.float64)
+    n_bars = closes.shape[1]
+    horizons = np.full((len(lookbacks),) + closes.shape, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for k, (lookback, skip) in enumerate(lookbacks):
+            if not 0 <= skip < lookback:
+                raise ValueError(f"Invalid momentum lookback {(lookback, skip)}: need 0 <= skip < lookback")
+            if n_bars > lookback:
+                start = closes[:, :n_bars - lookback]
+                end = closes[:, lookback - skip:n_bars - skip]
+                horizons[k, :, lookback:] = (end - start) / start * 100
+
+        if len(lookbacks) == 1:
+            return horizons[0]
+
+        finite = np.isfinite(horizons)
+        count = finite.sum(axis=1, keepdims=True)
+        mean = np.where(finite, horizons, 0).sum(axis=1, keepdims=True) / count
+        var = np.where(finite, (horizons - mean) ** 2, 0).sum(axis=1, keepdims=True) / count
+        z = (horizons - mean) / np.sqrt(var)
+    return z.mean(axis=0)
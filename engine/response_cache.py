@@ -0,0 +1,67 @@
+import json
+import os
+import time
+import logging
+import tempfile
+from pathlib import Path
+from config import API_CACHE_DIR
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+class ResponseCache:
+    """On-disk cache of raw API responses.
+    
+    Entries are keyed by (function, symbol, outputsize) and stored as one
+    JSON file each, together with the time they were fetched. Freshness is
+    decided by the caller's TTL, so a stale entry can still be read back
+    and refreshed incrementally instead of refetched in full.
+    """
+    
+    def __init__(self, cache_dir=None):
+        self.cache_dir = Path(cache_dir or API_CACHE_DIR)
+    
+    def _path(self, function, symbol, outputsize=None):
+        name = f"{symbol}-{outputsize}" if outputsize else symbol
+        return self.cache_dir / function / f"{name}.json"
+    
+    def get(self, function, symbol, outputsize=None):
+        """Return (data, age_seconds), or (None, None) on a miss"""
+        path = self._path(function, symbol, outputsize)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None, None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable cache entry {path}: {e}")
+            return None, None
+        return entry['data'], time.time() - entry['fetched_at']
+    
+    def get_fresh(self, function, symbol, outputsize=None, ttl=0):
+        """Return cached data if it is younger than ttl seconds, else None"""
+        data, age = self.get(function, symbol, outputsize)
+        if data is None or age > ttl:
+            registry.inc('trading_api_cache_lookups_total', function=function, result='miss')
+            return None
+        registry.inc('trading_api_cache_lookups_total', function=function, result='hit')
+        return data
+    
+    def put(self, function, symbol, data, outputsize=None):
+        """Store a response; the write is atomic so readers never see partial files"""
+        path = self._path(function, symbol, outputsize)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'fetched_at': time.time(), 'data': data}, f)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+    
+    def invalidate(self, function, symbol, outputsize=None):
+        try:
+            self._path(function, symbol, outputsize).unlink()
+        except FileNotFoundError:
+            pass
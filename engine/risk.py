@@ -0,0 +1,202 @@
+import math
+import logging
+import numpy as np
+from statistics import NormalDist
+from metrics import registry
+from price_loader import load_recent_price_matrix
+from config import (
+    MAX_POSITIONS, MAX_GROSS_EXPOSURE, MAX_NET_EXPOSURE, MAX_SYMBOL_EXPOSURE, MAX_SECTOR_EXPOSURE,
+    MAX_STRATEGY_EXPOSURE, MAX_VAR, VAR_CONFIDENCE, VAR_LOOKBACK, SECTORS,
+)
+
+logger = logging.getLogger(__name__)
+
+def load_returns(symbols, lookback=VAR_LOOKBACK):
+    """Demeaned log returns over the last lookback bar times, (bars x symbols).
+
+    Only symbols are read, aligned on a common time axis and forward-
+    filled (see load_recent_price_matrix). Columns follow symbols;
+    missing returns are 0 so they add no variance. Portfolio variance of
+    exposures w is then ||R @ w||^2 / (bars - 1), without forming the
+    covariance matrix.
+    """
+    symbols = list(symbols)
+    names, _, closes = load_recent_price_matrix(lookback + 1, symbols)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = np.diff(np.log(closes), axis=1)
+        returns = returns - np.nanmean(returns, axis=1, keepdims=True)
+    returns = np.where(np.isfinite(returns), returns, 0.0)
+
+    matrix = np.zeros((lookback, len(symbols)))
+    index = {symbol: i for i, symbol in enumerate(names.tolist())}
+    for j, symbol in enumerate(symbols):
+        i = index.get(symbol)
+        if i is not None:
+            matrix[lookback - returns.shape[1]:, j] = returns[i]
+    return matrix
+
+def _scale_groups(groups, n_groups, held_groups, held_gross, order_gross, scale, limit):
+    """Scale orders so every group's gross exposure stays within limit.
+
+    Orders of a group over its limit share the remaining room pro rata.
+    limit is a scalar or an array with one limit per group.
+    """
+    base = np.bincount(held_groups, held_gross, minlength=n_groups)
+    added = np.bincount(groups, order_gross * scale, minlength=n_groups)
+    room = np.clip(limit - base, 0.0, None)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        factor = np.where(added > room, room / added, 1.0)
+    return scale * factor[groups]
+
+class RiskEngine:
+    """Pre-trade limits applied to the whole candidate order set at once.
+
+    Closing and reducing orders always pass: they only reduce risk.
+    Opening and increasing orders are scaled down, or rejected when
+    nothing is left, so that after the trades the book respects, as
+    fractions of portfolio value: per-symbol, per-sector and per-strategy
+    gross exposure, total gross and net exposure, then MAX_POSITIONS open
+    positions (largest new positions first) and a parametric one-bar VaR
+    at VAR_CONFIDENCE. Every check is a handful of array operations over
+    all orders.
+    """
+
+    def __init__(self, max_positions=MAX_POSITIONS, max_gross=MAX_GROSS_EXPOSURE, max_net=MAX_NET_EXPOSURE,
+                 max_symbol=MAX_SYMBOL_EXPOSURE, max_sector=MAX_SECTOR_EXPOSURE,
+                 max_strategy=MAX_STRATEGY_EXPOSURE, max_var=MAX_VAR, confidence=VAR_CONFIDENCE,
+                 sectors=SECTORS):
+        self.max_positions = max_positions
+        self.max_gross = max_gross
+        self.max_net = max_net
+        self.max_symbol = max_symbol
+        self.max_sector = max_sector
+        self.max_strategy = max_strategy
+        self.max_var = max_var
+        self.z = NormalDist().inv_cdf(confidence)
+        self.sectors = sectors
+
+    def check(self, trades, held, equity, returns=None):
+        """Apply the limits; returns (accepted trades, rejected trades).
+
+        held: (symbols, strategies, values) arrays of the positions that
+        stay open, values signed at market (positions being reduced
+        count at their current size). returns: optional callable
+        taking the list of symbols involved and returning their return
+        matrix (see load_returns); without it VaR is not checked.
+        Scaled trades are copies with a smaller quantity and a
+        'risk_scale' entry; rejected ones carry a 'risk_reason'.
+        """
+        closes = [trade for trade in trades if trade['action'] in ('close', 'reduce')]
+        opens = [trade for trade in trades if trade['action'] not in ('close', 'reduce')]
+        if not opens:
+            return closes, []
+
+        held_symbols, held_strategies, held_values = held
+        n = len(opens)
+        order_symbols, order_strategies, buys, quantity, price, new = zip(*[
+            (t['symbol'], t['strategy_type'], t['side'] == 'BUY', t['quantity'], t['price'], t['action'] == 'open')
+            for t in opens
+        ])
+        quantity = np.array(quantity, dtype=np.float64)
+        side = np.where(buys, 1.0, -1.0)
+        gross = quantity * np.array(price, dtype=np.float64)
+
+        # One integer code per symbol, sector and strategy across book and orders
+        symbols = {}
+        symbol_codes = np.array(
+            [symbols.setdefault(s, len(symbols)) for s in (*held_symbols, *order_symbols)], dtype=np.int64
+        )
+        symbols = list(symbols)
+        # Symbols without a configured sector count as their own sector
+        sectors = {}
+        sector_of = np.array([sectors.setdefault(self.sectors.get(s, s), len(sectors)) for s in symbols], dtype=np.int64)
+        sector_codes = sector_of[symbol_codes]
+        strategies = {}
+        strategy_codes = np.array(
+            [strategies.setdefault(s, len(strategies)) for s in (*held_strategies, *order_strategies)], dtype=np.int64
+        )
+        strategies = list(strategies)
+        h = len(held_values)
+        held_values = np.asarray(held_values, dtype=np.float64)
+        held_gross = np.abs(held_values)
+
+        scale = np.ones(n)
+        reason = np.full(n, '', dtype=object)
+
+        def apply(new_scale, name):
+            reason[new_scale < scale] = name
+            return new_scale
+
+        limits = [
+            ('symbol', symbol_codes, len(symbols), self.max_symbol * equity),
+            ('sector', sector_codes, len(sectors), self.max_sector * equity),
+            ('strategy', strategy_codes, len(strategies), np.array([
+                self.max_strategy.get(s, self.max_gross) for s in strategies
+            ]) * equity),
+        ]
+        for name, codes, n_groups, limit in limits:
+            scale = apply(_scale_groups(codes[h:], n_groups, codes[:h], held_gross, gross, scale, limit), name)
+        scale = apply(_scale_groups(
+            np.zeros(n, dtype=np.int64), 1, np.zeros(h, dtype=np.int64), held_gross, gross, scale, self.max_gross * equity
+        ), 'gross')
+
+        # Net exposure: scale only the orders that push it further out
+        net = held_values.sum() + (side * gross * scale).sum()
+        if abs(net) > self.max_net * equity:
+            direction = math.copysign(1, net)
+            same = side == direction
+            pushing = (side * gross * scale)[same].sum()
+            allowed = direction * self.max_net * equity - (net - pushing)
+            factor = min(max(allowed / pushing, 0.0), 1.0) if pushing else 1.0
+            scale = apply(np.where(same, scale * factor, scale), 'net')
+
+        # Position count: the largest surviving new positions take the free slots
+        alive = np.flatnonzero(np.array(new) & (np.floor(quantity * scale) > 0))
+        slots = max(self.max_positions - h, 0)
+        if len(alive) > slots:
+            keep = alive[np.argpartition(-(gross * scale)[alive], slots - 1)[:slots]] if slots else alive[:0]
+            capped = scale.copy()
+            capped[alive] = 0.0
+            capped[keep] = scale[keep]
+            scale = apply(capped, 'max_positions')
+
+        # VaR of the post-trade book: var(s) = C + 2sB + s^2 A for a common scale s
+        if returns is not None and self.max_var:
+            held_net = np.bincount(symbol_codes[:h], held_values, minlength=len(symbols))
+            order_net = np.bincount(symbol_codes[h:], side * gross * scale, minlength=len(symbols))
+            # Only symbols still carrying exposure contribute
+            exposed = np.flatnonzero((held_net != 0) | (order_net != 0))
+            matrix = returns([symbols[i] for i in exposed.tolist()]) if len(exposed) else np.empty((0, 0))
+            if len(matrix) > 1:
+                ra, rb = matrix @ held_net[exposed], matrix @ order_net[exposed]
+                a, b, c = rb @ rb, ra @ rb, ra @ ra
+                a, b, c = (x / (len(matrix) - 1) for x in (a, b, c))
+                limit = (self.max_var * equity / self.z) ** 2
+                if a > 0 and a + 2 * b + c > limit:
+                    if c <= limit:
+                        s = (-b + math.sqrt(max(b * b - a * (c - limit), 0.0))) / a
+                    else:
+                        # Already over the limit: keep only what lowers VaR
+                        s = -b / a
+                    scale = apply(scale * min(max(s, 0.0), 1.0), 'var')
+
+        final = np.floor(quantity * scale)
+        sizes, reasons = final.astype(np.int64).tolist(), reason.tolist()
+        accepted = closes + [opens[i] for i in np.flatnonzero(final >= quantity).tolist()]
+        rejected = [{**opens[i], 'risk_reason': reasons[i]} for i in np.flatnonzero(final <= 0).tolist()]
+        resized = [
+            {**opens[i], 'quantity': sizes[i], 'risk_scale': sizes[i] / opens[i]['quantity'], 'risk_reason': reasons[i]}
+            for i in np.flatnonzero((final > 0) & (final < quantity)).tolist()
+        ]
+        accepted += resized
+
+        scaled = len(resized)
+        registry.inc('trading_risk_orders_total', len(accepted) - len(closes) - scaled, result='accepted')
+        registry.inc('trading_risk_orders_total', scaled, result='scaled')
+        registry.inc('trading_risk_orders_total', len(rejected), result='rejected')
+        if scaled or rejected:
+            logger.info(f"Risk checks: {scaled} orders scaled down, {len(rejected)} rejected of {n} opening and increasing orders")
+        return accepted, rejected
+
+# Global risk engine
+risk_engine = RiskEngine()
@@ -0,0 +1,96 @@
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+class Job:
+    """A workflow that runs every interval seconds.
+
+    Runs are aligned to the wall clock like cron (interval 300 fires at
+    :00, :05, ...). after names an upstream job: if it is running when this
+    job fires, this job waits for it so it sees the fresh data.
+    """
+
+    def __init__(self, name, func, interval, after=None):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.after = after
+        self.next_run = None
+        self.idle = threading.Event()
+        self.idle.set()
+        self.runs = 0
+        self.skipped = 0
+
+    def schedule(self, now):
+        """Next aligned slot strictly after now"""
+        self.next_run = (now // self.interval + 1) * self.interval
+
+class Scheduler:
+    """Runs jobs on their own cadences inside one long-lived process.
+
+    Each job gets a worker thread, so stages that do not depend on each
+    other overlap. A job that is still running when its next tick comes
+    is not started twice: the missed ticks are coalesced into the next
+    slot. Module-level state (API session, SQLite connections, indicator
+    state, response cache) stays warm between ticks.
+    """
+
+    def __init__(self, jobs):
+        self.jobs = {job.name: job for job in jobs}
+        self.stop_event = threading.Event()
+        self.pool = ThreadPoolExecutor(max_workers=len(self.jobs), thread_name_prefix='job')
+
+    def _run(self, job):
+        upstream = self.jobs.get(job.after)
+        try:
+            if upstream is not None and not upstream.idle.is_set():
+                logger.info(f"{job.name}: waiting for {upstream.name} to finish")
+                upstream.idle.wait()
+            start = time.monotonic()
+            ok = job.func()
+            job.runs += 1
+            status = "✓" if ok is not False else "✗"
+            logger.info(f"{status} {job.name} finished in {time.monotonic() - start:.1f}s")
+        except Exception as e:
+            logger.error(f"✗ {job.name} failed: {e}")
+        finally:
+            job.idle.set()
+
+    def _fire(self, job, now):
+        if not job.idle.is_set():
+            job.skipped += 1
+            logger.warning(f"{job.name} still running, skipping tick")
+        else:
+            job.idle.clear()
+            self.pool.submit(self._run, job)
+        job.schedule(now)
+
+    def run(self, run_now=False):
+        """Block until stop() is called, then wait for running jobs"""
+        now = time.time()
+        for job in self.jobs.values():
+            job.schedule(now)
+            if run_now:
+                job.next_run = now
+        logger.info("Scheduler started: " + ", ".join(
+            f"{job.name} every {job.interval}s" for job in self.jobs.values()
+        ))
+
+        try:
+            while not self.stop_event.is_set():
+                now = time.time()
+                # Fire upstream jobs first so their dependents see them running
+                for job in self.jobs.values():
+                    if job.next_run <= now:
+                        self._fire(job, now)
+                wait = min(job.next_run for job in self.jobs.values()) - time.time()
+                self.stop_event.wait(max(wait, 0))
+        finally:
+            logger.info("Scheduler stopping, waiting for running jobs")
+            self.pool.shutdown(wait=True)
+
+    def stop(self):
+        self.stop_event.set()
@@ -1,65 +1,54 @@
 import logging
+import numpy as np
 from datetime import datetime
 from database import db
-from indicators import calculate_all_indicators
+from dashboard_cache import mark_dashboard_dirty
+from metrics import stage
+from events import publish, SIGNALS
+from price_loader import load_latest_price_dict, load_price_histories
+from indicator_state import indicator_store
+from ranking import momentum_scores
+from pairs import pair_store, active_pairs
 from strategies import MeanReversionStrategy, MomentumStrategy, StatisticalArbitrageStrategy, merge_signals
-from config import SYMBOLS
+from optimizer import optimizer
+from config import SYMBOLS, MOMENTUM_LOOKBACKS
 
 logger = logging.getLogger(__name__)
 
-def load_price_history(symbol, limit=100):
-    """Load price history for a symbol"""
-    query = "SELECT close FROM market_prices WHERE symbol = ? ORDER BY timestamp DESC LIMIT ?"
-    results = db.execute(query, (symbol, limit))
-    if not results:
-        return []
-    return [float(row['close']) for row in results]
+def momentum_for(symbols, indicators_dict):
+    """Momentum score per symbol over MOMENTUM_LOOKBACKS, NaN if unranked.
 
+    The streaming indicators already carry 90-bar momentum; other
+    horizons are computed from one load of the price matrix.
+    """
+    if MOMENTUM_LOOKBACKS == [(90, 0)]:
+        return np.array([indicators_dict[s].get('momentum', np.nan) for s in symbols], dtype=np.float64)
+    
+    limit = max(lookback for lookback, _ in MOMENTUM_LOOKBACKS) + 1
+    names, _, closes, _ = load_price_histories(limit, symbols)
+    latest = dict(zip(names.tolist(), momentum_scores(closes, MOMENTUM_LOOKBACKS)[:, -1].tolist()))
+    return np.array([latest.get(s, np.nan) for s in symbols], dtype=np.float64)
+
+@stage('signals', items=lambda result: len(result or []))
 def generate_signals():
     """Generate trading signals from all strategies"""
     logger.info("Starting signal generation...")
     
-    # Load current prices for all symbols
-    price_query = "SELECT DISTINCT symbol FROM market_prices"
-    symbol_results = db.execute(price_query)
-    
-    if not symbol_results:
-        logger.warning("No price data available")
-        return
-    
-    symbols = [row['symbol'] for row in symbol_results]
-    
-    # Get latest prices
-    price_dict = {}
-    for sym in symbols:
-        price_query = "SELECT close FROM market_prices WHERE symbol = ? ORDER BY timestamp DESC LIMIT 1"
-        price_results = db.execute(price_query, (sym,))
-        if price_results:
-            price_dict[sym] = float(price_results[0]['close'])
+    # Load latest prices for all symbols in one query
+    price_dict = load_latest_price_dict()
     
     if not price_dict:
         logger.warning("No price data available")
         return
     
-    # Calculate indicators for all symbols
-    indicators_dict = {}
+    # Bring streaming indicator state up to date with the bars that
+    # arrived since the last run
+    all_indicators = indicator_store.sync()
+    indicators_dict = {s: all_indicators[s] for s in SYMBOLS if s in price_dict and s in all_indicators}
     mean_rev_signals = {}
     
-    for symbol in SYMBOLS:
-        if symbol not in price_dict:
-            continue
-        
+    for symbol, indicators in indicators_dict.items():
         try:
-            prices = load_price_history(symbol, 100)
-            if not prices:
-                continue
-            
-            indicators = calculate_all_indicators(prices)
-            if not indicators:
-                continue
-            
-            indicators_dict[symbol] = indicators
-            
             # Mean reversion
             signal = MeanReversionStrategy.generate_signal(indicators)
             if signal and signal['signal'] != 0:
@@ -69,12 +58,22 @@ def generate_signals():
             logger.error(f"Error processing {symbol}: {e}")
     
     # Generate momentum signals
-    momentum_signals = MomentumStrategy.generate_signals(indicators_dict)
+    symbols = list(indicators_dict)
+    momentum_signals = MomentumStrategy.rank(
+        symbols,
+        momentum_for(symbols, indicators_dict),
+        [indicators_dict[s].get('rsi', 50) for s in symbols],
+        [indicators_dict[s].get('volatility', 0.02) for s in symbols],
+    )
     for symbol, sig in momentum_signals.items():
         logger.info(f"{symbol} Momentum: signal={sig['signal']}")
     
+    # Bring the rolling spread statistics of the traded pairs up to date
+    # (discovered pairs come from the separate 'pairs' job)
+    pair_stats = pair_store.sync(active_pairs())
+    
     # Generate stat arb signals
-    stat_arb_signals = StatisticalArbitrageStrategy.generate_signals(price_dict)
+    stat_arb_signals = StatisticalArbitrageStrategy.generate_signals(pair_stats)
     for symbol, sig in stat_arb_signals.items():
         logger.info(f"{symbol} Stat Arb: signal={sig['signal']}")
     
@@ -85,16 +84,22 @@ def generate_signals():
         logger.info("No signals generated")
         return
     
+    # Size the merged signals jointly from the cached covariance
+    try:
+        optimizer.size(all_signals, SYMBOLS)
+    except Exception as e:
+        logger.error(f"Portfolio optimizer failed, keeping independent sizes: {e}")
+    
     # Insert signals into database
     insert_query = """
     INSERT OR REPLACE INTO signals 
-    (symbol, strategy_type, signal, signal_strength, z_score, momentum_score, rsi, realized_vol, recommended_size, timestamp)
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    (symbol, strategy_type, signal, signal_strength, z_score, momentum_score, rsi, realized_vol, recommended_size, size_scale, hedge_ratio, timestamp)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
     """
     
-    for sig in all_signals:
-        try:
-            db.execute(insert_query, (
+    with db.transaction():
+        db.execute_many(insert_query, [
+            (
                 sig['symbol'],
                 sig['strategy_type'],
                 sig['signal'],
@@ -104,10 +109,22 @@ def generate_signals():
                 sig.get('rsi', 50),
                 sig.get('realized_vol', 0.02),
                 sig.get('recommended_size', 0),
+                sig.get('size_scale', 1.0),
+                sig.get('hedge_ratio'),
                 sig['timestamp'],
-            ))
-        except Exception as e:
-            logger.error(f"Error inserting signal for {sig['symbol']}: {e}")
+            )
+            for sig in all_signals
+        ])
+        publish(SIGNALS, [
+            {
+                'symbol': sig['symbol'],
+                'strategy': sig['strategy_type'],
+                'signal': 'LONG' if sig['signal'] == 1 else 'SHORT' if sig['signal'] == -1 else 'NEUTRAL',
+                'strength': float(sig['signal_strength']),
+            }
+            for sig in all_signals
+        ])
+    mark_dashboard_dirty()
     
     logger.info(f"Signal generation complete: {len(all_signals)} signals inserted")
     return all_signals
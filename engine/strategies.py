@@ -1,15 +1,22 @@
 import logging
+import numpy as np
 from datetime import datetime
 from indicators import calculate_all_indicators
-from config import PAIRS
+from ranking import fraction_signals, sector_signals, percentile_signals
+from config import MOMENTUM_MODE, MOMENTUM_BUCKETS, SECTORS
 
 logger = logging.getLogger(__name__)
 
 class MeanReversionStrategy:
     """Buy oversold, sell overbought (Bollinger Bands + RSI)"""
     
+    RSI_OVERSOLD = 30
+    RSI_OVERBOUGHT = 70
+    BB_PERIOD = 20
+    BB_NUM_STD = 2
+    
     @staticmethod
-    def generate_signal(indicators):
+    def generate_signal(indicators, rsi_oversold=RSI_OVERSOLD, rsi_overbought=RSI_OVERBOUGHT):
         if not indicators:
             return None
         
@@ -24,14 +31,14 @@ class MeanReversionStrategy:
         signal = 0
         signal_strength = 0
         
-        # Long: price below lower band AND RSI < 30
-        if current < lower and rsi < 30:
+        # Long: price below lower band AND RSI oversold
+        if current < lower and rsi < rsi_oversold:
             signal = 1
-            signal_strength = min(1.0, (30 - rsi) / 30)
-        # Short: price above upper band AND RSI > 70
-        elif current > upper and rsi > 70:
+            signal_strength = min(1.0, (rsi_oversold - rsi) / 30)
+        # Short: price above upper band AND RSI overbought
+        elif current > upper and rsi > rsi_overbought:
             signal = -1
-            signal_strength = min(1.0, (rsi - 70) / 30)
+            signal_strength = min(1.0, (rsi - rsi_overbought) / 30)
         
         return {
             'signal': signal,
@@ -42,88 +49,99 @@ class MeanReversionStrategy:
         }
 
 class MomentumStrategy:
-    """Trend following via cross-sectional ranking"""
+    """Trend following via cross-sectional ranking (see ranking.py)"""
+    
+    TOP_FRACTION = 0.2
+    BOTTOM_FRACTION = 0.2
+    MODE = MOMENTUM_MODE
+    BUCKETS = MOMENTUM_BUCKETS
+    
+    @staticmethod
+    def rank(symbols, scores, rsi=None, volatility=None, top_fraction=TOP_FRACTION,
+             bottom_fraction=BOTTOM_FRACTION, mode=MODE, sectors=None, buckets=BUCKETS):
+        """Generate momentum signals from parallel arrays
+        
+        scores: momentum per symbol, NaN for symbols not ranked.
+        mode: 'rank' (top/bottom fractions of the universe), 'sector'
+        (the same within each sector of sectors) or 'percentile' (top and
+        bottom of buckets percentile buckets). sectors defaults to
+        config.SECTORS, where, as in the risk engine, a symbol without a
+        sector is its own; being a sector of one, it is never ranked.
+        """
+        scores = np.asarray(scores, dtype=np.float64)
+        if mode == 'rank':
+            indices, directions, strengths = fraction_signals(scores, top_fraction, bottom_fraction)
+        elif mode == 'sector':
+            if sectors is None:
+                sectors = [SECTORS.get(symbol, symbol) for symbol in symbols]
+            indices, directions, strengths = sector_signals(scores, sectors, top_fraction, bottom_fraction)
+        elif mode == 'percentile':
+            indices, directions, strengths = percentile_signals(scores, buckets)
+        else:
+            raise ValueError(f"Unknown momentum mode: {mode}")
+        
+        signals = {}
+        for i, signal, strength in zip(indices.tolist(), directions.tolist(), strengths.tolist()):
+            signals[symbols[i]] = {
+                'signal': signal,
+                'signal_strength': strength,
+                'z_score': 0,
+                'momentum': float(scores[i]),
+                'rsi': float(rsi[i]) if rsi is not None else 50,
+                'realized_vol': float(volatility[i]) if volatility is not None else 0.02,
+            }
+        return signals
     
     @staticmethod
-    def generate_signals(indicators_dict):
+    def generate_signals(indicators_dict, top_fraction=TOP_FRACTION, bottom_fraction=BOTTOM_FRACTION, **kwargs):
         """Generate momentum signals for all symbols
         
-        indicators_dict: {symbol: indicators}
+        indicators_dict: {symbol: indicators}; see rank() for kwargs
         """
         if not indicators_dict:
             return {}
         
-        # Sort by momentum score
-        sorted_symbols = sorted(
-            indicators_dict.items(),
-            key=lambda x: x[1].get('momentum', 0),
-            reverse=True
+        symbols = list(indicators_dict)
+        values = list(indicators_dict.values())
+        return MomentumStrategy.rank(
+            symbols,
+            [v.get('momentum', 0) for v in values],
+            [v.get('rsi', 50) for v in values],
+            [v.get('volatility', 0.02) for v in values],
+            top_fraction, bottom_fraction, **kwargs
         )
-        
-        threshold_long = max(1, len(sorted_symbols) // 5)  # Top 20%
-        threshold_short = max(1, len(sorted_symbols) * 4 // 5)  # Bottom 20%
-        
-        signals = {}
-        for idx, (symbol, indicators) in enumerate(sorted_symbols):
-            signal = 0
-            signal_strength = 0
-            
-            if idx < threshold_long:
-                signal = 1
-                signal_strength = 1.0 - (idx / threshold_long) * 0.3
-            elif idx >= threshold_short:
-                signal = -1
-                signal_strength = ((idx - threshold_short) / (len(sorted_symbols) - threshold_short)) * 0.3 + 0.7
-            
-            if signal != 0:
-                signals[symbol] = {
-                    'signal': signal,
-                    'signal_strength': signal_strength,
-                    'z_score': 0,
-                    'momentum': indicators.get('momentum', 0),
-                    'rsi': indicators.get('rsi', 50),
-                    'realized_vol': indicators.get('volatility', 0.02),
-                }
-        
-        return signals
 
 class StatisticalArbitrageStrategy:
-    """Pairs trading with z-score"""
+    """Pairs trading on the z-score of a rolling-OLS spread (see pairs.py)"""
+    
+    Z_ENTRY = 2
     
     @staticmethod
-    def generate_signals(price_dict):
+    def generate_signals(pair_stats, z_entry=Z_ENTRY):
         """Generate stat arb signals
         
-        price_dict: {symbol: current_price}
+        pair_stats: {"y/x": {'z_score', 'hedge_ratio', 'spread_std', ...}}
         """
         signals = {}
         
-        for long_sym, short_sym in PAIRS:
-            if long_sym not in price_dict or short_sym not in price_dict:
-                continue
-            
-            long_price = price_dict[long_sym]
-            short_price = price_dict[short_sym]
-            
-            # Simple z-score (simplified - real calculation would use historical spreads)
-            spread = long_price - short_price
-            z_score = (spread - 100) / 50  # Placeholder
+        for pair, stats in pair_stats.items():
+            z_score = stats['z_score']
             
             signal = 0
-            if z_score > 2:
+            if z_score > z_entry:
                 signal = -1  # Short spread
-            elif z_score < -2:
+            elif z_score < -z_entry:
                 signal = 1   # Long spread
             
             if signal != 0:
-                pair_name = f"{long_sym}/{short_sym}"
-                signals[pair_name] = {
+                signals[pair] = {
                     'signal': signal,
                     'signal_strength': min(1.0, abs(z_score) / 3),
                     'z_score': z_score,
+                    'hedge_ratio': stats['hedge_ratio'],
                     'momentum': 0,
                     'rsi': 50,
-                    'realized_vol': 0.015,
+                    'realized_vol': stats['spread_std'],
                 }
         
         return signals
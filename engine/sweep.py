@@ -0,0 +1,156 @@
+import json
+import logging
+import itertools
+import numpy as np
+from datetime import datetime
+from uuid import uuid4
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from database import db
+from price_loader import load_price_matrix
+from indicators import rolling_indicators
+from backtest import Backtester
+from config import SWEEP_GRID, SWEEP_FLUSH_EVERY
+
+logger = logging.getLogger(__name__)
+
+INSERT_QUERY = """
+INSERT OR REPLACE INTO sweep_results
+(sweep_id, params, total_return, cagr, sharpe_ratio, max_drawdown, win_rate, num_trades, error_message, timestamp)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+def expand_grid(grid):
+    """Every combination of a {name: [values]} grid as a list of dicts"""
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+
+def params_key(params):
+    """Canonical JSON used to identify a configuration in sweep_results"""
+    return json.dumps(params, sort_keys=True)
+
+# Worker side
+#
+# Each worker attaches to the parent's shared-memory block once, in the
+# pool initializer, and wraps it in an ndarray without copying. Only the
+# small parameter dicts travel with each task.
+
+_worker = {}
+
+def _init_worker(shm_name, shape, symbols, timestamps):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _worker['shm'] = shm  # keep the mapping alive for the worker's lifetime
+    _worker['closes'] = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+    _worker['symbols'] = symbols
+    _worker['timestamps'] = timestamps
+    _worker['indicators'] = {}
+
+def _run_config(params):
+    # Indicators only depend on the Bollinger settings; reuse them across
+    # every configuration this worker sees with the same pair
+    bb = (params.get('bb_period', 20), params.get('bb_num_std', 2))
+    cache = _worker['indicators']
+    if bb not in cache:
+        if len(cache) >= 4:
+            cache.pop(next(iter(cache)))
+        cache[bb] = rolling_indicators(_worker['closes'], *bb)
+
+    backtester = Backtester(
+        _worker['symbols'], _worker['timestamps'], _worker['closes'],
+        params=params, indicators=cache[bb],
+    )
+    return backtester.run()['stats']
+
+# Parent side
+
+def _result_row(sweep_id, params, stats=None, error=None):
+    stats = stats or {}
+    return (
+        sweep_id,
+        params_key(params),
+        stats.get('total_return'),
+        stats.get('cagr'),
+        stats.get('sharpe_ratio'),
+        stats.get('max_drawdown'),
+        stats.get('win_rate'),
+        stats.get('num_trades'),
+        error,
+        datetime.utcnow(),
+    )
+
+def run_sweep(grid=None, symbols=None, start=None, end=None, max_workers=None, sweep_id=None):
+    """Backtest every configuration of grid across a process pool.
+    
+    Prices are loaded once and placed in shared memory, so workers map
+    them instead of receiving a pickled copy per task. Results are written
+    to sweep_results as they complete; rerunning with the same sweep_id
+    skips configurations that already have a row.
+    """
+    configs = expand_grid(grid or SWEEP_GRID)
+    sweep_id = sweep_id or f"SWEEP-{datetime.utcnow().isoformat()}-{uuid4().hex[:8]}"
+    
+    done = {
+        row['params'] for row in
+        db.execute("SELECT params FROM sweep_results WHERE sweep_id = ? AND error_message IS NULL", (sweep_id,))
+    }
+    pending = [p for p in configs if params_key(p) not in done]
+    logger.info(f"Sweep {sweep_id}: {len(configs)} configurations, {len(pending)} to run")
+    if not pending:
+        return {'sweep_id': sweep_id, 'completed': 0, 'failed': 0}
+    
+    names, timestamps, closes = load_price_matrix(symbols, start, end)
+    if closes.size == 0:
+        raise ValueError("No price history to sweep over")
+    
+    shm = shared_memory.SharedMemory(create=True, size=closes.nbytes)
+    completed = 0
+    failed = 0
+    try:
+        np.ndarray(closes.shape, dtype=np.float64, buffer=shm.buf)[:] = closes
+        del closes
+        
+        buffer = []
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_worker,
+            initargs=(shm.name, (len(names), len(timestamps)), [str(s) for s in names], timestamps),
+        ) as pool:
+            futures = {pool.submit(_run_config, params): params for params in pending}
+            for future in as_completed(futures):
+                params = futures[future]
+                try:
+                    buffer.append(_result_row(sweep_id, params, future.result()))
+                    completed += 1
+                except Exception as e:
+                    logger.error(f"Configuration {params_key(params)} failed: {e}")
+                    buffer.append(_result_row(sweep_id, params, error=str(e)))
+                    failed += 1
+                
+                if len(buffer) >= SWEEP_FLUSH_EVERY:
+                    db.execute_many(INSERT_QUERY, buffer)
+                    buffer = []
+                    logger.info(f"Sweep {sweep_id}: {completed + failed}/{len(pending)} done")
+        
+        if buffer:
+            db.execute_many(INSERT_QUERY, buffer)
+    finally:
+        shm.close()
+        shm.unlink()
+    
+    logger.info(f"Sweep {sweep_id} complete: {completed} configurations, {failed} failed")
+    return {'sweep_id': sweep_id, 'completed': completed, 'failed': failed}
+
+def top_results(sweep_id, limit=10, metric='sharpe_ratio'):
+    """Best configurations of a sweep by metric"""
+    if metric not in ('total_return', 'cagr', 'sharpe_ratio', 'max_drawdown', 'win_rate'):
+        raise ValueError(f"Unknown metric: {metric}")
+    query = f"""
+    SELECT * FROM sweep_results
+    WHERE sweep_id = ? AND error_message IS NULL
+    ORDER BY {metric} DESC LIMIT ?
+    """
+    return db.execute(query, (sweep_id, limit))
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run_sweep()
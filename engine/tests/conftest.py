@@ -0,0 +1,18 @@
+import sys
+from pathlib import Path
+import pytest
+
+# Engine modules import each other by flat name, as when run from engine/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+@pytest.fixture
+def scratch_db(tmp_path, monkeypatch):
+    """The shared database, pointed at an empty file under tmp_path"""
+    import metrics
+    from database import db
+    db.close()
+    monkeypatch.setattr(db, 'db_path', str(tmp_path / 'trading_engine.db'))
+    monkeypatch.setattr(metrics, 'METRICS_DIR', tmp_path / 'metrics')
+    db.create_tables()
+    yield db
+    db.close()
@@ -0,0 +1,39 @@
+import pytest
+from api_client import AlphaVantageClient
+from response_cache import ResponseCache
+
+SYMBOLS = ['AAA', 'BBB', 'CCC']
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """A client whose bulk endpoint returns bulk_response and single quotes succeed"""
+    client = AlphaVantageClient('test')
+    client.cache = ResponseCache(tmp_path / 'api_cache')
+    client.bulk_supported = True
+    client.bulk_response = {}
+    client.bulk_calls = 0
+
+    def request(params):
+        assert params['function'] == 'REALTIME_BULK_QUOTES'
+        client.bulk_calls += 1
+        return client.bulk_response
+    monkeypatch.setattr(client, '_retry_request', request)
+    monkeypatch.setattr(client, 'get_quote', lambda symbol, use_cache=True: {'symbol': symbol, 'close': 1.0})
+    return client
+
+def fetch(client):
+    return sorted(symbol for symbol, quote, error in client.get_batch_quotes(SYMBOLS) if quote)
+
+def test_rate_limit_note_falls_back_for_one_run_only(client):
+    client.bulk_response = {'Note': 'Thank you for using Alpha Vantage! Our standard API rate limit is ...'}
+    assert fetch(client) == SYMBOLS
+    assert client.bulk_supported
+    fetch(client)
+    assert client.bulk_calls == 2
+
+def test_premium_information_turns_bulk_quotes_off(client):
+    client.bulk_response = {'Information': 'This is a premium endpoint. You may subscribe to any of the premium plans ...'}
+    assert fetch(client) == SYMBOLS
+    assert not client.bulk_supported
+    fetch(client)
+    assert client.bulk_calls == 1
@@ -0,0 +1,80 @@
+import random
+from collections import deque
+import pytest
+from ledger import LotLedger, match_lots
+
+TRADE_QUERY = (
+    "INSERT INTO trade_log (symbol, side, quantity, price, pnl, strategy_type, timestamp) "
+    "VALUES (?, ?, ?, ?, 0, ?, ?)"
+)
+
+def random_fills(n, seed=0):
+    rng = random.Random(seed)
+    keys = [(symbol, strategy) for symbol in ('AAA', 'BBB', 'CCC') for strategy in ('momentum', 'mean_reversion')]
+    return [
+        (*rng.choice(keys), rng.choice([-1, 1]) * rng.randint(1, 50), round(rng.uniform(50, 150), 2))
+        for _ in range(n)
+    ]
+
+def replay_fifo(fills):
+    """Brute-force FIFO: one queue entry per share.
+
+    Returns (pnl per fill, closed shares per fill, open quantity per key).
+    """
+    books = {}
+    pnls, closed = [], []
+    for symbol, strategy, quantity, price in fills:
+        book = books.setdefault((symbol, strategy), deque())
+        step = 1 if quantity > 0 else -1
+        pnl, shares = 0.0, 0
+        for _ in range(abs(quantity)):
+            if book and book[0][0] != step:
+                direction, entry = book.popleft()
+                pnl += (price - entry) * direction
+                shares += 1
+            else:
+                book.append((step, price))
+        pnls.append(pnl)
+        closed.append(shares)
+    return pnls, closed, {key: sum(direction for direction, _ in book) for key, book in books.items()}
+
+def test_sync_matches_brute_force_fifo(scratch_db):
+    fills = random_fills(3000)
+    pnls, closed, open_quantity = replay_fifo(fills)
+
+    ledger = LotLedger('fifo')
+    # Several syncs, so lots carry over between batches
+    for start in range(0, len(fills), 700):
+        scratch_db.execute_many(TRADE_QUERY, [
+            (symbol, 'BUY' if quantity > 0 else 'SELL', abs(quantity), price, strategy, f"2026-01-01 00:00:{i:06d}")
+            for i, (symbol, strategy, quantity, price) in enumerate(fills[start:start + 700], start)
+        ])
+        ledger.sync()
+
+    logged = [row['pnl'] for row in scratch_db.execute("SELECT pnl FROM trade_log ORDER BY id")]
+    assert logged == pytest.approx(pnls)
+
+    totals = {
+        (row['symbol'], row['strategy_type']): row
+        for row in scratch_db.execute("SELECT * FROM realized_pnl")
+    }
+    for key in open_quantity:
+        indices = [i for i, fill in enumerate(fills) if fill[:2] == key]
+        assert totals[key]['realized_pnl'] == pytest.approx(sum(pnls[i] for i in indices))
+        assert totals[key]['closed_quantity'] == sum(closed[i] for i in indices)
+        assert totals[key]['closing_trades'] == sum(1 for i in indices if closed[i])
+        assert totals[key]['winning_trades'] == sum(1 for i in indices if closed[i] and pnls[i] > 0)
+
+    lots = scratch_db.execute(
+        "SELECT symbol, strategy_type, SUM(quantity) AS quantity FROM position_lots GROUP BY symbol, strategy_type"
+    )
+    held = {(row['symbol'], row['strategy_type']): row['quantity'] for row in lots}
+    assert held == {key: quantity for key, quantity in open_quantity.items() if quantity}
+
+def test_average_cost_keeps_one_lot():
+    lots, realized, closed = match_lots([], 10, 100.0, 1, 't1', 'average')
+    lots, realized, closed = match_lots(lots, 10, 110.0, 2, 't2', 'average')
+    assert lots == [[1, 20, 105.0, 't1']] and closed == 0
+    lots, realized, closed = match_lots(lots, -25, 120.0, 3, 't3', 'average')
+    assert realized == pytest.approx(20 * 15.0) and closed == 20
+    assert lots == [[3, -5, 120.0, 't3']]
@@ -0,0 +1,138 @@
+import numpy as np
+import pytest
+from netting import net_signals, SignalNetter
+from executor import plan_trades, apply_fill
+from risk import RiskEngine
+
+PRICES = {'AAA': 100.0, 'BBB': 50.0, 'CCC': 20.0}
+CAPITAL = 10000
+
+def sig(signal, strength, **fields):
+    return {'signal': signal, 'signal_strength': strength, **fields}
+
+def exposure(netted, key):
+    signal = netted[key]
+    return signal['signal'] * signal['signal_strength'] * signal['size_scale']
+
+def execute(latest, positions, prices=PRICES):
+    """One run: net, plan and fill; returns the orders"""
+    trades = plan_trades(net_signals(latest)[0], positions, prices, CAPITAL, 0)
+    for trade in trades:
+        apply_fill(positions, trade)
+    return [(t['action'], t['side'], t['quantity'], t['symbol'], t['strategy_type']) for t in trades]
+
+def quantities(positions):
+    return {key: position['quantity'] for key, position in positions.items()}
+
+def test_opposing_strategies_net_to_one_target():
+    netted, targets = net_signals({
+        ('AAA', 'momentum'): sig(1, 0.8),
+        ('AAA', 'mean_reversion'): sig(-1, 0.5),
+        ('CCC', 'momentum'): sig(1, 0.4),
+        ('CCC', 'mean_reversion'): sig(1, 0.2),
+    })
+    assert targets == pytest.approx({'AAA': 0.3, 'CCC': 0.6})
+    assert exposure(netted, ('AAA', 'momentum')) == pytest.approx(0.3)
+    assert netted[('AAA', 'mean_reversion')]['signal'] == 0
+    # Agreeing strategies keep their own share
+    assert exposure(netted, ('CCC', 'momentum')) == pytest.approx(0.4)
+    assert exposure(netted, ('CCC', 'mean_reversion')) == pytest.approx(0.2)
+
+    kept, _ = net_signals({('AAA', 'momentum'): sig(1, 0.8), ('AAA', 'mean_reversion'): sig(-1, 0.5)},
+                          across_strategies=False)
+    assert exposure(kept, ('AAA', 'mean_reversion')) == pytest.approx(-0.5)
+
+def test_pair_legs_are_not_netted_away():
+    latest = {('AAA/BBB', 'statistical_arbitrage'): sig(1, 1.0, hedge_ratio=1.0)}
+    positions = {}
+    execute(latest, positions)
+    assert quantities(positions) == {('AAA', 'statistical_arbitrage'): 100, ('BBB', 'statistical_arbitrage'): -200}
+
+    # Momentum turning long BBB must not close the pair's BBB leg
+    latest[('BBB', 'momentum')] = sig(1, 1.0)
+    netted, targets = net_signals(latest)
+    assert targets['BBB'] == pytest.approx(0.0)
+    assert execute(latest, positions) == [('open', 'BUY', 200, 'BBB', 'momentum')]
+    assert quantities(positions)[('AAA', 'statistical_arbitrage')] == 100
+    assert quantities(positions)[('BBB', 'statistical_arbitrage')] == -200
+
+def test_pair_legs_of_one_strategy_are_summed():
+    netted, _ = net_signals({
+        ('AAA/BBB', 'statistical_arbitrage'): sig(1, 0.5, hedge_ratio=2.0),
+        ('CCC/BBB', 'statistical_arbitrage'): sig(-1, 0.5, hedge_ratio=1.0),
+    })
+    assert exposure(netted, ('BBB', 'statistical_arbitrage')) == pytest.approx(-1.0 + 0.5)
+    assert exposure(netted, ('CCC', 'statistical_arbitrage')) == pytest.approx(-0.5)
+
+def test_positions_follow_their_targets():
+    latest = {('AAA', 'momentum'): sig(1, 1.0)}
+    positions = {}
+    assert execute(latest, positions) == [('open', 'BUY', 100, 'AAA', 'momentum')]
+
+    latest[('AAA', 'momentum')] = sig(1, 0.5)
+    assert execute(latest, positions) == [('reduce', 'SELL', 50, 'AAA', 'momentum')]
+    assert positions[('AAA', 'momentum')]['entry_price'] == 100.0
+
+    latest[('AAA', 'momentum')] = sig(1, 1.0)
+    assert execute(latest, positions, {**PRICES, 'AAA': 80.0}) == [('increase', 'BUY', 75, 'AAA', 'momentum')]
+    assert positions[('AAA', 'momentum')]['entry_price'] == pytest.approx((50 * 100.0 + 75 * 80.0) / 125)
+
+    # Inside the tolerance nothing trades
+    assert execute(latest, positions, {**PRICES, 'AAA': 90.0}) == []
+
+    latest[('AAA', 'momentum')] = sig(-1, 0.5)
+    assert execute(latest, positions) == [
+        ('close', 'SELL', 125, 'AAA', 'momentum'), ('open', 'SELL', 50, 'AAA', 'momentum'),
+    ]
+    latest[('AAA', 'momentum')] = sig(0, 0.0)
+    assert execute(latest, positions) == [('close', 'BUY', 50, 'AAA', 'momentum')]
+    assert positions == {}
+
+def test_reduce_returns_the_closed_part():
+    positions = {}
+    apply_fill(positions, {'symbol': 'AAA', 'strategy_type': 'momentum', 'side': 'SELL', 'quantity': 40,
+                           'price': 100.0, 'timestamp': 0, 'action': 'open'})
+    closed = apply_fill(positions, {'symbol': 'AAA', 'strategy_type': 'momentum', 'side': 'BUY', 'quantity': 10,
+                                    'price': 90.0, 'timestamp': 1, 'action': 'reduce'})
+    assert closed['quantity'] == -10 and closed['entry_price'] == 100.0
+    assert positions[('AAA', 'momentum')]['quantity'] == -30
+
+def test_risk_passes_reductions_and_counts_only_new_positions():
+    engine = RiskEngine(max_positions=1, max_var=0)
+    order = {'strategy_type': 'momentum', 'side': 'BUY', 'quantity': 10, 'price': 100.0}
+    trades = [
+        {**order, 'symbol': 'AAA', 'action': 'increase'},
+        {**order, 'symbol': 'BBB', 'side': 'SELL', 'action': 'reduce'},
+        {**order, 'symbol': 'CCC', 'action': 'open'},
+    ]
+    held = (['AAA', 'BBB'], ['momentum', 'momentum'], [1000.0, 2000.0])
+    accepted, rejected = engine.check(trades, held, 1e6)
+    assert sorted(t['symbol'] for t in accepted) == ['AAA', 'BBB']
+    assert [(t['symbol'], t['risk_reason']) for t in rejected] == [('CCC', 'max_positions')]
+
+def test_signal_netter_matches_full_netting():
+    rng = np.random.default_rng(0)
+    symbols = [f'S{i}' for i in range(12)]
+    netter = SignalNetter()
+    latest = {}
+    for _ in range(200):
+        changes = {}
+        for _ in range(rng.integers(1, 6)):
+            if rng.random() < 0.2:
+                y, x = rng.choice(symbols, 2, replace=False)
+                changes[(f'{y}/{x}', 'statistical_arbitrage')] = sig(
+                    int(rng.integers(-1, 2)), float(rng.random()), hedge_ratio=float(rng.uniform(0.5, 2))
+                )
+            else:
+                strategy = str(rng.choice(['momentum', 'mean_reversion']))
+                # Repeats with the same sizing leave the netting untouched
+                signal = int(rng.integers(-1, 2))
+                changes[(str(rng.choice(symbols)), strategy)] = sig(signal, 0.5 if signal else 0.0)
+        latest.update(changes)
+        netted, targets = netter.update(changes)
+        expected, expected_targets = net_signals(latest)
+        assert targets == pytest.approx(expected_targets)
+        assert netted.keys() == expected.keys()
+        for key, signal in expected.items():
+            assert netted[key]['signal'] == signal['signal']
+            assert netted[key]['size_scale'] == pytest.approx(signal['size_scale'])
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+from optimizer import ReturnCovariance, risk_parity, mean_variance
+
+def sized_problem(n, seed):
+    """A sign-adjusted shrunk covariance and budgets |naive| * sigma, as size() builds them"""
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(size=(250, 5)) @ rng.normal(size=(5, n)) * 0.005 + rng.normal(size=(250, n)) * 0.01
+    estimate = ReturnCovariance(n, 250)
+    estimate.push(returns)
+    covariance, _ = estimate.estimate()
+    signs = np.where(rng.random(n) < 0.5, -1.0, 1.0)
+    covariance = covariance * np.outer(signs, signs)
+    # Signal strengths near 0 make the budgets widely dispersed
+    budgets = rng.uniform(0, 1, n) * 0.01 * np.sqrt(np.diag(covariance))
+    return covariance, budgets
+
+@pytest.mark.parametrize('n, seed', [(15, 0), (100, 4), (1000, 0), (1000, 1)])
+def test_risk_parity_weights_are_positive_and_match_budgets(n, seed):
+    covariance, budgets = sized_problem(n, seed)
+    weights = risk_parity(covariance, budgets)
+    assert (weights > 0).all()
+    contributions = weights * (covariance @ weights)
+    assert contributions / contributions.sum() == pytest.approx(budgets / budgets.sum(), rel=1e-6)
+
+def test_mean_variance_without_correlation_keeps_naive():
+    variances = np.array([0.01, 0.04, 0.09])
+    naive = np.array([0.5, -0.2, 0.1])
+    targets = mean_variance(np.diag(variances), naive, np.zeros(3), turnover_penalty=0.0)
+    assert targets == pytest.approx(naive)
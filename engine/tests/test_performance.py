@@ -0,0 +1,51 @@
+import json
+import numpy as np
+import pytest
+from datetime import datetime, timedelta
+from performance import EquityStats, record_equity
+from config import EQUITY_VOL_WINDOW, EQUITY_MIN_CAGR_DAYS
+
+def batch_stats(times, equity, vol_window=EQUITY_VOL_WINDOW):
+    """The statistics EquityStats keeps, recomputed from the whole curve"""
+    returns = equity[1:] / equity[:-1] - 1
+    years = (times[-1] - times[0]) / (365.25 * 86400)
+    scale = np.sqrt(len(returns) / years)
+    drawdown = equity / np.maximum.accumulate(equity) - 1
+    downside = np.sqrt(np.mean(np.minimum(returns, 0) ** 2))
+    growth = equity[-1] / equity[0]
+    cagr = growth ** (1 / years) - 1 if years * 365.25 >= EQUITY_MIN_CAGR_DAYS else growth - 1
+    return {
+        'equity': equity[-1],
+        'period_return': returns[-1],
+        'drawdown': drawdown[-1] * 100,
+        'volatility': returns[-vol_window:].std() * scale * 100,
+        'sharpe_ratio': returns.mean() / returns.std() * scale,
+        'sortino_ratio': returns.mean() / downside * scale,
+        'max_drawdown': drawdown.min() * 100,
+        'cagr': cagr * 100,
+    }
+
+def random_curve(n, seed=0):
+    rng = np.random.default_rng(seed)
+    # Irregular cadence: the pipeline does not run at fixed intervals
+    times = 1.7e9 + np.cumsum(rng.uniform(600, 7200, n))
+    equity = 100000 * np.cumprod(1 + rng.normal(0.0002, 0.004, n))
+    return times, equity
+
+def test_running_stats_match_batch():
+    times, equity = random_curve(2000)
+    stats = EquityStats()
+    for i, (time, value) in enumerate(zip(times.tolist(), equity.tolist())):
+        if i == 1000:
+            # Saved and restored halfway, as record_equity does every run
+            stats = EquityStats.from_dict(json.loads(json.dumps(stats.to_dict())))
+        stats.update(time, value)
+    assert stats.stats() == pytest.approx(batch_stats(times, equity), rel=1e-9)
+
+def test_record_equity_persists_state(scratch_db):
+    times, equity = random_curve(200, seed=1)
+    start = datetime(2026, 1, 1)
+    for time, value in zip(times.tolist(), equity.tolist()):
+        current = record_equity(start + timedelta(seconds=time - times[0]), value, 0.0, 0.0)
+    assert current == pytest.approx(batch_stats(times, equity), rel=1e-6)
+    assert len(scratch_db.execute("SELECT timestamp FROM equity_curve")) == len(times)
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from ranking import fraction_signals, sector_signals, top_bottom
+from strategies import MomentumStrategy
+
+def sorted_signals(scores, top_fraction, bottom_fraction):
+    """The full-sort ranking MomentumStrategy used before ranking.py"""
+    order = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+    threshold_long = max(1, int(len(order) * top_fraction + 1e-9))
+    threshold_short = max(1, int(len(order) * (1 - bottom_fraction) + 1e-9))
+    signals = {}
+    for idx, i in enumerate(order):
+        if idx < threshold_long:
+            signals[i] = (1, 1.0 - (idx / threshold_long) * 0.3)
+        elif idx >= threshold_short:
+            signals[i] = (-1, ((idx - threshold_short) / (len(order) - threshold_short)) * 0.3 + 0.7)
+    return signals
+
+@pytest.mark.parametrize('n', [1, 2, 3, 5, 15, 16, 100, 1001])
+@pytest.mark.parametrize('fractions', [(0.2, 0.2), (0.1, 0.3), (0.5, 0.5), (0.6, 0.6), (0.0, 0.0)])
+def test_fraction_signals_match_full_sort(n, fractions):
+    scores = np.random.default_rng(n).permutation(n).astype(np.float64)
+    indices, signals, strengths = fraction_signals(scores, *fractions)
+    expected = sorted_signals(scores.tolist(), *fractions)
+    assert sorted(indices.tolist()) == sorted(expected)
+    for i, signal, strength in zip(indices.tolist(), signals.tolist(), strengths.tolist()):
+        assert signal == expected[i][0]
+        assert strength == pytest.approx(expected[i][1])
+
+def test_unranked_scores_are_skipped():
+    scores = np.array([3.0, np.nan, 1.0, 2.0, np.nan])
+    longs, shorts = top_bottom(scores, 1, 1)
+    assert longs.tolist() == [0] and shorts.tolist() == [2]
+    indices, _, _ = fraction_signals(np.full(4, np.nan), 0.2, 0.2)
+    assert len(indices) == 0
+
+def test_sector_mode_ranks_within_sectors():
+    symbols = ['A1', 'A2', 'A3', 'B1', 'B2', 'LONE', 'X1', 'X2']
+    sectors = {'A1': 'A', 'A2': 'A', 'A3': 'A', 'B1': 'B', 'B2': 'B', 'LONE': 'C'}
+    scores = [1.0, 3.0, 2.0, -5.0, -4.0, 9.0, 7.0, 8.0]
+    signals = MomentumStrategy.rank(
+        symbols, scores, mode='sector', sectors=[sectors.get(s, s) for s in symbols]
+    )
+    # Each sector of two or more is ranked on its own; single names never are
+    assert {s: sig['signal'] for s, sig in signals.items()} == {'A2': 1, 'A1': -1, 'B2': 1, 'B1': -1}
+    indices, _, _ = sector_signals(np.array(scores), ['A', 'A', 'A', 'B', 'B', 'C', 'D', 'E'], 0.2, 0.2)
+    assert sorted(indices.tolist()) == [0, 1, 3, 4]
+
+def test_sector_mode_skips_unmapped_symbols():
+    # AAPL and MSFT share a sector in config.SECTORS; X1 and X2 have none
+    signals = MomentumStrategy.rank(['AAPL', 'MSFT', 'X1', 'X2'], [1.0, 2.0, 3.0, 4.0], mode='sector')
+    assert sorted(signals) == ['AAPL', 'MSFT']